@@ -1,16 +1,42 @@
-import tkinter as tk
-from tkinter import ttk, messagebox, filedialog
-import customtkinter as ctk
 import json
+import hashlib
+import sqlite3
+import argparse
 import calendar
+import bisect
+import re
+import shlex
 import os
 import sys
+import shutil
+import time
 from datetime import datetime, date, timedelta
 import uuid
+from functools import lru_cache
 
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-import pandas as pd   # ← CORREGIDO: import faltante para export_report
+import math
+import mmap
+import array
+import io
+import base64
+import queue
+import threading
+import importlib
+from collections import OrderedDict
+
+# --profile-startup mide desde aquí: lo que pesa es Tk y customtkinter
+_T_INICIO = time.perf_counter()
+
+import tkinter as tk  # noqa: E402
+from tkinter import ttk, messagebox, filedialog  # noqa: E402
+import tkinter.font as tkfont  # noqa: E402
+import customtkinter as ctk  # noqa: E402
+
+# matplotlib y pandas se importan al primer uso (ChartView, export_report)
+# o en segundo plano tras el primer pintado: ver precargar_dependencias
+MODULOS_PESADOS = ("matplotlib.figure", "matplotlib.backends.backend_agg", "pandas")
+
+_T_IMPORTS = time.perf_counter() - _T_INICIO
 
 # ================== CONFIGURACIÓN BÁSICA ==================
 
@@ -78,6 +104,18 @@ def safe_float(x, default=0.0):
         return default
 
 
+def safe_int(x, default=0, minimo=None, maximo=None):
+    # Valor entero de la config: lo que no se entiende (o queda fuera de
+    # [minimo, maximo]) vuelve al valor por defecto sin tocar el resto
+    try:
+        v = int(x)
+    except Exception:
+        return default
+    if (minimo is not None and v < minimo) or (maximo is not None and v > maximo):
+        return default
+    return v
+
+
 def parse_date_ymd(s: str):
     try:
         return datetime.strptime(s, "%Y-%m-%d").date()
@@ -99,35 +137,3851 @@ def clamp_day(year: int, month: int, day: int) -> int:
     return min(day, calendar.monthrange(year, month)[1])
 
 
+def app_base_path() -> str:
+    if getattr(sys, "frozen", False):
+        return os.path.dirname(sys.executable)
+    return os.path.dirname(os.path.abspath(__file__))
+
+
+# ================== MODELO ==================
+
+@lru_cache(maxsize=65536)
+def _ordinal_fecha(fecha):
+    # "YYYY-MM-DD" -> date.toordinal(); -1 si no es una fecha válida.
+    # Lo que acepta parse_date_ymd ("2025-3-5") también vale
+    try:
+        return date(int(fecha[0:4]), int(fecha[5:7]), int(fecha[8:10])).toordinal()
+    except (ValueError, TypeError):
+        d = parse_date_ymd(fecha)
+        return d.toordinal() if d else -1
+
+
+def normalizar_fecha(fecha):
+    """"2025-3-5" -> "2025-03-05"; lo que no es una fecha se deja tal cual."""
+    if isinstance(fecha, str) and len(fecha) == 10 and fecha[4] == "-" and fecha[7] == "-":
+        return fecha
+    d = parse_date_ymd(str(fecha or ""))
+    return d.isoformat() if d else fecha
+
+
+@lru_cache(maxsize=65536)
+def _codigo_mes(ym):
+    # "YYYY-MM" -> año * 12 + mes - 1; -1 si no es válido
+    try:
+        y, m = int(ym[0:4]), int(ym[5:7])
+    except (ValueError, TypeError):
+        return -1
+    return y * 12 + m - 1 if 1 <= m <= 12 else -1
+
+
+_FALTA = object()  # marcador de campo ausente
+_ORDENES = {}      # tuplas de claves compartidas entre registros con el mismo esquema
+
+
+def _orden_compartido(claves):
+    return _ORDENES.setdefault(claves, claves)
+
+
+class Transaction:
+    """Registro del ledger (pago o compra) con los campos calientes ya normalizados.
+
+    Se usa como el dict del JSON (get, [], in, update, setdefault, dict(x)...)
+    y conserva los valores tal cual (salvo la fecha, que se guarda como
+    YYYY-MM-DD si es válida), las claves desconocidas y su orden: to_dict()
+    devuelve lo que se leyó, con "nombre" o "item".
+    `importe` (float) y `ordinal` (date.toordinal, -1 si la fecha no es
+    válida) se calculan una sola vez, al crear o al cambiar monto/fecha.
+    """
+
+    CAMPOS = ("uid", "nombre", "item", "monto", "fecha", "categoria", "metodo", "status")
+    __slots__ = CAMPOS + ("importe", "ordinal", "_extra", "_orden")
+
+    # Los campos ausentes simplemente no tienen el slot asignado
+
+    def __init__(self, data=None):
+        extra = None
+        if data:
+            for k, v in data.items():
+                if k in _CAMPOS_TX:
+                    setattr(self, k, normalizar_fecha(v) if k == "fecha" else v)
+                else:
+                    if extra is None:
+                        extra = {}
+                    extra[k] = v
+        self._extra = extra
+        if data:
+            self._orden = _orden_compartido(tuple(data.keys()))
+            monto, fecha = data.get("monto", _FALTA), data.get("fecha", _FALTA)
+        else:
+            self._orden = ()
+            monto = fecha = _FALTA
+        self.importe = 0.0 if monto is _FALTA else safe_float(monto)
+        self.ordinal = -1 if fecha is _FALTA else _ordinal_fecha(str(fecha or ""))
+
+    @classmethod
+    def from_dict(cls, data):
+        return data if isinstance(data, cls) else cls(data)
+
+    def _normalizar(self, k):
+        if k == "monto":
+            v = getattr(self, "monto", _FALTA)
+            self.importe = 0.0 if v is _FALTA else safe_float(v)
+        elif k == "fecha":
+            v = getattr(self, "fecha", _FALTA)
+            self.ordinal = -1 if v is _FALTA else _ordinal_fecha(str(v or ""))
+
+    # ---- interfaz de dict ----
+
+    def __getitem__(self, k):
+        if k in _CAMPOS_TX:
+            v = getattr(self, k, _FALTA)
+            if v is not _FALTA:
+                return v
+        elif self._extra is not None and k in self._extra:
+            return self._extra[k]
+        raise KeyError(k)
+
+    def get(self, k, default=None):
+        if k in _CAMPOS_TX:
+            v = getattr(self, k, _FALTA)
+            return default if v is _FALTA else v
+        if self._extra is not None:
+            return self._extra.get(k, default)
+        return default
+
+    def __setitem__(self, k, v):
+        if k in _CAMPOS_TX:
+            setattr(self, k, normalizar_fecha(v) if k == "fecha" else v)
+            self._normalizar(k)
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[k] = v
+        if k not in self._orden:
+            self._orden = _orden_compartido(self._orden + (k,))
+
+    def __delitem__(self, k):
+        if k not in self._orden:
+            raise KeyError(k)
+        if k in _CAMPOS_TX:
+            delattr(self, k)
+            self._normalizar(k)
+        else:
+            del self._extra[k]
+        self._orden = _orden_compartido(tuple(c for c in self._orden if c != k))
+
+    def __contains__(self, k):
+        return k in self._orden
+
+    def __iter__(self):
+        return iter(self._orden)
+
+    def __len__(self):
+        return len(self._orden)
+
+    def keys(self):
+        return self._orden
+
+    def values(self):
+        return [self[k] for k in self._orden]
+
+    def items(self):
+        return [(k, self[k]) for k in self._orden]
+
+    def update(self, other=(), **kw):
+        pares = other.items() if hasattr(other, "items") else other
+        for k, v in pares:
+            self[k] = v
+        for k, v in kw.items():
+            self[k] = v
+
+    def setdefault(self, k, default=None):
+        if k in self._orden:
+            return self[k]
+        self[k] = default
+        return default
+
+    def pop(self, k, *default):
+        if k not in self._orden:
+            if default:
+                return default[0]
+            raise KeyError(k)
+        v = self[k]
+        del self[k]
+        return v
+
+    def to_dict(self):
+        return {k: self[k] for k in self._orden}
+
+    def __repr__(self):
+        return f"Transaction({self.to_dict()!r})"
+
+
+_CAMPOS_TX = frozenset(Transaction.CAMPOS)
+
+
+def json_default(o):
+    # json.dump(default=...) para que los Transaction se serialicen como su dict
+    if isinstance(o, Transaction):
+        return o.to_dict()
+    raise TypeError(f"{type(o).__name__} no es serializable")
+
+
+def monto_de(x):
+    # Transaction trae el monto ya parseado; los dicts sueltos se parsean aquí
+    importe = getattr(x, "importe", None)
+    return importe if importe is not None else safe_float(x.get("monto", 0.0))
+
+
+def ordinal_de(x):
+    o = getattr(x, "ordinal", None)
+    return o if o is not None else _ordinal_fecha(str(x.get("fecha", "") or ""))
+
+
+# ================== ALMACENAMIENTO ==================
+
+# Carga progresiva: con más registros que esto, al abrir solo se indexan los
+# meses visibles y el resto en porciones de LOAD_SLICE_MS tras el primer pintado
+LOAD_PROGRESIVO_MIN = 5000
+LOAD_SLICE_MS = 25
+
+# Umbrales de compactación del diario (modo "journal")
+JOURNAL_MAX_BYTES = 512 * 1024
+JOURNAL_MAX_AGE = timedelta(days=7)
+
+
+def escribir_json_atomico(ruta: str, data, indent=2):
+    tmp = ruta + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=indent, default=json_default)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, ruta)
+
+
+# Parser JSON rápido opcional: orjson, si no ujson; sin ninguno se usa json
+try:
+    import orjson as _json_rapido
+except ImportError:
+    try:
+        import ujson as _json_rapido
+    except ImportError:
+        _json_rapido = None
+
+LOAD_CHUNK = 1 << 20     # caracteres por bloque en la lectura en streaming
+REGISTRO_MAX = 64 * 1024  # un registro más largo que esto se considera dañado
+
+# Resincronización tras un registro dañado: siguiente ", {" o "]"
+_RE_RESYNC = re.compile(r",\s*(?=\{)|\]")
+_RE_BLANCO = re.compile(r"[ \t\r\n]*")
+_RE_SIGUE = re.compile(r"\s*[,\]]")
+_RE_TRAS_LISTA = re.compile(r'\s*,\s*"[^"\\]*"\s*:')
+
+
+class _LectorStream:
+    """Recorre finanzas_v4.json por bloques de LOAD_CHUNK y entrega los
+    registros de "pagos"/"compras" de uno en uno con el escáner C de json.
+
+    Un registro que no se puede decodificar se aparta (texto + motivo) y la
+    lectura sigue en el siguiente registro de la misma lista.
+    """
+
+    def __init__(self, f):
+        self.f = f
+        self.buf = ""
+        self.pos = 0
+        self.ancla = 0  # inicio del registro en curso: no se descarta del buffer
+        self.base = 0   # offset en el archivo de buf[0]
+        self.eof = False
+        self.dec = json.JSONDecoder()
+
+    def _leer_mas(self):
+        if self.eof:
+            return False
+        chunk = self.f.read(LOAD_CHUNK)
+        if not chunk:
+            self.eof = True
+            return False
+        corte = min(self.pos, self.ancla)
+        self.buf = self.buf[corte:] + chunk
+        self.base += corte
+        self.pos -= corte
+        self.ancla -= corte
+        return True
+
+    def _char(self):
+        # Siguiente carácter no blanco, sin consumirlo; "" al final del archivo
+        while True:
+            self.pos = _RE_BLANCO.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._leer_mas():
+                return ""
+
+    def _esperar(self, c):
+        if self._char() != c:
+            raise ValueError(f"se esperaba {c!r} en la posición {self.base + self.pos}")
+        self.pos += 1
+
+    def _valor(self):
+        self._char()
+        self.ancla = self.pos
+        while True:
+            try:
+                obj, self.pos = self.dec.raw_decode(self.buf, self.ancla)
+                return obj
+            except ValueError:
+                # Puede que el registro siga en el bloque siguiente; pasado
+                # REGISTRO_MAX sin cerrarse se da por dañado
+                if len(self.buf) - self.ancla > REGISTRO_MAX or not self._leer_mas():
+                    raise
+
+    def registros(self, cuarentena):
+        """Genera (lista, registro); los registros dañados van a `cuarentena`."""
+        self._esperar("{")
+        if self._char() == "}":
+            return
+        while True:
+            clave = self._valor()
+            self._esperar(":")
+            if clave in ("pagos", "compras") and self._char() == "[":
+                self.pos += 1
+                yield from self._lista(clave, cuarentena)
+            else:
+                self._valor()
+            c = self._char()
+            self.pos += 1
+            if c == "}":
+                return
+            if c == "":
+                self._fin_inesperado(cuarentena)
+                return
+            if c != ",":
+                raise ValueError(f"JSON mal formado en la posición {self.base + self.pos - 1}")
+
+    def _lista(self, lista, cuarentena):
+        if self._char() == "]":
+            self.pos += 1
+            return
+        while True:
+            try:
+                obj = self._valor()
+            except ValueError as e:
+                if self._apartar(lista, str(e), cuarentena):
+                    return
+                continue
+            yield lista, obj
+            c = self._char()
+            if c == ",":
+                self.pos += 1
+            elif c == "]" or c == "":
+                self.pos += 1
+                return
+            else:
+                self.ancla = self.pos
+                if self._apartar(lista, "separador inesperado", cuarentena):
+                    return
+
+    def _apartar(self, lista, motivo, cuarentena):
+        """Aparta desde el ancla hasta el siguiente registro válido de la lista
+        o hasta su cierre. Devuelve True si la lista terminó."""
+        desde = self.ancla + 1
+        while True:
+            m = _RE_RESYNC.search(self.buf, desde)
+            if m is not None:
+                if self._es_resync(m, lista):
+                    cerrada = m.group() == "]"
+                    fin, self.pos = m.start(), m.end()
+                    break
+                # Cerca del final del buffer puede faltar texto para decidir
+                if self.eof or len(self.buf) - m.end() >= REGISTRO_MAX:
+                    desde = m.end()
+                    continue
+            base = self.base
+            if not self._leer_mas():
+                if m is not None:
+                    desde = m.end()
+                    continue
+                fin = self.pos = len(self.buf)
+                cerrada = True
+                break
+            desde -= self.base - base
+        cuarentena.append({
+            "lista": lista, "pos": self.base + self.ancla,
+            "motivo": motivo, "texto": self.buf[self.ancla:fin],
+        })
+        return cerrada
+
+    def _es_resync(self, m, lista):
+        # "]" cierra la lista si sigue otra clave del objeto raíz o su cierre;
+        # ", {" abre un registro si este se lee entero y es válido para la lista
+        if m.group() == "]":
+            if _RE_TRAS_LISTA.match(self.buf, m.end()):
+                return True
+            return self.eof and self.buf[m.end():].strip() == "}"
+        try:
+            obj, fin = self.dec.raw_decode(self.buf, m.end())
+        except ValueError:
+            return False
+        return _parece_registro(lista, obj) and _RE_SIGUE.match(self.buf, fin) is not None
+
+    def _fin_inesperado(self, cuarentena):
+        cuarentena.append({"lista": None, "pos": self.base + self.pos, "motivo": "archivo truncado", "texto": ""})
+
+
+def _iter_registros(ruta, cuarentena):
+    if _json_rapido is not None:
+        # Camino rápido: el archivo entero con el parser nativo; si está
+        # dañado se relee en streaming para salvar lo que se pueda
+        with open(ruta, "rb") as f:
+            crudo = f.read()
+        try:
+            d = _json_rapido.loads(crudo)
+        except ValueError:
+            d = None
+        del crudo
+        if isinstance(d, dict):
+            for lista in ("pagos", "compras"):
+                for x in d.get(lista) or ():
+                    yield lista, x
+            return
+
+    with open(ruta, "r", encoding="utf-8") as f:
+        yield from _LectorStream(f).registros(cuarentena)
+
+
+def motivo_invalido(lista, x):
+    """Por qué un registro de `lista` no se puede cargar, o None si se puede.
+
+    Solo se aparta lo inservible (lo que no es un objeto); un registro
+    incompleto se carga y normalizar_registro le completa los campos.
+    """
+    if not isinstance(x, dict):
+        return "no es un objeto"
+    return None
+
+
+def normalizar_registro(lista, x):
+    """Completa los campos que faltan con los valores por defecto de la app.
+    El nombre vacío importa: "nombre" in x es lo que distingue un pago."""
+    x.setdefault("nombre" if lista == "pagos" else "item", "")
+    x.setdefault("monto", 0.0)
+    x["fecha"] = normalizar_fecha(x.get("fecha", ""))
+    x.setdefault("categoria", "OTHER")
+    x.setdefault("status", "PENDING")
+    return x
+
+
+def _parece_registro(lista, x):
+    # Para resincronizar tras un tramo dañado hace falta más que un objeto:
+    # un objeto anidado en un campo no debe tomarse por el registro siguiente
+    if not isinstance(x, dict):
+        return False
+    if lista == "pagos" and "nombre" not in x:
+        return False
+    if lista == "compras" and ("item" not in x or "nombre" in x):
+        return False
+    return safe_float(x.get("monto") or 0, None) is not None
+
+
+def leer_ledger(ruta):
+    """Lee finanzas_v4.json registro a registro.
+
+    Devuelve (pagos, compras, cuarentena): los registros ilegibles o que no
+    son objetos no tumban la carga, se devuelven aparte con su motivo.
+    """
+    listas = {"pagos": [], "compras": []}
+    cuarentena = []
+    try:
+        for lista, x in _iter_registros(ruta, cuarentena):
+            motivo = motivo_invalido(lista, x)
+            if motivo is None:
+                listas[lista].append(normalizar_registro(lista, x))
+            else:
+                cuarentena.append({"lista": lista, "motivo": motivo, "registro": x})
+    except (ValueError, UnicodeDecodeError) as e:
+        # Estructura rota fuera de las listas: vale lo leído hasta ahí
+        if not (listas["pagos"] or listas["compras"]):
+            raise
+        cuarentena.append({"lista": None, "motivo": f"estructura dañada: {e}", "texto": ""})
+    return listas["pagos"], listas["compras"], cuarentena
+
+
+def guardar_cuarentena(ruta, origen, entradas):
+    """Añade `entradas` al informe de cuarentena (JSON) y devuelve su ruta."""
+    informe = os.path.splitext(ruta)[0] + ".cuarentena.json"
+    try:
+        with open(informe, "r", encoding="utf-8") as f:
+            historial = json.load(f)
+    except (OSError, ValueError):
+        historial = []
+    historial.append({
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "origen": origen,
+        "registros": entradas,
+    })
+    escribir_json_atomico(informe, historial)
+    return informe
+
+
+class JsonLedgerStore:
+    """Formato clásico: todo el ledger en finanzas_v4.json, reescrito en cada guardado."""
+
+    parcial = False      # load() trae el ledger entero
+    lee_bloques = False  # los bloques de backup salen de la copia del hilo (LedgerEspejo)
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self.cuarentena = []  # registros apartados en la última carga
+
+    def load(self):
+        pagos, compras, self.cuarentena = leer_ledger(self.ruta)
+        return pagos, compras
+
+    def save(self, pagos, compras, cambios):
+        # cambios=[]: trabajo solo de backup, el fichero no se toca
+        if cambios is None or cambios:
+            escribir_json_atomico(self.ruta, {"pagos": pagos, "compras": compras})
+
+    def needs_compaction(self):
+        return False
+
+    # ---- guardado en dos fases (WriteBehind) ----
+    #
+    # stage() corre en el hilo de Tk justo al encolar; devuelve True si ya
+    # aplicó los cambios y al hilo solo le queda confirmarlos. reservar()
+    # (hilo de Tk) numera un trabajo que lleva cambios sin aplicar y
+    # confirmar() (hilo de guardado) avisa de que ya está escrito.
+    # needs_snapshot() dice si save() necesitará el ledger completo.
+
+    def stage(self, cambios):
+        return False
+
+    def reservar(self):
+        return 0
+
+    def confirmar(self, numero):
+        pass
+
+    def needs_snapshot(self, cambios):
+        return cambios is None or bool(cambios)
+
+
+class JournalLedgerStore(JsonLedgerStore):
+    """Snapshot (finanzas_v4.json) + diario append-only con un cambio por línea.
+
+    Cada guardado solo añade las líneas nuevas al diario; al superar
+    JOURNAL_MAX_BYTES o JOURNAL_MAX_AGE se pliega todo en un snapshot nuevo.
+    """
+
+    def __init__(self, ruta, max_bytes=JOURNAL_MAX_BYTES, max_age=JOURNAL_MAX_AGE):
+        super().__init__(ruta)
+        self.ruta_journal = os.path.splitext(ruta)[0] + ".journal"
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+
+    def load(self):
+        try:
+            pagos, compras = super().load()
+        except FileNotFoundError:
+            pagos, compras = [], []
+        return self._replay(pagos, compras)
+
+    def _replay(self, pagos, compras):
+        if not os.path.exists(self.ruta_journal):
+            return pagos, compras
+
+        listas = {"pago": pagos, "compra": compras}
+        por_uid = {}
+        for tipo, lst in listas.items():
+            for x in lst:
+                if x.get("uid"):
+                    por_uid[x["uid"]] = x
+        borrados = set()
+
+        with open(self.ruta_journal, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    # Última línea a medio escribir (cierre abrupto): se descarta
+                    continue
+                if not isinstance(rec, dict) or not isinstance(rec.get("data", {}), dict):
+                    # JSON válido pero no un cambio (línea pisada a medias): igual
+                    continue
+
+                op = rec.get("op")
+                uid = rec.get("uid")
+                if op == "reset":
+                    for lst in listas.values():
+                        borrados.update(id(x) for x in lst)
+                    por_uid.clear()
+                elif op in ("add", "upd") and uid and rec.get("tipo") in listas:
+                    # add/upd son idempotentes: reaplicar el diario sobre un
+                    # snapshot ya compactado deja el mismo resultado
+                    actual = por_uid.get(uid)
+                    if actual is not None:
+                        actual.clear()
+                        actual.update(rec.get("data", {}))
+                    else:
+                        nuevo = dict(rec.get("data", {}))
+                        listas[rec["tipo"]].append(nuevo)
+                        por_uid[uid] = nuevo
+                elif op == "del" and uid in por_uid:
+                    borrados.add(id(por_uid.pop(uid)))
+
+        if borrados:
+            pagos = [x for x in pagos if id(x) not in borrados]
+            compras = [x for x in compras if id(x) not in borrados]
+        return pagos, compras
+
+    def save(self, pagos, compras, cambios):
+        if cambios is None:
+            self.compact(pagos, compras)
+            return
+
+        if cambios:
+            cola_rota = self._cola_sin_salto()
+            with open(self.ruta_journal, "a", encoding="utf-8") as f:
+                if cola_rota:
+                    # Aislar el resto truncado para no corromper la línea siguiente
+                    f.write("\n")
+                for rec in cambios:
+                    f.write(json.dumps(rec, ensure_ascii=False, separators=(",", ":")) + "\n")
+                    f.flush()
+                os.fsync(f.fileno())
+
+        # pagos=None: el guardado se encoló sin snapshot, se compacta en el siguiente
+        if pagos is not None and self.needs_compaction():
+            self.compact(pagos, compras)
+
+    def needs_snapshot(self, cambios):
+        return cambios is None or self.needs_compaction()
+
+    def _cola_sin_salto(self):
+        try:
+            with open(self.ruta_journal, "rb") as f:
+                f.seek(0, os.SEEK_END)
+                if f.tell() == 0:
+                    return False
+                f.seek(-1, os.SEEK_END)
+                return f.read(1) != b"\n"
+        except OSError:
+            return False
+
+    def needs_compaction(self):
+        try:
+            size = os.path.getsize(self.ruta_journal)
+        except OSError:
+            return False
+        if size == 0:
+            return False
+        if size >= self.max_bytes:
+            return True
+        try:
+            edad = datetime.now() - datetime.fromtimestamp(os.path.getmtime(self.ruta))
+        except OSError:
+            return True
+        return edad >= self.max_age
+
+    def compact(self, pagos, compras):
+        escribir_json_atomico(self.ruta, {"pagos": pagos, "compras": compras})
+        # Si se corta aquí, el diario se reaplica sin efecto sobre el snapshot nuevo
+        with open(self.ruta_journal, "w", encoding="utf-8"):
+            pass
+
+
+_RE_YM = re.compile(r"\d{4}-\d{2}")
+
+
+def particion_de(fecha) -> str:
+    """Partición de un registro según su fecha: "YYYY-MM" u "otros"."""
+    ym = ym_from_date_str(str(fecha or ""))
+    return ym if _RE_YM.fullmatch(ym) else "otros"
+
+
+class PartitionedLedgerStore:
+    """Ledger partido por mes: finanzas_v4/YYYY-MM.json (más otros.json para
+    fechas inválidas), cada archivo con el formato de finanzas_v4.json.
+
+    La app abre solo los meses que necesita (load_months) y cada guardado
+    reescribe solo las particiones tocadas por los cambios. `_ubicacion`
+    recuerda en qué partición está cada uid conocido para poder sacarlo de
+    la anterior cuando cambia de mes.
+    """
+
+    parcial = True      # la app puede tener abiertos solo algunos meses
+    lee_bloques = True  # bloques() lee los de backup de las particiones
+
+    def __init__(self, directorio, ruta_json=None):
+        self.ruta = directorio
+        self.ruta_json = ruta_json
+        self.cuarentena = []
+        self.lock = threading.RLock()  # compartido con el hilo de WriteBehind
+        self._ubicacion = {}
+
+    def _archivo(self, p):
+        return os.path.join(self.ruta, p + ".json")
+
+    def meses(self):
+        """Particiones existentes en disco, ordenadas."""
+        try:
+            nombres = os.listdir(self.ruta)
+        except FileNotFoundError:
+            return []
+        return sorted(n[:-5] for n in nombres
+                      if n.endswith(".json") and (_RE_YM.fullmatch(n[:-5]) or n == "otros.json"))
+
+    def _leer(self, p, cuarentena):
+        try:
+            pagos, compras, apartados = leer_ledger(self._archivo(p))
+        except FileNotFoundError:
+            return [], []
+        for e in apartados:
+            e["particion"] = p
+        cuarentena.extend(apartados)
+        return pagos, compras
+
+    def _escribir(self, p, pagos, compras):
+        if pagos or compras:
+            escribir_json_atomico(self._archivo(p), {"pagos": pagos, "compras": compras})
+        else:
+            try:
+                os.remove(self._archivo(p))
+            except FileNotFoundError:
+                pass
+
+    def load_months(self, meses):
+        """Lee las particiones `meses` (las que no existen se ignoran)."""
+        with self.lock:
+            self.cuarentena = []
+            if not os.path.isdir(self.ruta) and self.ruta_json and os.path.exists(self.ruta_json):
+                self.import_json(self.ruta_json)
+
+            pagos, compras = [], []
+            for p in meses:
+                ps, cs = self._leer(p, self.cuarentena)
+                # Registros antiguos sin uid: se completan y la partición se reescribe
+                if any(not x.get("uid") for x in ps + cs):
+                    for x in ps + cs:
+                        x.setdefault("uid", str(uuid.uuid4()))
+                    self._escribir(p, ps, cs)
+                for x in ps + cs:
+                    self._ubicacion[x["uid"]] = p
+                pagos.extend(ps)
+                compras.extend(cs)
+            return pagos, compras
+
+    def load(self):
+        return self.load_months(self.meses())
+
+    def save(self, pagos, compras, cambios):
+        with self.lock:
+            os.makedirs(self.ruta, exist_ok=True)
+            if cambios is None:
+                self._reescribir_todo(pagos, compras)
+            else:
+                self._aplicar(cambios)
+
+    def _reescribir_todo(self, pagos, compras):
+        # pagos/compras son el ledger completo: lo que no aparezca se borra
+        grupos = {}
+        self._ubicacion.clear()
+        for lista, lst in (("pagos", pagos), ("compras", compras)):
+            for x in lst:
+                p = particion_de(x.get("fecha"))
+                grupos.setdefault(p, {"pagos": [], "compras": []})[lista].append(x)
+                self._ubicacion[x.get("uid")] = p
+        for p in self.meses():
+            if p not in grupos:
+                self._escribir(p, [], [])
+        for p, g in grupos.items():
+            self._escribir(p, g["pagos"], g["compras"])
+
+    def _aplicar(self, cambios):
+        abiertas = {}  # partición -> {"pagos": {uid: dict}, "compras": {...}}
+        apartados = []
+
+        def abrir(p):
+            g = abiertas.get(p)
+            if g is None:
+                ps, cs = self._leer(p, apartados)
+                g = abiertas[p] = {
+                    "pagos": {x.get("uid"): x for x in ps},
+                    "compras": {x.get("uid"): x for x in cs},
+                }
+            return g
+
+        for rec in cambios:
+            op, uid = rec.get("op"), rec.get("uid")
+            if op == "reset":
+                for p in self.meses():
+                    self._escribir(p, [], [])
+                self._ubicacion.clear()
+                abiertas.clear()
+            elif op in ("add", "upd", "del") and uid:
+                anterior = self._ubicacion.pop(uid, None)
+                if anterior is not None:
+                    g = abrir(anterior)
+                    g["pagos"].pop(uid, None)
+                    g["compras"].pop(uid, None)
+                if op != "del":
+                    data = rec.get("data", {})
+                    p = particion_de(data.get("fecha"))
+                    lista = "pagos" if rec.get("tipo") == "pago" else "compras"
+                    abrir(p)[lista][uid] = data
+                    self._ubicacion[uid] = p
+
+        if apartados:
+            # Partición con registros dañados que nadie había abierto: quedan
+            # en el informe antes de reescribirla sin ellos
+            guardar_cuarentena(self.ruta, self.ruta, apartados)
+        for p, g in abiertas.items():
+            self._escribir(p, list(g["pagos"].values()), list(g["compras"].values()))
+
+    def needs_compaction(self):
+        return False
+
+    def stage(self, cambios):
+        return False
+
+    def reservar(self):
+        return 0
+
+    def confirmar(self, numero):
+        pass
+
+    def needs_snapshot(self, cambios):
+        return False
+
+    def bloques(self, claves=None):
+        """Bloques de backup {tipo:YYYY-MM: registros} leídos del disco.
+        claves=None: todo el ledger."""
+        with self.lock:
+            if claves is None:
+                particiones = self.meses()
+            else:
+                particiones = sorted({particion_de(k.split(":", 1)[1]) for k in claves})
+            res = {}
+            for p in particiones:
+                ps, cs = self._leer(p, [])
+                for k, xs in BackupStore.agrupar(ps, cs).items():
+                    if claves is None or k in claves:
+                        res[k] = xs
+            return res
+
+    def import_json(self, ruta_json):
+        """Migración de una sola vez desde finanzas_v4.json."""
+        origen = JsonLedgerStore(ruta_json)
+        pagos, compras = origen.load()
+        self.cuarentena.extend(origen.cuarentena)
+        for x in pagos + compras:
+            x.setdefault("uid", str(uuid.uuid4()))
+        self.save(pagos, compras, None)
+        return len(pagos) + len(compras)
+
+
+# ================== CONSULTAS DEL LEDGER ==================
+#
+# Las vistas consultan el ledger a través de un "repo" con esta interfaz
+# (registros pendientes, status != PAID; los totales aceptan además un
+# status concreto):
+#   month_items(ym), month_by_day(ym), day_items(fecha),
+#   month_total(ym, status=None), month_by_cat(ym, status=None)
+
+
+class LedgerIndex:
+    """Índice incremental del ledger por mes (YYYY-MM) y por día.
+
+    Guarda los registros de cada día y, por mes, totales acumulados por
+    status y por (status, categoría). Cada alta/edición/baja retira la
+    contribución anterior del registro y suma la nueva en O(1), así que
+    consultar un mes no depende del tamaño del ledger. Avisa a los
+    suscriptores de cada cambio con fn(op, item, antes).
+    """
+
+    def __init__(self):
+        self.version = 0
+        self._entries = {}  # uid -> (tipo, item, ym, fecha, cat, status, monto)
+        self._months = {}   # ym -> {"days": {fecha: {uid: item}}, "tot": {...}, "cat": {...}}
+        self._by_cat = {}   # cat -> {uid: item}
+        self._listeners = []
+
+    # ---- suscripción ----
+
+    def subscribe(self, fn):
+        self._listeners.append(fn)
+
+    def unsubscribe(self, fn):
+        if fn in self._listeners:
+            self._listeners.remove(fn)
+
+    def _notify(self, op, item, antes):
+        self.version += 1
+        for fn in list(self._listeners):
+            fn(op, item, antes)
+
+    # ---- mantenimiento ----
+
+    @staticmethod
+    def _entrada(tipo, x):
+        fecha = str(x.get("fecha", "") or "")
+        return (
+            tipo, x, ym_from_date_str(fecha), fecha,
+            x.get("categoria", "OTHER"), x.get("status", "PENDING"),
+            monto_de(x),
+        )
+
+    def _aplicar(self, e, signo):
+        tipo, x, ym, fecha, cat, status, monto = e
+        m = self._months.get(ym)
+        if m is None:
+            m = self._months[ym] = {"days": {}, "tot": {}, "cat": {}}
+
+        if signo > 0:
+            m["days"].setdefault(fecha, {})[x["uid"]] = x
+            self._by_cat.setdefault(cat, {})[x["uid"]] = x
+        else:
+            dia = m["days"].get(fecha, {})
+            dia.pop(x["uid"], None)
+            if not dia:
+                m["days"].pop(fecha, None)
+            por_cat = self._by_cat.get(cat, {})
+            por_cat.pop(x["uid"], None)
+            if not por_cat:
+                self._by_cat.pop(cat, None)
+
+        for tabla, k in ((m["tot"], status), (m["cat"], (status, cat))):
+            acc = tabla.get(k)
+            if acc is None:
+                acc = tabla[k] = [0, 0.0]
+            acc[0] += signo
+            acc[1] += signo * monto
+            if acc[0] <= 0:
+                # Sin registros: se descarta el residuo de coma flotante
+                del tabla[k]
+
+    def rebuild(self, pagos, compras):
+        self._entries.clear()
+        self._months.clear()
+        self._by_cat.clear()
+        for tipo, lst in (("pago", pagos), ("compra", compras)):
+            for x in lst:
+                e = self._entrada(tipo, x)
+                self._entries[x["uid"]] = e
+                self._aplicar(e, +1)
+        self._notify("reset", None, None)
+
+    def add(self, tipo, item):
+        e = self._entrada(tipo, item)
+        self._entries[item["uid"]] = e
+        self._aplicar(e, +1)
+        self._notify("add", item, None)
+
+    def update(self, item):
+        antes = self._entries.get(item["uid"])
+        tipo = antes[0] if antes else ("pago" if "nombre" in item else "compra")
+        if antes:
+            self._aplicar(antes, -1)
+        e = self._entrada(tipo, item)
+        self._entries[item["uid"]] = e
+        self._aplicar(e, +1)
+        self._notify("upd", item, antes)
+
+    def remove(self, item):
+        antes = self._entries.pop(item.get("uid"), None)
+        if antes:
+            self._aplicar(antes, -1)
+            self._notify("del", item, antes)
+
+    # ---- consultas ----
+
+    def get(self, uid):
+        e = self._entries.get(uid)
+        return e[1] if e else None
+
+    def tipo(self, uid):
+        e = self._entries.get(uid)
+        return e[0] if e else None
+
+    def entry(self, uid):
+        """Entrada normalizada (tipo, item, ym, fecha, cat, status, monto) o None."""
+        return self._entries.get(uid)
+
+    def entries(self):
+        return list(self._entries.values())
+
+    def __len__(self):
+        return len(self._entries)
+
+    def all_items(self):
+        return (e[1] for e in self._entries.values())
+
+    def months(self):
+        return sorted(self._months)
+
+    def categories(self):
+        return list(self._by_cat)
+
+    def cat_items(self, cat):
+        return list(self._by_cat.get(cat, {}).values())
+
+    def range_items(self, desde="", hasta=""):
+        """Todos los registros (cualquier status) con desde <= fecha <= hasta.
+        Los extremos pueden ser parciales: "2025-03" cubre el mes entero."""
+        tope = (hasta + "~") if hasta else "~"
+        res = []
+        for ym in self.months():
+            if ym < desde[:7] or ym > tope:
+                continue
+            dias = self._months[ym]["days"]
+            for fecha in sorted(dias):
+                if desde <= fecha <= tope:
+                    res.extend(dias[fecha].values())
+        return res
+
+    def month_by_day(self, ym):
+        m = self._months.get(ym)
+        if not m:
+            return {}
+        res = {}
+        for fecha in sorted(m["days"]):
+            pendientes = [x for x in m["days"][fecha].values() if x.get("status", "PENDING") != "PAID"]
+            if pendientes:
+                res[fecha] = pendientes
+        return res
+
+    def month_items(self, ym):
+        return [x for items in self.month_by_day(ym).values() for x in items]
+
+    def day_items(self, fecha):
+        m = self._months.get(ym_from_date_str(fecha))
+        if not m:
+            return []
+        return [x for x in m["days"].get(fecha, {}).values() if x.get("status", "PENDING") != "PAID"]
+
+    def month_total(self, ym, status=None):
+        m = self._months.get(ym)
+        if not m:
+            return 0.0
+        if status is not None:
+            return m["tot"].get(status, (0, 0.0))[1]
+        return sum(acc[1] for st, acc in m["tot"].items() if st != "PAID")
+
+    def month_by_cat(self, ym, status=None):
+        m = self._months.get(ym)
+        res = {}
+        if not m:
+            return res
+        for (st, cat), acc in m["cat"].items():
+            if (status is None and st != "PAID") or st == status:
+                res[cat] = res.get(cat, 0.0) + acc[1]
+        return res
+
+
+np = None  # numpy es opcional: se importa al crear el primer ColumnarLedger
+
+
+def numpy_disponible():
+    global np
+    if np is None:
+        try:
+            import numpy
+        except ImportError:
+            return False
+        np = numpy
+    return True
+
+
+class ColumnarLedger:
+    """Copia en columnas NumPy del ledger para agregaciones vectorizadas.
+
+    Una fila por registro: monto (float64), fecha como ordinal (int32), mes
+    como año*12+mes (int32), categoría/método/status como códigos (int16/int8)
+    y tipo (0 pago, 1 compra). Con `index` se mantiene al día con sus
+    notificaciones; las bajas solo apagan la fila y se compacta cuando
+    sobran más de la mitad. Implementa la misma interfaz de repo que
+    LedgerIndex (pendientes por defecto) más totales por día y por rango.
+    """
+
+    COLUMNAS = (
+        ("monto", "float64"), ("dia", "int32"), ("mes", "int32"), ("cat", "int16"),
+        ("metodo", "int16"), ("status", "int8"), ("tipo", "int8"), ("vivo", "bool"),
+    )
+
+    def __init__(self, index=None, capacidad=1024):
+        numpy_disponible()
+        self.index = index
+        self._cap = max(16, capacidad)
+        self._n = 0
+        self.col = {nombre: np.zeros(self._cap, dtype=dt) for nombre, dt in self.COLUMNAS}
+        self._items = []    # fila -> dict de la app
+        self._fila = {}     # uid -> fila
+        self._muertas = 0
+        self._codigos = {"cat": {}, "metodo": {}, "status": {}}
+        self._nombres = {"cat": [], "metodo": [], "status": []}
+        if index is not None:
+            index.subscribe(self._on_change)
+            self.cargar((index.tipo(x["uid"]), x) for x in index.all_items())
+
+    # ---- mantenimiento ----
+
+    def _codigo(self, campo, valor):
+        tabla = self._codigos[campo]
+        c = tabla.get(valor)
+        if c is None:
+            c = tabla[valor] = len(self._nombres[campo])
+            self._nombres[campo].append(valor)
+        return c
+
+    def _escribir(self, i, tipo, x):
+        col = self.col
+        fecha = str(x.get("fecha", "") or "")
+        col["monto"][i] = monto_de(x)
+        col["dia"][i] = ordinal_de(x)
+        col["mes"][i] = _codigo_mes(fecha[:7])
+        col["cat"][i] = self._codigo("cat", x.get("categoria", "OTHER"))
+        col["metodo"][i] = self._codigo("metodo", x.get("metodo", ""))
+        col["status"][i] = self._codigo("status", x.get("status", "PENDING"))
+        col["tipo"][i] = 0 if tipo == "pago" else 1
+        col["vivo"][i] = True
+
+    def _crecer(self, minimo):
+        cap = self._cap
+        while cap < minimo:
+            cap *= 2
+        if cap != self._cap:
+            for nombre, arr in self.col.items():
+                nuevo = np.zeros(cap, dtype=arr.dtype)
+                nuevo[:self._n] = arr[:self._n]
+                self.col[nombre] = nuevo
+            self._cap = cap
+
+    def cargar(self, registros):
+        """Reemplaza el contenido con pares (tipo, item), en bloque."""
+        filas = {nombre: [] for nombre, _ in self.COLUMNAS if nombre != "vivo"}
+        cat, metodo, status = self._codigos["cat"], self._codigos["metodo"], self._codigos["status"]
+        self._items = []
+        for tipo, x in registros:
+            fecha = str(x.get("fecha", "") or "")
+            c = cat.get(x.get("categoria", "OTHER"))
+            if c is None:
+                c = self._codigo("cat", x.get("categoria", "OTHER"))
+            m = metodo.get(x.get("metodo", ""))
+            if m is None:
+                m = self._codigo("metodo", x.get("metodo", ""))
+            st = status.get(x.get("status", "PENDING"))
+            if st is None:
+                st = self._codigo("status", x.get("status", "PENDING"))
+            filas["monto"].append(monto_de(x))
+            filas["dia"].append(ordinal_de(x))
+            filas["mes"].append(_codigo_mes(fecha[:7]))
+            filas["cat"].append(c)
+            filas["metodo"].append(m)
+            filas["status"].append(st)
+            filas["tipo"].append(0 if tipo == "pago" else 1)
+            self._items.append(x)
+
+        self._n = 0
+        self._crecer(len(self._items))
+        self._n = len(self._items)
+        for nombre, valores in filas.items():
+            self.col[nombre][:self._n] = valores
+        self.col["vivo"][:self._n] = True
+        self.col["vivo"][self._n:] = False
+        self._fila = {x["uid"]: i for i, x in enumerate(self._items) if x.get("uid")}
+        self._muertas = 0
+
+    def append(self, tipo, x):
+        self._crecer(self._n + 1)
+        i = self._n
+        self._escribir(i, tipo, x)
+        self._items.append(x)
+        if x.get("uid"):
+            self._fila[x["uid"]] = i
+        self._n += 1
+
+    def _on_change(self, op, item, antes):
+        if op == "reset":
+            self.cargar((self.index.tipo(x["uid"]), x) for x in self.index.all_items())
+        elif op == "add":
+            self.append(self.index.tipo(item["uid"]), item)
+        elif op == "upd":
+            i = self._fila.get(item["uid"])
+            if i is None:
+                self.append(self.index.tipo(item["uid"]), item)
+            else:
+                self._escribir(i, self.index.tipo(item["uid"]), item)
+        elif op == "del":
+            i = self._fila.pop(item["uid"], None)
+            if i is not None:
+                self.col["vivo"][i] = False
+                self._items[i] = None
+                self._muertas += 1
+                if self._muertas * 2 > self._n:
+                    self._compactar()
+
+    def _compactar(self):
+        vivas = np.flatnonzero(self.col["vivo"][:self._n])
+        for nombre, arr in self.col.items():
+            arr[:len(vivas)] = arr[vivas]
+        self._items = [self._items[i] for i in vivas]
+        self._n = len(vivas)
+        self._fila = {x["uid"]: i for i, x in enumerate(self._items) if x.get("uid")}
+        self._muertas = 0
+
+    # ---- filtros ----
+
+    def _v(self, nombre):
+        return self.col[nombre][:self._n]
+
+    def _mascara(self, status):
+        # status None = pendientes (todo lo que no es PAID), como LedgerIndex
+        m = self._v("vivo").copy()
+        if status is None:
+            pagado = self._codigos["status"].get("PAID")
+            if pagado is not None:
+                m &= self._v("status") != pagado
+        else:
+            c = self._codigos["status"].get(status)
+            if c is None:
+                m[:] = False
+            else:
+                m &= self._v("status") == c
+        return m
+
+    def _mascara_rango(self, desde, hasta, status):
+        m = self._mascara(status)
+        dia = self._v("dia")
+        m &= dia >= 0
+        if desde:
+            m &= dia >= _ordinal_fecha(desde)
+        if hasta:
+            m &= dia <= _ordinal_fecha(hasta)
+        return m
+
+    def _filas(self, mascara):
+        # Filas en orden de fecha y, dentro del día, de alta
+        idx = np.flatnonzero(mascara)
+        idx = idx[np.argsort(self._v("dia")[idx], kind="stable")]
+        return [self._items[i] for i in idx]
+
+    # ---- repo ----
+
+    def month_items(self, ym):
+        return self._filas(self._mascara(None) & (self._v("mes") == _codigo_mes(ym)))
+
+    def month_by_day(self, ym):
+        res = {}
+        for x in self.month_items(ym):
+            res.setdefault(x.get("fecha"), []).append(x)
+        return res
+
+    def day_items(self, fecha):
+        return self._filas(self._mascara(None) & (self._v("dia") == _ordinal_fecha(fecha)))
+
+    def month_total(self, ym, status=None):
+        m = self._mascara(status) & (self._v("mes") == _codigo_mes(ym))
+        return float(self._v("monto")[m].sum())
+
+    def month_by_cat(self, ym, status=None):
+        m = self._mascara(status) & (self._v("mes") == _codigo_mes(ym))
+        return self._por_codigo("cat", m)
+
+    # ---- agregados extra ----
+
+    def _por_codigo(self, campo, mascara):
+        codigos = self.col[campo][:self._n][mascara]
+        n = len(self._nombres[campo])
+        sumas = np.bincount(codigos, weights=self._v("monto")[mascara], minlength=n)
+        cuenta = np.bincount(codigos, minlength=n)
+        return {self._nombres[campo][c]: float(sumas[c]) for c in np.flatnonzero(cuenta)}
+
+    def day_totals(self, ym, status=None):
+        """Total por día del mes: array de largo días-del-mes (índice 0 = día 1)."""
+        y, mes = int(ym[:4]), int(ym[5:7])
+        primero = date(y, mes, 1).toordinal()
+        dias = calendar.monthrange(y, mes)[1]
+        m = self._mascara(status) & (self._v("mes") == _codigo_mes(ym)) & (self._v("dia") >= primero)
+        return np.bincount(self._v("dia")[m] - primero, weights=self._v("monto")[m], minlength=dias)[:dias]
+
+    def month_totals(self, status=None):
+        """{YYYY-MM: total} de todos los meses con registros."""
+        m = self._mascara(status) & (self._v("mes") >= 0)
+        meses = self._v("mes")[m]
+        if not len(meses):
+            return {}
+        base = int(meses.min())
+        sumas = np.bincount(meses - base, weights=self._v("monto")[m])
+        cuenta = np.bincount(meses - base)
+        return {f"{(base + k) // 12}-{(base + k) % 12 + 1:02d}": float(sumas[k]) for k in np.flatnonzero(cuenta)}
+
+    def range_total(self, desde="", hasta="", status=None):
+        return float(self._v("monto")[self._mascara_rango(desde, hasta, status)].sum())
+
+    def range_by_cat(self, desde="", hasta="", status=None):
+        return self._por_codigo("cat", self._mascara_rango(desde, hasta, status))
+
+
+class _Fenwick:
+    """Árbol de Fenwick sobre gastos diarios: alta y suma acumulada en O(log n)."""
+
+    __slots__ = ("n", "arbol", "dias")
+
+    def __init__(self, n):
+        self.n = n
+        self.arbol = [0.0] * (n + 1)
+        self.dias = [0.0] * n  # valor de cada día, para sacar curvas enteras
+
+    def add(self, i, v):
+        self.dias[i] += v
+        i += 1
+        while i <= self.n:
+            self.arbol[i] += v
+            i += i & -i
+
+    def prefix(self, i):
+        """Suma de los días 0..i (inclusive)."""
+        i = min(i, self.n - 1) + 1
+        s = 0.0
+        while i > 0:
+            s += self.arbol[i]
+            i -= i & -i
+        return s
+
+
+class DailySeries:
+    """Gasto diario por (status, categoría) guardado como sumas acumuladas.
+
+    Cada registro suma su monto en el día de su fecha, en su categoría y en
+    la serie "*" (todas). Se mantiene con las notificaciones del LedgerIndex
+    (las ediciones restan la entrada anterior y suman la nueva), así que el
+    total de cualquier rango de fechas son dos sumas prefijo. status None =
+    pendientes (todo lo que no es PAID), "ALL" = cualquier status.
+    """
+
+    MARGEN = 366  # días libres a cada lado al (re)dimensionar
+
+    def __init__(self, index):
+        self.index = index
+        self.archivo = None  # LedgerArchive: sus registros cuentan como PAID
+        self._base = None    # ordinal del día 0
+        self._n = 0
+        self._series = {}    # (status, cat) -> _Fenwick
+        index.subscribe(self._on_change)
+        self._rebuild()
+
+    def set_archivo(self, archivo):
+        self.archivo = archivo
+        self._rebuild()
+
+    # ---- mantenimiento ----
+
+    def _rebuild(self):
+        self._base = None
+        self._n = 0
+        self._series = {}
+        for e in self.index.entries():
+            self._aplicar(e, +1)
+        if self.archivo is not None:
+            for o, cat, monto in self.archivo.filas():
+                self._sumar(o, "PAID", cat, monto)
+
+    def _redimensionar(self, o):
+        desde = o - self.MARGEN if self._base is None else min(self._base, o - self.MARGEN)
+        hasta = o + self.MARGEN if self._base is None else max(self._base + self._n, o + self.MARGEN)
+        viejas, base_vieja = self._series, self._base
+        self._base, self._n = desde, hasta - desde
+        self._series = {}
+        for k, f in viejas.items():
+            nueva = self._series[k] = _Fenwick(self._n)
+            for i, v in enumerate(f.dias):
+                if v:
+                    nueva.add(i + base_vieja - desde, v)
+
+    def _aplicar(self, e, signo):
+        tipo, x, ym, fecha, cat, status, monto = e
+        self._sumar(_ordinal_fecha(fecha), status, cat, signo * monto)
+
+    def _sumar(self, o, status, cat, v):
+        if o < 0 or not v:
+            return
+        if self._base is None or not (self._base <= o < self._base + self._n):
+            self._redimensionar(o)
+        for k in ((status, cat), (status, "*")):
+            f = self._series.get(k)
+            if f is None:
+                f = self._series[k] = _Fenwick(self._n)
+            f.add(o - self._base, v)
+
+    def _on_change(self, op, item, antes):
+        if op == "reset":
+            self._rebuild()
+            return
+        if antes:
+            self._aplicar(antes, -1)
+        if op in ("add", "upd"):
+            e = self.index.entry(item["uid"])
+            if e is not None:
+                self._aplicar(e, +1)
+
+    # ---- consultas ----
+
+    def _claves(self, status, cat):
+        cat = cat or "*"
+        for (st, c) in self._series:
+            if c != cat:
+                continue
+            if status == "ALL" or (status is None and st != "PAID") or st == status:
+                yield (st, c)
+
+    def _prefix(self, o, claves):
+        if self._base is None or o < self._base:
+            return 0.0
+        return sum(self._series[k].prefix(o - self._base) for k in claves)
+
+    def total(self, desde, hasta, status=None, cat=None):
+        """Gasto entre dos fechas YYYY-MM-DD (inclusive)."""
+        claves = list(self._claves(status, cat))
+        return self._prefix(_ordinal_fecha(hasta), claves) - self._prefix(_ordinal_fecha(desde) - 1, claves)
+
+    def month_total(self, ym, status=None, cat=None):
+        y, m = int(ym[:4]), int(ym[5:7])
+        return self.total(f"{ym}-01", f"{ym}-{calendar.monthrange(y, m)[1]:02d}", status, cat)
+
+    def week_total(self, fecha, status=None, cat=None):
+        """Semana lunes-domingo que contiene `fecha`."""
+        o = _ordinal_fecha(fecha)
+        if o < 0:
+            return 0.0
+        d = date.fromordinal(o)
+        lunes = d - timedelta(days=d.weekday())
+        return self.total(lunes.isoformat(), (lunes + timedelta(days=6)).isoformat(), status, cat)
+
+    def ytd_total(self, fecha, status=None, cat=None):
+        return self.total(f"{fecha[:4]}-01-01", fecha, status, cat)
+
+    def diario(self, desde, hasta, status=None, cat=None):
+        """Gasto de cada día entre dos ordinales (inclusive), como lista."""
+        res = [0.0] * (hasta - desde + 1)
+        if self._base is None:
+            return res
+        a, b = max(desde, self._base), min(hasta, self._base + self._n - 1)
+        if a > b:
+            return res
+        for k in self._claves(status, cat):
+            dias = self._series[k].dias[a - self._base:b - self._base + 1]
+            res[a - desde:b - desde + 1] = map(float.__add__, res[a - desde:b - desde + 1], dias)
+        return res
+
+    def span(self):
+        """(primera, última) fecha con gasto, o None."""
+        usados = [i for f in self._series.values() for i in (
+            next((i for i, v in enumerate(f.dias) if v), None),
+            next((i for i in range(f.n - 1, -1, -1) if f.dias[i]), None),
+        ) if i is not None]
+        if not usados:
+            return None
+        return (date.fromordinal(self._base + min(usados)).isoformat(),
+                date.fromordinal(self._base + max(usados)).isoformat())
+
+    def cumulative(self, desde, hasta, status=None, cat=None):
+        """Curva acumulada día a día: (fechas, valores), partiendo del acumulado previo."""
+        claves = list(self._claves(status, cat))
+        o1, o2 = _ordinal_fecha(desde), _ordinal_fecha(hasta)
+        fechas, valores = [], []
+        acc = self._prefix(o1 - 1, claves)
+        for o in range(o1, o2 + 1):
+            i = o - self._base if self._base is not None else -1
+            if 0 <= i < self._n:
+                acc += sum(self._series[k].dias[i] for k in claves)
+            fechas.append(date.fromordinal(o))
+            valores.append(acc)
+        return fechas, valores
+
+
+# Próximos pagos del dashboard: horizonte por defecto en días (config
+# "upcoming_days"), cuántos "siguientes" mostrar si el horizonte está vacío
+# y cuántos días atrás se buscan ocurrencias recurrentes sin pagar
+PROXIMOS_DIAS = 10
+PROXIMOS_SIGUIENTES = 5
+RECURRENTES_VENCIDOS_DIAS = 31
+
+
+class DueIndex:
+    """Pagos pendientes ordenados por fecha de vencimiento.
+
+    Lista ordenada de (ordinal, uid) que se mantiene con bisect desde las
+    notificaciones del LedgerIndex. "Próximos N días", "vencidos" y
+    "siguientes K" son cortes de la lista: O(log n + k) sin recorrer el
+    ledger ni volver a parsear fechas. Las altas se acumulan sin ordenar y
+    se mezclan de una vez (un solo sort) en la siguiente consulta o edición,
+    así la carga progresiva no paga un insort por registro.
+    """
+
+    def __init__(self, index):
+        self.index = index
+        self._orden = []   # [(ordinal, uid)] de pagos no PAID con fecha válida
+        self._nuevos = []  # altas aún no mezcladas en _orden
+        index.subscribe(self._on_change)
+        self._rebuild()
+
+    @staticmethod
+    def _clave(e):
+        tipo, x, ym, fecha, cat, status, monto = e
+        if tipo != "pago" or status == "PAID":
+            return None
+        o = _ordinal_fecha(fecha)
+        return (o, x["uid"]) if o >= 0 else None
+
+    def _rebuild(self):
+        self._orden = sorted(k for k in map(self._clave, self.index.entries()) if k is not None)
+        self._nuevos = []
+
+    def _ordenar(self):
+        if self._nuevos:
+            # Timsort mezcla el tramo ya ordenado con las altas: O(n + m log m)
+            self._orden.extend(self._nuevos)
+            self._orden.sort()
+            self._nuevos = []
+        return self._orden
+
+    def _on_change(self, op, item, antes):
+        if op == "reset":
+            self._rebuild()
+            return
+        if op == "add":
+            e = self.index.entry(item["uid"])
+            k = self._clave(e) if e is not None else None
+            if k is not None:
+                self._nuevos.append(k)
+            return
+        self._ordenar()
+        if antes:
+            k = self._clave(antes)
+            if k is not None:
+                i = bisect.bisect_left(self._orden, k)
+                if i < len(self._orden) and self._orden[i] == k:
+                    del self._orden[i]
+        if op == "upd":
+            e = self.index.entry(item["uid"])
+            k = self._clave(e) if e is not None else None
+            if k is not None:
+                bisect.insort(self._orden, k)
+
+    def __len__(self):
+        return len(self._orden) + len(self._nuevos)
+
+    # ---- consultas (ordinales de date) ----
+
+    def _items(self, i, j):
+        return [self.index.get(uid) for _, uid in self._orden[i:j]]
+
+    def rango(self, desde, hasta):
+        """Pendientes con desde <= fecha <= hasta, por fecha."""
+        orden = self._ordenar()
+        return self._items(bisect.bisect_left(orden, (desde,)), bisect.bisect_left(orden, (hasta + 1,)))
+
+    def vencidos(self, hoy):
+        """Pendientes con fecha anterior a `hoy`, del más antiguo al más reciente."""
+        return self._items(0, bisect.bisect_left(self._ordenar(), (hoy,)))
+
+    def siguientes(self, desde, k):
+        """Los `k` primeros pendientes a partir de `desde` (inclusive)."""
+        i = bisect.bisect_left(self._ordenar(), (desde,))
+        return self._items(i, i + k)
+
+
+# ================== ARCHIVO HISTÓRICO ==================
+#
+# Los registros PAID de meses cerrados salen del ledger vivo a un archivo
+# columnar de solo lectura (finanzas_v4.archivo). Las vistas del mes no lo
+# miran (solo muestran pendientes); lo consultan el buscador, las
+# estadísticas con status "ALL" y la exportación.
+
+ARCHIVO_MAGIC = b"CFARCH1\n"
+# Meses recientes que nunca se archivan (el actual incluido). Por defecto 0:
+# no se archiva nada hasta que se activa (config "archive_after_months" o
+# --archive-after N)
+ARCHIVO_MESES_ABIERTOS = 0
+
+# Columnas: nombre -> typecode de array (una fila por registro, orden por fecha)
+ARCHIVO_COLUMNAS = (("ordinal", "i"), ("monto", "d"), ("cat", "H"), ("tipo", "B"), ("offsets", "Q"))
+
+
+class LedgerArchive:
+    """Archivo de solo lectura: columnas binarias + los registros en JSONL.
+
+    Formato: ARCHIVO_MAGIC, longitud (uint64 LE) y cabecera JSON con el
+    índice por mes {ym: [fila_ini, fila_fin]}, la tabla de categorías y el
+    offset de cada sección; después las secciones alineadas a 8 bytes. Se
+    abre con mmap: las columnas son memoryviews sobre el archivo y un
+    registro completo solo se decodifica cuando se pide.
+
+    Ofrece la parte de lectura de LedgerIndex que usa SearchIndex (get,
+    all_items, cat_items, range_items, categories), así que el buscador
+    puede indexarlo igual que el ledger vivo.
+    """
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self.n = 0
+        self.meses = {}
+        self.cats = []
+        self._mm = None
+        self._vistas = {}
+        self._uids = None   # uid -> fila, al primer get()
+        if os.path.exists(ruta):
+            self._abrir()
+
+    def _abrir(self):
+        with open(self.ruta, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        mm = self._mm
+        if mm[:8] != ARCHIVO_MAGIC:
+            self.close()
+            raise ValueError(f"{self.ruta} no es un archivo histórico")
+        largo = int.from_bytes(mm[8:16], "little")
+        cab = json.loads(mm[16:16 + largo])
+        self.n, self.meses, self.cats = cab["n"], cab["meses"], cab["cats"]
+        base = memoryview(mm)
+        for nombre, (ini, tam, tc) in cab["secciones"].items():
+            vista = base[ini:ini + tam]
+            if tc != "s" and cab.get("orden", sys.byteorder) != sys.byteorder:
+                a = array.array(tc, vista)
+                a.byteswap()
+                vista = memoryview(a)
+            elif tc != "s":
+                vista = vista.cast(tc)
+            self._vistas[nombre] = vista
+        base.release()
+
+    def close(self):
+        for v in self._vistas.values():
+            v.release()
+        self._vistas.clear()
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        self.n = 0
+
+    def __len__(self):
+        return self.n
+
+    # ---- lectura ----
+
+    def _linea(self, i):
+        off = self._vistas["offsets"]
+        return bytes(self._vistas["registros"][off[i]:off[i + 1]])
+
+    def registro(self, i):
+        return Transaction(json.loads(self._linea(i)))
+
+    def _filas(self, ini, fin):
+        return (self.registro(i) for i in range(ini, fin))
+
+    def filas(self):
+        """(ordinal, categoría, monto) de cada registro, para DailySeries."""
+        if not self.n:
+            return
+        o, m, c = self._vistas["ordinal"], self._vistas["monto"], self._vistas["cat"]
+        for i in range(self.n):
+            yield o[i], self.cats[c[i]], m[i]
+
+    def month_items(self, ym):
+        ini, fin = self.meses.get(ym, (0, 0))
+        return list(self._filas(ini, fin))
+
+    def uids(self):
+        if self._uids is None:
+            crudo = bytes(self._vistas["uids"]).decode("utf-8") if self.n else ""
+            self._uids = {u: i for i, u in enumerate(crudo.split("\n"))} if crudo else {}
+        return self._uids
+
+    # ---- interfaz de ledger para SearchIndex ----
+
+    def subscribe(self, fn):
+        pass  # de solo lectura: no hay cambios que avisar
+
+    def unsubscribe(self, fn):
+        pass
+
+    def get(self, uid):
+        i = self.uids().get(uid)
+        return None if i is None else self.registro(i)
+
+    def all_items(self):
+        return self._filas(0, self.n)
+
+    def categories(self):
+        return list(self.cats)
+
+    def cat_items(self, cat):
+        if cat not in self.cats or not self.n:
+            return []
+        codigo, c = self.cats.index(cat), self._vistas["cat"]
+        return [self.registro(i) for i in range(self.n) if c[i] == codigo]
+
+    def range_items(self, desde="", hasta=""):
+        # Las filas van por fecha: el rango sale de una búsqueda binaria en la columna
+        if not self.n:
+            return []
+        o = self._vistas["ordinal"]
+        d = _ordinal_fecha((desde + "-01-01")[:10]) if desde else -1
+        h = _ultimo_dia(hasta) if hasta else -1
+        ini = bisect.bisect_left(o, d) if d >= 0 else 0
+        fin = bisect.bisect_right(o, h) if h >= 0 else self.n
+        return list(self._filas(ini, fin))
+
+    # ---- escritura ----
+
+    def agregar(self, registros):
+        """Escribe un archivo nuevo con las filas actuales más `registros`
+        [(tipo, item)] (los uid ya archivados se saltan) y devuelve el
+        LedgerArchive abierto sobre él. El anterior queda en .anterior."""
+        existentes = self.uids()
+        uids_viejos = list(existentes)  # en orden de fila
+        filas = [(self._vistas["ordinal"][i], i, None) for i in range(self.n)]
+        nuevos = []
+        for tipo, x in registros:
+            if x.get("uid") in existentes:
+                continue
+            nuevos.append((tipo, x))
+            filas.append((ordinal_de(x), len(filas), len(nuevos) - 1))
+        if not nuevos:
+            return self
+        filas.sort(key=lambda f: f[0])
+
+        cats, codigos = [], {}
+        cols = {nombre: array.array(tc) for nombre, tc in ARCHIVO_COLUMNAS}
+        blob, uids, meses = io.BytesIO(), [], {}
+        cols["offsets"].append(0)
+        for fila, (o, i, j) in enumerate(filas):
+            if j is None:
+                linea = self._linea(i)
+                cat = self.cats[self._vistas["cat"][i]]
+                monto, tipo = self._vistas["monto"][i], self._vistas["tipo"][i]
+                uid = uids_viejos[i]
+            else:
+                t, x = nuevos[j]
+                d = x.to_dict() if isinstance(x, Transaction) else dict(x)
+                linea = (json.dumps(d, ensure_ascii=False, default=json_default) + "\n").encode("utf-8")
+                cat = str(x.get("categoria", "OTHER") or "OTHER")
+                monto, tipo, uid = monto_de(x), 0 if t == "pago" else 1, str(x.get("uid"))
+            if cat not in codigos:
+                codigos[cat] = len(cats)
+                cats.append(cat)
+            ym = date.fromordinal(o).strftime("%Y-%m")
+            meses.setdefault(ym, [fila, fila])[1] = fila + 1
+            cols["ordinal"].append(o)
+            cols["monto"].append(monto)
+            cols["cat"].append(codigos[cat])
+            cols["tipo"].append(tipo)
+            blob.write(linea)
+            cols["offsets"].append(blob.tell())
+            uids.append(uid)
+
+        secciones = [(nombre, cols[nombre].tobytes(), tc) for nombre, tc in ARCHIVO_COLUMNAS]
+        secciones += [("registros", blob.getvalue(), "s"), ("uids", "\n".join(uids).encode("utf-8"), "s")]
+        tmp = self.ruta + ".tmp"
+        escribir_archivo_columnar(tmp, len(filas), meses, cats, secciones)
+
+        # En Windows no se puede reemplazar un archivo con un mmap abierto
+        self.close()
+        if os.path.exists(self.ruta):
+            os.replace(self.ruta, self.ruta + ".anterior")
+        os.replace(tmp, self.ruta)
+        return LedgerArchive(self.ruta)
+
+
+def _ultimo_dia(fecha):
+    # "YYYY", "YYYY-MM" o "YYYY-MM-DD" -> ordinal del último día del periodo; -1 si no vale
+    try:
+        y = int(fecha[:4])
+        if len(fecha) >= 10:
+            return _ordinal_fecha(fecha[:10])
+        m = int(fecha[5:7]) if len(fecha) >= 7 else 12
+        return date(y, m, calendar.monthrange(y, m)[1]).toordinal()
+    except ValueError:
+        return -1
+
+
+def escribir_archivo_columnar(ruta, n, meses, cats, secciones):
+    """Escribe el formato de LedgerArchive: secciones [(nombre, bytes, typecode)]."""
+    def alinear(x):
+        return (x + 7) & ~7
+
+    cab = {"n": n, "meses": meses, "cats": cats, "orden": sys.byteorder, "secciones": {}}
+    # La cabecera incluye los offsets: se calcula dos veces hasta que su largo se estabiliza
+    largo = 0
+    while True:
+        pos = alinear(16 + largo)
+        for nombre, datos, tc in secciones:
+            cab["secciones"][nombre] = [pos, len(datos), tc]
+            pos = alinear(pos + len(datos))
+        crudo = json.dumps(cab, separators=(",", ":")).encode("utf-8")
+        if len(crudo) == largo:
+            break
+        largo = len(crudo)
+
+    with open(ruta, "wb") as f:
+        f.write(ARCHIVO_MAGIC + largo.to_bytes(8, "little") + crudo)
+        for nombre, datos, tc in secciones:
+            f.seek(cab["secciones"][nombre][0])
+            f.write(datos)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+# ================== PAGOS RECURRENTES ==================
+
+# Opciones de "Repetir" al crear un pago: etiqueta -> (freq, intervalo) o None
+RECURRENCIAS = {
+    "No": None,
+    "Mensual": ("monthly", 1),
+    "Cada 2 meses": ("monthly", 2),
+    "Cada 3 meses": ("monthly", 3),
+    "Cada 6 meses": ("monthly", 6),
+    "Anual": ("monthly", 12),
+    "Semanal": ("weekly", 1),
+    "Cada 2 semanas": ("weekly", 2),
+}
+
+# Campos de una ocurrencia que una excepción puede cambiar
+CAMPOS_EXCEPCION = ("nombre", "monto", "fecha", "categoria", "metodo", "status")
+
+
+def fechas_regla(regla, ym):
+    """Fechas YYYY-MM-DD en que cae `regla` dentro del mes `ym`, sin aplicar excepciones.
+
+    monthly: el día `dia` (o el de `inicio`) cada `intervalo` meses desde
+    `inicio`, recortado al último día del mes (31 -> 28/29/30). weekly: cada
+    `intervalo` semanas desde `inicio`. `fin` (opcional) es inclusive.
+    """
+    inicio = parse_date_ymd(str(regla.get("inicio", "")))
+    if inicio is None or _codigo_mes(ym) < 0:
+        return []
+    fin = parse_date_ymd(str(regla.get("fin") or ""))
+    y, m = int(ym[:4]), int(ym[5:7])
+    primero = date(y, m, 1).toordinal()
+    ultimo = date(y, m, calendar.monthrange(y, m)[1]).toordinal()
+    desde = max(primero, inicio.toordinal())
+    hasta = min(ultimo, fin.toordinal()) if fin else ultimo
+    if desde > hasta:
+        return []
+
+    n = max(1, int(regla.get("intervalo", 1) or 1))
+    if regla.get("freq") == "weekly":
+        paso = 7 * n
+        o = inicio.toordinal() + -(-(desde - inicio.toordinal()) // paso) * paso
+        ordinales = range(o, hasta + 1, paso)
+    else:
+        if ((y * 12 + m) - (inicio.year * 12 + inicio.month)) % n:
+            return []
+        o = date(y, m, clamp_day(y, m, int(regla.get("dia") or inicio.day))).toordinal()
+        ordinales = [o] if desde <= o <= hasta else []
+    return [date.fromordinal(o).isoformat() for o in ordinales]
+
+
+class RecurringRules:
+    """Reglas de pagos recurrentes (en config.json) y sus excepciones.
+
+    Cada regla se guarda una sola vez; sus ocurrencias se generan al
+    consultar un mes y se cachean por mes. Pagar, editar o borrar una
+    ocurrencia solo añade una excepción a la regla bajo su fecha original,
+    así que lo guardado no crece con el tiempo. Las ocurrencias son
+    Transaction con uid "<regla>@<fecha original>" y la clave "regla".
+    """
+
+    def __init__(self, reglas=None):
+        self.reglas = reglas if reglas is not None else []
+        self.version = 0
+        self._cache = {}  # ym -> [Transaction]
+
+    def invalidar(self):
+        self._cache.clear()
+        self.version += 1
+
+    @staticmethod
+    def es_ocurrencia(item):
+        return item.get("regla") is not None
+
+    def regla(self, regla_id):
+        return next((r for r in self.reglas if r.get("id") == regla_id), None)
+
+    def agregar(self, datos):
+        regla = dict(datos, id=f"r{uuid.uuid4().hex[:12]}", excepciones={})
+        self.reglas.append(regla)
+        self.invalidar()
+        return regla
+
+    def eliminar(self, regla_id):
+        self.reglas[:] = [r for r in self.reglas if r.get("id") != regla_id]
+        self.invalidar()
+
+    def _ocurrencia(self, regla, original, exc):
+        data = {
+            "uid": f"{regla['id']}@{original}",
+            "nombre": regla.get("nombre", ""),
+            "monto": regla.get("monto", 0.0),
+            "fecha": original,
+            "categoria": regla.get("categoria", "OTHER"),
+            "metodo": regla.get("metodo", "CASH"),
+            "status": "PENDING",
+            "regla": regla["id"],
+        }
+        data.update((k, exc[k]) for k in CAMPOS_EXCEPCION if k in exc)
+        return Transaction(data)
+
+    def ocurrencias(self, ym):
+        """Ocurrencias (cualquier status) cuya fecha efectiva cae en `ym`."""
+        res = self._cache.get(ym)
+        if res is not None:
+            return res
+        res = []
+        for regla in self.reglas:
+            excs = regla.get("excepciones") or {}
+            for f in fechas_regla(regla, ym):
+                exc = excs.get(f, {})
+                if not exc.get("borrado") and str(exc.get("fecha", f))[:7] == ym:
+                    res.append(self._ocurrencia(regla, f, exc))
+            # Ocurrencias de otros meses movidas a este con una excepción
+            for f, exc in excs.items():
+                if (f[:7] != ym and str(exc.get("fecha", ""))[:7] == ym and not exc.get("borrado")
+                        and f in fechas_regla(regla, f[:7])):
+                    res.append(self._ocurrencia(regla, f, exc))
+        res.sort(key=ordinal_de)
+        self._cache[ym] = res
+        return res
+
+    def rango(self, desde, hasta):
+        """Ocurrencias con desde <= ordinal <= hasta (ordinales de date)."""
+        d, h = date.fromordinal(desde), date.fromordinal(hasta)
+        res = []
+        for k in range(d.year * 12 + d.month - 1, h.year * 12 + h.month):
+            res.extend(x for x in self.ocurrencias(f"{k // 12}-{k % 12 + 1:02d}") if desde <= ordinal_de(x) <= hasta)
+        return res
+
+    def excepcion(self, item, cambios):
+        """Guarda `cambios` como excepción de la ocurrencia `item`."""
+        regla = self.regla(item.get("regla"))
+        if regla is None:
+            return
+        original = str(item["uid"]).split("@", 1)[1]
+        exc = regla.setdefault("excepciones", {}).setdefault(original, {})
+        exc.update((k, v) for k, v in cambios.items() if k in CAMPOS_EXCEPCION or k == "borrado")
+        self.invalidar()
+
+    def borrar(self, item):
+        self.excepcion(item, {"borrado": True})
+
+
+class RecurringRepo:
+    """Repo que añade a otro (LedgerIndex, ColumnarLedger, SQLite) las
+    ocurrencias pendientes de las reglas recurrentes del mes consultado."""
+
+    def __init__(self, base, reglas):
+        self.base = base
+        self.reglas = reglas
+
+    def __getattr__(self, nombre):
+        return getattr(self.base, nombre)
+
+    def _pendientes(self, ym, status=None):
+        if status is not None:
+            return [x for x in self.reglas.ocurrencias(ym) if x.get("status", "PENDING") == status]
+        return [x for x in self.reglas.ocurrencias(ym) if x.get("status", "PENDING") != "PAID"]
+
+    def month_by_day(self, ym):
+        res = self.base.month_by_day(ym)
+        extra = self._pendientes(ym)
+        if not extra:
+            return res
+        res = {f: list(xs) for f, xs in res.items()}
+        for x in extra:
+            res.setdefault(x["fecha"], []).append(x)
+        return dict(sorted(res.items()))
+
+    def month_items(self, ym):
+        return [x for xs in self.month_by_day(ym).values() for x in xs]
+
+    def day_items(self, fecha):
+        return self.base.day_items(fecha) + [x for x in self._pendientes(fecha[:7]) if x["fecha"] == fecha]
+
+    def month_total(self, ym, status=None):
+        base = self.base.month_total(ym, status)
+        return base + sum(monto_de(x) for x in self._pendientes(ym, status))
+
+    def month_by_cat(self, ym, status=None):
+        res = dict(self.base.month_by_cat(ym, status))
+        for x in self._pendientes(ym, status):
+            cat = x.get("categoria", "OTHER")
+            res[cat] = res.get(cat, 0.0) + monto_de(x)
+        return res
+
+
+# ================== PROYECCIÓN DE SALDO ==================
+
+PROYECCION_MESES = 12  # horizonte por defecto (config "projection_months")
+DIA_DE_COBRO = 4       # día de cobro por defecto: viernes (date.weekday(); config "payday_weekday")
+DIAS_SEMANA = ("Lunes", "Martes", "Miércoles", "Jueves", "Viernes", "Sábado", "Domingo")
+
+
+def tramos_salario(historial):
+    """salary_history {fecha: salario semanal} -> (ordinales ordenados, salarios)."""
+    pares = sorted((_ordinal_fecha(str(f)), safe_float(v)) for f, v in (historial or {}).items())
+    pares = [(o, v) for o, v in pares if o >= 0]
+    return [o for o, _ in pares], [v for _, v in pares]
+
+
+def salario_vigente(tramos, o):
+    """Salario semanal vigente el día `o`: el último tramo con fecha <= o (0 antes del primero)."""
+    ordinales, salarios = tramos
+    i = bisect.bisect_right(ordinales, o) - 1
+    return salarios[i] if i >= 0 else 0.0
+
+
+def cobros_entre(desde, hasta, dia=DIA_DE_COBRO):
+    """Días de cobro (ordinales) entre dos ordinales, inclusive."""
+    return range(desde + (dia - date.fromordinal(desde).weekday()) % 7, hasta + 1, 7)
+
+
+def cobros_mes(y, m, dia=DIA_DE_COBRO):
+    """Días de cobro (ordinales) del mes."""
+    return list(cobros_entre(date(y, m, 1).toordinal(), date(y, m, calendar.monthrange(y, m)[1]).toordinal(), dia))
+
+
+def ingresos_entre(tramos, desde, hasta, dia=DIA_DE_COBRO):
+    """Salario cobrado entre dos ordinales (inclusive)."""
+    return sum(salario_vigente(tramos, o) for o in cobros_entre(desde, hasta, dia))
+
+
+class CashFlowProjection:
+    """Saldo diario proyectado desde el día 1 del mes actual.
+
+    Parte del saldo en cuenta (saldo_inicial = (importe, ordinal)) llevado
+    al día 1 con los cobros y lo PAID entre las dos fechas. Cada día suma
+    el salario si es día de cobro (salario_vigente) y resta: lo registrado en el ledger ese día (cualquier
+    status), las ocurrencias recurrentes y, desde hoy, lo que queda de cada
+    budget del mes repartido entre los días que faltan. SAVINGS no cuenta
+    como salida (es ahorro, como en BudgetTracker). Lo pendiente con fecha
+    anterior al inicio se resta el primer día. El saldo es la suma
+    acumulada (numpy si está; si no, listas: son pocos cientos de días) y
+    se cachea: cambiar la configuración o el horizonte lo recalcula entero,
+    una edición del ledger solo los meses tocados y la suma acumulada desde
+    el primero de ellos.
+    """
+
+    def __init__(self, index, series):
+        self.series = series
+        self._c = None        # último cálculo
+        self._sucios = set()  # códigos de mes editados desde entonces
+        index.subscribe(self._on_change)
+
+    def _on_change(self, op, item, antes):
+        if op == "reset":
+            self._c = None
+            return
+        if item is not None:
+            self._sucios.add(_codigo_mes(str(item.get("fecha", ""))[:7]))
+        if antes:
+            self._sucios.add(_codigo_mes(antes[3][:7]))
+
+    def proyectar(self, hoy, meses, tramos, presupuestos, reglas, clave, saldo_inicial=None, dia_cobro=DIA_DE_COBRO):
+        """(ordinal del día 0, saldo por día) de `meses` meses desde el actual.
+
+        `presupuestos(ym)` -> {cat: límite}; `reglas` es un RecurringRules;
+        `clave` cambia cuando cambian salario, budgets o reglas;
+        `saldo_inicial` es (importe, ordinal) o None (se parte de 0).
+        """
+        d = date.fromordinal(hoy)
+        actual = d.year * 12 + d.month - 1
+        completa = (hoy, meses, clave, saldo_inicial, dia_cobro)
+        c = self._c
+        if c is None or c["clave"] != completa:
+            c = self._c = self._calcular(hoy, actual, meses, tramos, presupuestos, reglas, dia_cobro)
+            c["inicial"] = self._inicial(c["base"], saldo_inicial, tramos, dia_cobro)
+            self._acumular(c, 0)
+            c["clave"] = completa
+            self._sucios.clear()
+        elif self._sucios:
+            sucios, self._sucios = self._sucios, set()
+            desde = len(c["neto"])
+            if any(k < actual for k in sucios):
+                c["atrasado"] = self._atrasado(c["base"])
+                desde = 0
+            inicial = self._inicial(c["base"], saldo_inicial, tramos, dia_cobro)
+            if inicial != c["inicial"]:
+                c["inicial"] = inicial
+                desde = 0
+            for k, (i0, i1) in c["meses"].items():
+                if k in sucios:
+                    c["gastos"][i0:i1] = self._gastos_mes(k, i0, i1, c["base"], hoy, presupuestos, reglas)
+                    desde = min(desde, i0)
+            self._acumular(c, desde)
+        return c["base"], c["saldo"]
+
+    def _inicial(self, base, saldo_inicial, tramos, dia_cobro):
+        # Saldo al empezar el día `base`: el saldo conocido se avanza (o se
+        # retrocede) con los cobros y lo pagado entre su fecha y el día 1
+        if saldo_inicial is None:
+            return 0.0
+        importe, o = saldo_inicial
+        if o < base:
+            pagado = self._salidas(o, base - 1, "PAID")
+            return importe + ingresos_entre(tramos, o, base - 1, dia_cobro) - pagado
+        pagado = self._salidas(base, o - 1, "PAID")
+        return importe - ingresos_entre(tramos, base, o - 1, dia_cobro) + pagado
+
+    def _salidas(self, desde, hasta, status=None):
+        # Gasto entre dos ordinales sin lo movido a SAVINGS
+        a, b = date.fromordinal(max(desde, 1)).isoformat(), date.fromordinal(hasta).isoformat()
+        return self.series.total(a, b, status) - self.series.total(a, b, status, AHORRO_CATEGORIA)
+
+    def _atrasado(self, base):
+        # Pendiente con fecha anterior al inicio: todavía hay que pagarlo
+        return self._salidas(1, base - 1)
+
+    def _gastos_mes(self, k, i0, i1, base, hoy, presupuestos, reglas):
+        y, m = k // 12, k % 12 + 1
+        ym = f"{y}-{m:02d}"
+        gastos = list(map(float.__sub__, self.series.diario(base + i0, base + i1 - 1, "ALL"),
+                          self.series.diario(base + i0, base + i1 - 1, "ALL", AHORRO_CATEGORIA)))
+        por_cat = {}
+        for x in reglas.ocurrencias(ym):
+            cat = x.get("categoria", "OTHER")
+            if cat == AHORRO_CATEGORIA:
+                continue
+            gastos[ordinal_de(x) - base - i0] += monto_de(x)
+            por_cat[cat] = por_cat.get(cat, 0.0) + monto_de(x)
+
+        # Lo que falta de cada budget se reparte entre los días que quedan del mes
+        desde = max(i0, hoy - base)
+        if desde < i1:
+            resto = 0.0
+            for cat, limite in (presupuestos(ym) or {}).items():
+                if cat == AHORRO_CATEGORIA:
+                    continue
+                usado = self.series.month_total(ym, "ALL", cat) + por_cat.get(cat, 0.0)
+                resto += max(0.0, safe_float(limite, 0.0) - usado)
+            for i in range(desde - i0, i1 - i0):
+                gastos[i] += resto / (i1 - desde)
+        return gastos
+
+    @staticmethod
+    def _vector(n):
+        return np.zeros(n) if numpy_disponible() else [0.0] * n
+
+    def _calcular(self, hoy, actual, meses, tramos, presupuestos, reglas, dia_cobro):
+        # Deja neto y saldo sin calcular: proyectar añade el saldo inicial y acumula
+        base = date(actual // 12, actual % 12 + 1, 1).toordinal()
+        fin = actual + meses
+        n = date(fin // 12, fin % 12 + 1, 1).toordinal() - base
+
+        ingresos = self._vector(n)
+        for o in cobros_entre(base, base + n - 1, dia_cobro):
+            ingresos[o - base] = salario_vigente(tramos, o)
+
+        c = {"base": base, "ingresos": ingresos, "gastos": self._vector(n), "meses": {}, "inicial": 0.0,
+             "atrasado": self._atrasado(base), "neto": self._vector(n), "saldo": self._vector(n)}
+        for k in range(actual, fin):
+            i0 = date(k // 12, k % 12 + 1, 1).toordinal() - base
+            i1 = i0 + calendar.monthrange(k // 12, k % 12 + 1)[1]
+            c["meses"][k] = (i0, i1)
+            c["gastos"][i0:i1] = self._gastos_mes(k, i0, i1, base, hoy, presupuestos, reglas)
+        return c
+
+    @staticmethod
+    def _acumular(c, desde):
+        """Rehace neto y saldo a partir del día `desde`."""
+        if desde >= len(c["neto"]):
+            return
+        neto, saldo = c["neto"], c["saldo"]
+        previo = saldo[desde - 1] if desde else c["inicial"]
+        if np is not None and isinstance(neto, np.ndarray):
+            neto[desde:] = c["ingresos"][desde:] - c["gastos"][desde:]
+            if desde == 0:
+                neto[0] -= c["atrasado"]
+            saldo[desde:] = previo + np.cumsum(neto[desde:])
+            return
+        for i in range(desde, len(neto)):
+            neto[i] = c["ingresos"][i] - c["gastos"][i] - (c["atrasado"] if i == 0 else 0.0)
+            previo = saldo[i] = previo + neto[i]
+
+
+# ================== PRESUPUESTOS ==================
+
+BUDGET_UMBRALES = (0.7, 1.0)  # avisos por defecto (config "budget_alerts")
+
+
+def umbrales_budget(valores):
+    """budget_alerts de la config -> fracciones > 0 ordenadas (por defecto si no queda ninguna)."""
+    if not isinstance(valores, (list, tuple)):
+        return list(BUDGET_UMBRALES)
+    return sorted(u for u in map(safe_float, valores) if u > 0) or list(BUDGET_UMBRALES)
+
+
+class BudgetTracker:
+    """Gasto acumulado por (mes, categoría) y avisos de umbral de los budgets.
+
+    Cuenta lo pendiente (status distinto de PAID, como el resto de vistas
+    del mes) fuera de SAVINGS, que es ahorro y no gasto. Se mantiene con
+    las notificaciones del LedgerIndex; las ocurrencias recurrentes entran
+    al consultar. Los límites salen de `limites(ym)` -> {cat: límite}. Cuando un alta o una
+    edición lleva una categoría por encima de un umbral (fracción del
+    límite) se avisa a los suscriptores con fn(ym, cat, umbral, gastado,
+    límite); con `avisos` en False (cargas) no se avisa.
+    """
+
+    def __init__(self, index, limites, reglas=None, umbrales=BUDGET_UMBRALES):
+        self.index = index
+        self.limites = limites
+        self.reglas = reglas
+        self.umbrales = sorted(umbrales)
+        self.avisos = True
+        self._gasto = {}  # ym -> {cat: [n, total]} de lo pendiente
+        self._listeners = []
+        index.subscribe(self._on_change)
+        self._rebuild()
+
+    def subscribe(self, fn):
+        self._listeners.append(fn)
+
+    @staticmethod
+    def cuenta(cat, status):
+        """¿Consume budget un registro con esta categoría y status?"""
+        return status != "PAID" and cat != AHORRO_CATEGORIA
+
+    # ---- mantenimiento ----
+
+    def _rebuild(self):
+        self._gasto = {}
+        for e in self.index.entries():
+            self._aplicar(e, +1)
+
+    def _sumar(self, ym, cat, monto, signo):
+        mes = self._gasto.setdefault(ym, {})
+        acc = mes.get(cat)
+        if acc is None:
+            acc = mes[cat] = [0, 0.0]
+        acc[0] += signo
+        acc[1] += signo * monto
+        if acc[0] <= 0:
+            # Sin registros: se descarta el residuo de coma flotante
+            del mes[cat]
+            if not mes:
+                del self._gasto[ym]
+
+    def _aplicar(self, e, signo):
+        tipo, x, ym, fecha, cat, status, monto = e
+        if ym and self.cuenta(cat, status):
+            self._sumar(ym, cat, monto, signo)
+
+    def _on_change(self, op, item, antes):
+        if op == "reset":
+            self._rebuild()
+            return
+        nueva = self.index.entry(item["uid"]) if op in ("add", "upd") else None
+        claves = {(e[2], e[4]) for e in (antes, nueva) if e and e[2]}
+        previo = {k: self.gastado(*k) for k in claves}
+        if antes:
+            self._aplicar(antes, -1)
+        if nueva is not None:
+            self._aplicar(nueva, +1)
+        if self.avisos and op != "del":
+            for k in claves:
+                self._avisar(k, previo[k])
+
+    def _avisar(self, k, previo):
+        ym, cat = k
+        limite = safe_float(self.limites(ym).get(cat), 0.0)
+        if limite <= 0:
+            return
+        ahora = self.gastado(ym, cat)
+        cruzados = [u for u in self.umbrales if previo < u * limite <= ahora]
+        if cruzados:
+            for fn in list(self._listeners):
+                fn(ym, cat, cruzados[-1], ahora, limite)
+
+    # ---- consultas ----
+
+    def _recurrentes(self, ym):
+        res = {}
+        if self.reglas is not None:
+            for x in self.reglas.ocurrencias(ym):
+                cat = x.get("categoria", "OTHER")
+                if self.cuenta(cat, x.get("status")):
+                    res[cat] = res.get(cat, 0.0) + monto_de(x)
+        return res
+
+    def gastado(self, ym, cat):
+        acc = self._gasto.get(ym, {}).get(cat)
+        return (acc[1] if acc else 0.0) + self._recurrentes(ym).get(cat, 0.0)
+
+    def por_categoria(self, ym):
+        """{cat: gastado} del mes, con las ocurrencias recurrentes."""
+        res = self._recurrentes(ym)
+        for cat, acc in self._gasto.get(ym, {}).items():
+            res[cat] = res.get(cat, 0.0) + acc[1]
+        return res
+
+    def uso(self, ym):
+        """(gastado por categoría, fracción global de los budgets del mes o -1 sin budgets)."""
+        gasto = self.por_categoria(ym)
+        total_limite = total_gasto = 0.0
+        for cat, limite in self.limites(ym).items():
+            limite = safe_float(limite, 0.0)
+            if limite > 0 and cat != AHORRO_CATEGORIA:
+                total_limite += limite
+                total_gasto += gasto.get(cat, 0.0)
+        return gasto, (total_gasto / total_limite if total_limite > 0 else -1.0)
+
+
+# ================== METAS DE AHORRO ==================
+
+AHORRO_CATEGORIA = "SAVINGS"
+AHORRO_ETIQUETA = "AHORRO"  # abrir_ventana_ahorro guarda "AHORRO - <concepto>"
+
+
+def concepto_ahorro(nombre):
+    """Nombre normalizado sin la etiqueta AHORRO: lo que se compara con el prefijo de una meta."""
+    n = normalize_name(nombre)
+    if n == AHORRO_ETIQUETA or n.startswith(AHORRO_ETIQUETA + " "):
+        return n[len(AHORRO_ETIQUETA):].lstrip()
+    return n
+
+
+def meses_restantes(hoy, limite):
+    """Meses para aportar hasta `limite`, contando el actual (mínimo 1)."""
+    return max(1, (limite.year - hoy.year) * 12 + limite.month - hoy.month + 1)
+
+
+class SavingsTracker:
+    """Ahorro acumulado (registros PAID): total de SAVINGS y por meta.
+
+    Una meta es {"id", "nombre", "meta", "fecha_limite", "categoria",
+    "prefijo"} y cuenta los registros PAID de su categoría (SAVINGS por
+    defecto) cuyo concepto empieza por `prefijo` (vacío = todos). Los
+    totales se mantienen con las notificaciones del LedgerIndex; de cada
+    registro se guarda a qué metas sumó, así una edición resta exactamente
+    lo que había sumado. El archivo histórico (todo PAID) y el recálculo
+    completo solo entran al abrir el archivo o cambiar las metas.
+    """
+
+    def __init__(self, index, metas=None):
+        self.index = index
+        self.metas = metas if metas is not None else []
+        self.archivo = None
+        self.total = 0.0
+        self._por_meta = {}  # id -> [total, {ym: total}]
+        self._aportes = {}   # uid -> (cat, ym, monto, ids de metas)
+        index.subscribe(self._on_change)
+        self._rebuild()
+
+    def set_metas(self, metas):
+        self.metas = metas
+        self._rebuild()
+
+    def set_archivo(self, archivo):
+        self.archivo = archivo
+        self._rebuild()
+
+    # ---- mantenimiento ----
+
+    def _metas_de(self, cat, nombre):
+        res = []
+        for meta in self.metas:
+            if cat != (meta.get("categoria") or AHORRO_CATEGORIA):
+                continue
+            prefijo = normalize_name(meta.get("prefijo", ""))
+            if not prefijo or concepto_ahorro(nombre).startswith(prefijo):
+                res.append(meta["id"])
+        return tuple(res)
+
+    def _sumar(self, aporte, signo):
+        cat, ym, monto, ids = aporte
+        if cat == AHORRO_CATEGORIA:
+            self.total += signo * monto
+        for i in ids:
+            acc = self._por_meta.setdefault(i, [0.0, {}])
+            acc[0] += signo * monto
+            acc[1][ym] = acc[1].get(ym, 0.0) + signo * monto
+
+    def _contar(self, uid, x, ym, cat, status, monto):
+        if status != "PAID":
+            return
+        ids = self._metas_de(cat, x.get("item") or x.get("nombre") or "")
+        if cat != AHORRO_CATEGORIA and not ids:
+            return
+        aporte = (cat, ym, monto, ids)
+        if uid is not None:
+            self._aportes[uid] = aporte
+        self._sumar(aporte, +1)
+
+    def _rebuild(self):
+        self.total = 0.0
+        self._por_meta = {}
+        self._aportes = {}
+        for tipo, x, ym, fecha, cat, status, monto in self.index.entries():
+            self._contar(x["uid"], x, ym, cat, status, monto)
+        if self.archivo is not None:
+            cats = {AHORRO_CATEGORIA} | {m.get("categoria") or AHORRO_CATEGORIA for m in self.metas}
+            for cat in cats:
+                for x in self.archivo.cat_items(cat):
+                    self._contar(None, x, ym_from_date_str(str(x.get("fecha", ""))), cat, "PAID", monto_de(x))
+
+    def _on_change(self, op, item, antes):
+        if op == "reset":
+            self._rebuild()
+            return
+        previo = self._aportes.pop(item.get("uid"), None)
+        if previo is not None:
+            self._sumar(previo, -1)
+        if op in ("add", "upd"):
+            e = self.index.entry(item["uid"])
+            if e is not None:
+                tipo, x, ym, fecha, cat, status, monto = e
+                self._contar(item["uid"], x, ym, cat, status, monto)
+
+    # ---- consultas ----
+
+    def ahorrado(self, meta_id):
+        acc = self._por_meta.get(meta_id)
+        return acc[0] if acc else 0.0
+
+    def progreso(self, meta, hoy):
+        """Avance de `meta` a la fecha `hoy`: dict con ahorrado, fraccion, falta,
+        este_mes y mensual (aporte mensual necesario; None sin fecha límite)."""
+        acc = self._por_meta.get(meta["id"], [0.0, {}])
+        objetivo = safe_float(meta.get("meta"), 0.0)
+        falta = max(0.0, objetivo - acc[0])
+        limite = parse_date_ymd(str(meta.get("fecha_limite") or ""))
+        return {
+            "ahorrado": acc[0],
+            "fraccion": acc[0] / objetivo if objetivo > 0 else 0.0,
+            "falta": falta,
+            "este_mes": acc[1].get(hoy.strftime("%Y-%m"), 0.0),
+            "mensual": falta / meses_restantes(hoy, limite) if limite else None,
+        }
+
+
+# ================== BÚSQUEDA ==================
+
+# Campos indexados por el buscador y su peso en el ranking
+SEARCH_FIELDS = (("nombre", 3), ("item", 3), ("categoria", 2), ("metodo", 1), ("fecha", 1))
+SEARCH_DEBOUNCE_MS = 60
+
+
+@lru_cache(maxsize=8192)
+def search_tokens(text: str) -> tuple:
+    # Nombres, categorías y fechas se repiten mucho: se normaliza cada texto una vez
+    return tuple(normalize_name(text).split())
+
+
+class SearchIndex:
+    """Índice invertido token -> {uid: peso} para el buscador.
+
+    Los tokens salen de normalize_name (sin acentos ni puntuación; las fechas
+    quedan como 20250302, así que "2025-03" busca por prefijo el mes). Cada
+    término de la consulta se compara por prefijo contra un vocabulario
+    ordenado y los términos se combinan con AND. Se mantiene al día con las
+    notificaciones del LedgerIndex.
+    """
+
+    def __init__(self, ledger):
+        self.ledger = ledger
+        self._postings = {}  # token -> {uid: peso}
+        self._vocab = []     # tokens ordenados, para rangos de prefijo
+        self._docs = {}      # uid -> {token: peso}
+        self._stale = True
+        ledger.subscribe(self._on_change)
+
+    @staticmethod
+    def _tokens(item):
+        toks = {}
+        for campo, peso in SEARCH_FIELDS:
+            for t in search_tokens(str(item.get(campo, "") or "")):
+                toks[t] = max(toks.get(t, 0), peso)
+        return toks
+
+    def _on_change(self, op, item, antes):
+        if op == "reset":
+            # Reconstrucción perezosa en la siguiente búsqueda
+            self._stale = True
+            return
+        if self._stale:
+            return
+        if op in ("upd", "del"):
+            self._quitar(item["uid"])
+        if op in ("add", "upd"):
+            self._indexar(item)
+
+    def _indexar(self, item, ordenar=True):
+        uid = item["uid"]
+        toks = self._tokens(item)
+        self._docs[uid] = toks
+        for t, peso in toks.items():
+            post = self._postings.get(t)
+            if post is None:
+                post = self._postings[t] = {}
+                if ordenar:
+                    bisect.insort(self._vocab, t)
+            post[uid] = peso
+
+    def _quitar(self, uid):
+        for t in self._docs.pop(uid, {}):
+            post = self._postings.get(t)
+            if post is None:
+                continue
+            post.pop(uid, None)
+            if not post:
+                del self._postings[t]
+                i = bisect.bisect_left(self._vocab, t)
+                if i < len(self._vocab) and self._vocab[i] == t:
+                    del self._vocab[i]
+
+    def rebuild(self):
+        self._postings.clear()
+        self._docs.clear()
+        for item in self.ledger.all_items():
+            self._indexar(item, ordenar=False)
+        self._vocab = sorted(self._postings)
+        self._stale = False
+
+    def _con_prefijo(self, term):
+        i = bisect.bisect_left(self._vocab, term)
+        while i < len(self._vocab) and self._vocab[i].startswith(term):
+            yield self._vocab[i]
+            i += 1
+
+    def match(self, query):
+        """uid -> puntuación de los registros que contienen todos los términos."""
+        if self._stale:
+            self.rebuild()
+        scores = None
+        for term in search_tokens(query):
+            hits = {}
+            for tok in self._con_prefijo(term):
+                bonus = 2 if tok == term else 1
+                for uid, peso in self._postings[tok].items():
+                    if peso * bonus > hits.get(uid, 0):
+                        hits[uid] = peso * bonus
+            if scores is None:
+                scores = hits
+            else:
+                scores = {uid: scores[uid] + sc for uid, sc in hits.items() if uid in scores}
+            if not scores:
+                return {}
+        return scores or {}
+
+    def search(self, query):
+        """Registros ordenados por relevancia y, a igualdad, del más reciente al más antiguo."""
+        scores = self.match(query)
+        items = [x for x in map(self.ledger.get, scores) if x is not None]
+        items.sort(key=lambda x: str(x.get("fecha", "")), reverse=True)
+        items.sort(key=lambda x: scores[x["uid"]], reverse=True)
+        return items
+
+    def query(self, text):
+        """Ejecuta una consulta con filtros (ver parse_search_query).
+        Devuelve (registros, total de sus montos)."""
+        q = parse_search_query(text)
+
+        # 1) Búsquedas indexadas: categoría, texto libre y rango de fechas
+        cands = None
+        if q.cats:
+            cands = {}
+            for cat in self.ledger.categories():
+                if any(cat.upper().startswith(c) for c in q.cats):
+                    cands.update((x["uid"], x) for x in self.ledger.cat_items(cat))
+
+        scores = None
+        if q.texto:
+            scores = self.match(q.texto)
+            if cands is None:
+                cands = {uid: self.ledger.get(uid) for uid in scores}
+            else:
+                cands = {uid: x for uid, x in cands.items() if uid in scores}
+
+        rango_pendiente = bool(q.desde or q.hasta)
+        if rango_pendiente and cands is None:
+            cands = {x["uid"]: x for x in self.ledger.range_items(q.desde, q.hasta)}
+            rango_pendiente = False
+
+        if cands is None:
+            cands = {x["uid"]: x for x in self.ledger.all_items()}
+
+        # 2) Comprobaciones por registro sobre el conjunto ya reducido
+        items = [x for x in cands.values() if x is not None and q.accepts(x, rango_pendiente)]
+        items.sort(key=lambda x: str(x.get("fecha", "")), reverse=True)
+        if scores:
+            items.sort(key=lambda x: scores.get(x["uid"], 0), reverse=True)
+        total = sum(monto_de(x) for x in items)
+        return items, total
+
+
+# Claves admitidas en el buscador y sus alias
+QUERY_KEYS = {
+    "cat": "cat", "categoria": "cat", "category": "cat",
+    "metodo": "metodo", "met": "metodo", "method": "metodo",
+    "fecha": "fecha", "date": "fecha",
+    "status": "status", "estado": "status",
+    "tipo": "tipo", "type": "tipo",
+}
+QUERY_STATUS = {"PENDING": "PENDING", "PENDIENTE": "PENDING", "PAID": "PAID", "PAGADO": "PAID"}
+QUERY_MONTO_RE = re.compile(r"^(?:monto|amount)(>=|<=|>|<|=|:)(-?\d+(?:\.\d+)?)$", re.IGNORECASE)
+
+
+class SearchQuery:
+    """Consulta del buscador ya analizada: texto libre + filtros."""
+
+    def __init__(self):
+        self.texto = ""
+        self.cats = []
+        self.metodos = []
+        self.status = set()
+        self.tipos = set()
+        self.montos = []  # [(op, valor)]
+        self.desde = ""
+        self.hasta = ""
+
+    def particiones(self, meses):
+        """Particiones de `meses` que pueden tener resultados según fecha:
+        None si la consulta no acota fechas. "otros" (fechas inválidas)
+        siempre entra."""
+        if not (self.desde or self.hasta):
+            return None
+        return [p for p in meses if p == "otros" or (
+            (not self.desde or p + "~" >= self.desde) and (not self.hasta or p <= self.hasta + "~"))]
+
+    def accepts(self, x, con_rango=True):
+        if self.metodos:
+            metodo = str(x.get("metodo", "")).upper()
+            if not any(metodo.startswith(m) for m in self.metodos):
+                return False
+        if self.status and x.get("status", "PENDING") not in self.status:
+            return False
+        if self.tipos and ("pago" if "nombre" in x else "compra") not in self.tipos:
+            return False
+        if self.montos:
+            monto = monto_de(x)
+            for op, val in self.montos:
+                if not {
+                    ">": monto > val, "<": monto < val, ">=": monto >= val,
+                    "<=": monto <= val, "=": monto == val, ":": monto == val,
+                }[op]:
+                    return False
+        if con_rango and (self.desde or self.hasta):
+            fecha = str(x.get("fecha", ""))
+            if fecha < self.desde or fecha > ((self.hasta + "~") if self.hasta else "~"):
+                return False
+        return True
+
+
+def _filtro_fecha(q, val):
+    if ".." in val:
+        q.desde, q.hasta = (v.strip() for v in val.split("..", 1))
+    else:
+        q.desde = q.hasta = val
+
+
+# Campo de QUERY_KEYS -> cómo guarda su valor en la SearchQuery
+QUERY_FILTROS = {
+    "cat": lambda q, val: q.cats.append(val.upper()),
+    "metodo": lambda q, val: q.metodos.append(val.upper()),
+    "status": lambda q, val: q.status.add(QUERY_STATUS.get(val.upper(), val.upper())),
+    "tipo": lambda q, val: q.tipos.add(val.lower().rstrip("s")),
+    "fecha": _filtro_fecha,
+}
+
+
+def _aplicar_filtro(q, parte):
+    """Añade a `q` el filtro de `parte`; False si es texto libre."""
+    m = QUERY_MONTO_RE.match(parte)
+    if m:
+        q.montos.append((m.group(1), float(m.group(2))))
+        return True
+    key, sep, val = parte.partition(":")
+    campo = QUERY_KEYS.get(key.lower()) if sep else None
+    if not campo or not val:
+        return False
+    QUERY_FILTROS[campo](q, val.replace("_", " ").strip())
+    return True
+
+
+def parse_search_query(text: str) -> SearchQuery:
+    """Analiza el texto del buscador.
+
+    Filtros: cat:RESTAURANT, metodo:CASH, monto>500 (>, <, >=, <=, =),
+    fecha:2025-03..2025-06 (extremos opcionales; fecha:2025-03 = el mes),
+    status:PENDING y tipo:pago. Los valores con espacios van entre comillas
+    (cat:"CREDIT CARD") o con guion bajo (cat:CREDIT_CARD). El resto es texto libre.
+    """
+    q = SearchQuery()
+    try:
+        partes = shlex.split(text or "")
+    except ValueError:
+        partes = (text or "").split()
+    q.texto = " ".join(parte for parte in partes if not _aplicar_filtro(q, parte))
+    return q
+
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS registros (
+    uid       TEXT PRIMARY KEY,
+    tipo      TEXT NOT NULL,
+    fecha     TEXT NOT NULL DEFAULT '',
+    mes       TEXT NOT NULL DEFAULT '',
+    categoria TEXT NOT NULL DEFAULT 'OTHER',
+    status    TEXT NOT NULL DEFAULT 'PENDING',
+    monto     REAL NOT NULL DEFAULT 0,
+    data      TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_registros_fecha ON registros(fecha, status);
+CREATE INDEX IF NOT EXISTS ix_registros_mes ON registros(mes, status, categoria, monto);
+CREATE INDEX IF NOT EXISTS ix_registros_categoria ON registros(categoria);
+CREATE INDEX IF NOT EXISTS ix_registros_status ON registros(status);
+"""
+
+
+class SqliteLedgerStore:
+    """Ledger en SQLite (stdlib): una fila por registro con las columnas
+    consultables indexadas y el JSON original en `data`.
+
+    Hace de store (load/save por cambios) y de repo: los totales del mes,
+    la lista del día y las sumas por categoría son consultas agregadas.
+    Las listas devuelven los mismos dicts que tiene la app, vía `resolver(uid)`.
+
+    Los cambios sueltos se aplican en el hilo de Tk (stage) y el hilo de
+    guardado solo hace el commit; las reescrituras completas (restaurar,
+    vaciar) las hace el hilo. Mientras haya trabajos reservados sin escribir
+    la base está desfasada: stage() no aplica nada (los cambios viajan en
+    la cola, detrás de la reescritura) y las consultas van a `respaldo`.
+    """
+
+    parcial = False
+    lee_bloques = True  # bloques() lee los de backup de la base
+
+    def __init__(self, ruta_db, ruta_json=None):
+        self.ruta = ruta_db
+        self.ruta_json = ruta_json
+        self.resolver = None
+        self.respaldo = None  # repo en memoria (LedgerIndex) para cuando la base está desfasada
+        self._reservados = 0  # trabajos con cambios sin aplicar (hilo de Tk)
+        self._escritos = 0    # último de ellos ya escrito (hilo de guardado)
+        self.cuarentena = []
+        # La conexión se comparte con el hilo de WriteBehind: todo acceso pasa por el lock
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(ruta_db, check_same_thread=False)
+        self.conn.executescript(SQLITE_SCHEMA)
+
+    @staticmethod
+    def _fila(tipo, x):
+        fecha = str(x.get("fecha", "") or "")
+        return (
+            x.get("uid"), tipo, fecha, ym_from_date_str(fecha),
+            x.get("categoria", "OTHER") or "OTHER",
+            x.get("status", "PENDING") or "PENDING",
+            safe_float(x.get("monto", 0.0)),
+            json.dumps(x, ensure_ascii=False, default=json_default),
+        )
+
+    def _upsert(self, filas):
+        self.conn.executemany(
+            "INSERT INTO registros (uid, tipo, fecha, mes, categoria, status, monto, data) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(uid) DO UPDATE SET tipo=excluded.tipo, fecha=excluded.fecha, mes=excluded.mes, "
+            "categoria=excluded.categoria, status=excluded.status, monto=excluded.monto, data=excluded.data",
+            filas,
+        )
+
+    def load(self):
+        with self.lock:
+            self.cuarentena = []
+            vacio = self.conn.execute("SELECT COUNT(*) FROM registros").fetchone()[0] == 0
+            if vacio and self.ruta_json and os.path.exists(self.ruta_json):
+                self.import_json(self.ruta_json)
+
+            pagos, compras = [], []
+            for uid, tipo, data in self.conn.execute("SELECT uid, tipo, data FROM registros ORDER BY rowid").fetchall():
+                lista = "pagos" if tipo == "pago" else "compras"
+                try:
+                    x = json.loads(data)
+                    motivo = motivo_invalido(lista, x)
+                except ValueError as e:
+                    x, motivo = None, str(e)
+                if motivo is None:
+                    (pagos if tipo == "pago" else compras).append(normalizar_registro(lista, x))
+                else:
+                    self.cuarentena.append({"lista": lista, "uid": uid, "motivo": motivo, "texto": data})
+            return pagos, compras
+
+    def _aplicar(self, pagos, compras, cambios):
+        if cambios is None:
+            self.conn.execute("DELETE FROM registros")
+            self._upsert([self._fila("pago", x) for x in pagos] + [self._fila("compra", x) for x in compras])
+            return
+        for rec in cambios:
+            op = rec.get("op")
+            if op == "reset":
+                self.conn.execute("DELETE FROM registros")
+            elif op == "del":
+                self.conn.execute("DELETE FROM registros WHERE uid = ?", (rec.get("uid"),))
+            elif op in ("add", "upd"):
+                self._upsert([self._fila(rec.get("tipo"), rec.get("data", {}))])
+
+    def save(self, pagos, compras, cambios):
+        with self.lock, self.conn:
+            self._aplicar(pagos, compras, cambios)
+
+    def stage(self, cambios):
+        # Sin commit: las consultas de esta misma conexión ya ven las filas
+        # nuevas y el hilo de guardado solo hace el commit (save con [])
+        with self.lock:
+            if self.desfasada():
+                return False
+            self._aplicar(None, None, cambios)
+        return True
+
+    def reservar(self):
+        with self.lock:
+            self._reservados += 1
+            return self._reservados
+
+    def confirmar(self, numero):
+        with self.lock:
+            self._escritos = max(self._escritos, numero)
+
+    def desfasada(self):
+        return self._escritos < self._reservados
+
+    def needs_snapshot(self, cambios):
+        return False
+
+    def bloques(self, claves=None):
+        """Bloques de backup {tipo:YYYY-MM: registros} leídos de la base.
+        claves=None: todo el ledger."""
+        sql = "SELECT tipo, mes, data FROM registros"
+        params = ()
+        if claves is not None:
+            meses = sorted({k.split(":", 1)[1] for k in claves})
+            sql += f" WHERE mes IN ({', '.join('?' * len(meses))})"
+            params = meses
+        with self.lock:
+            filas = self.conn.execute(sql + " ORDER BY rowid", params).fetchall()
+        res = {}
+        for tipo, mes, data in filas:
+            k = f"{tipo}:{mes}"
+            if claves is None or k in claves:
+                try:
+                    res.setdefault(k, []).append(json.loads(data))
+                except ValueError:
+                    continue
+        return res
+
+    def needs_compaction(self):
+        return False
+
+    def import_json(self, ruta_json):
+        """Migración de una sola vez desde finanzas_v4.json."""
+        origen = JsonLedgerStore(ruta_json)
+        pagos, compras = origen.load()
+        self.cuarentena.extend(origen.cuarentena)
+        for x in pagos + compras:
+            x.setdefault("uid", str(uuid.uuid4()))
+        self.save(pagos, compras, None)
+        return len(pagos) + len(compras)
+
+    def export_json(self, ruta_json):
+        pagos, compras = self.load()
+        escribir_json_atomico(ruta_json, {"pagos": pagos, "compras": compras})
+        return len(pagos) + len(compras)
+
+    # ---- repo ----
+
+    def _items(self, where, params):
+        sql = f"SELECT uid FROM registros WHERE {where} AND status != 'PAID' ORDER BY rowid"
+        with self.lock:
+            uids = self.conn.execute(sql, params).fetchall()
+        res = []
+        for (uid,) in uids:
+            x = self.resolver(uid) if self.resolver else None
+            if x is not None:
+                res.append(x)
+        return res
+
+    def month_items(self, ym):
+        if self.desfasada():
+            return self.respaldo.month_items(ym)
+        return self._items("mes = ?", (ym,))
+
+    def month_by_day(self, ym):
+        if self.desfasada():
+            return self.respaldo.month_by_day(ym)
+        res = {}
+        for x in self.month_items(ym):
+            res.setdefault(x.get("fecha"), []).append(x)
+        return dict(sorted(res.items()))
+
+    def day_items(self, fecha):
+        if self.desfasada():
+            return self.respaldo.day_items(fecha)
+        return self._items("fecha = ?", (fecha,))
+
+    @staticmethod
+    def _filtro_status(status):
+        # Igual que LedgerIndex: None = todo lo no pagado
+        if status is None:
+            return "status != 'PAID'", ()
+        return "status = ?", (status,)
+
+    def month_total(self, ym, status=None):
+        if self.desfasada():
+            return self.respaldo.month_total(ym, status)
+        where, params = self._filtro_status(status)
+        with self.lock:
+            row = self.conn.execute(
+                f"SELECT COALESCE(SUM(monto), 0) FROM registros WHERE mes = ? AND {where}", (ym, *params)
+            ).fetchone()
+        return float(row[0])
+
+    def month_by_cat(self, ym, status=None):
+        if self.desfasada():
+            return self.respaldo.month_by_cat(ym, status)
+        where, params = self._filtro_status(status)
+        with self.lock:
+            rows = self.conn.execute(
+                f"SELECT categoria, SUM(monto) FROM registros WHERE mes = ? AND {where} GROUP BY categoria", (ym, *params)
+            ).fetchall()
+        return {cat: float(total) for cat, total in rows}
+
+
+# ================== BACKUPS ==================
+
+# Cuántos puntos conservar: los N últimos y el más reciente de cada hora/día/mes
+BACKUP_RETENTION_DEFAULT = {"recent": 10, "hourly": 24, "daily": 30, "monthly": 12}
+BACKUP_BUCKETS = (("hourly", "%Y%m%d%H"), ("daily", "%Y%m%d"), ("monthly", "%Y%m"))
+# Bloque del manifiesto con el archivo histórico (el fichero tal cual)
+BACKUP_CLAVE_ARCHIVO = "archivo"
+
+
+class BackupStore:
+    """Backups deduplicados por contenido.
+
+    El ledger se parte en bloques (tipo, YYYY-MM); cada bloque se guarda una
+    sola vez en objects/ con su sha256 como nombre y cada punto de restauración
+    es un manifiesto pequeño en manifests/ con los hashes de sus bloques. El
+    archivo histórico va como un bloque más (BACKUP_CLAVE_ARCHIVO).
+    """
+
+    def __init__(self, base_dir, retention=None):
+        self.base_dir = base_dir
+        self.obj_dir = os.path.join(base_dir, "objects")
+        self.man_dir = os.path.join(base_dir, "manifests")
+        self.retention = dict(BACKUP_RETENTION_DEFAULT, **(retention or {}))
+        self._manifiestos = None  # nombre -> {clave: hash}
+
+    @staticmethod
+    def clave(tipo, item):
+        return f"{tipo}:{ym_from_date_str(str(item.get('fecha', '')))}"
+
+    @staticmethod
+    def agrupar(pagos, compras, solo=None):
+        grupos = {}
+        for tipo, lst in (("pago", pagos), ("compra", compras)):
+            for x in lst:
+                k = BackupStore.clave(tipo, x)
+                if solo is None or k in solo:
+                    grupos.setdefault(k, []).append(x)
+        return grupos
+
+    def _obj_path(self, h, clave=None):
+        ext = ".archivo" if clave == BACKUP_CLAVE_ARCHIVO else ".json"
+        return os.path.join(self.obj_dir, h[:2], h + ext)
+
+    def _put(self, registros):
+        blob = json.dumps(
+            registros, ensure_ascii=False, sort_keys=True, separators=(",", ":"), default=json_default
+        ).encode("utf-8")
+        h = hashlib.sha256(blob).hexdigest()
+        ruta = self._obj_path(h)
+        if not os.path.exists(ruta):
+            os.makedirs(os.path.dirname(ruta), exist_ok=True)
+            with open(ruta + ".tmp", "wb") as f:
+                f.write(blob)
+            os.replace(ruta + ".tmp", ruta)
+        return h
+
+    def _put_archivo(self, ruta):
+        """Copia el archivo histórico a objects/ (una sola lectura: se hashea
+        mientras se copia). None si no existe o está vacío."""
+        os.makedirs(self.obj_dir, exist_ok=True)
+        tmp = os.path.join(self.obj_dir, f"archivo-{threading.get_ident()}.tmp")
+        h = hashlib.sha256()
+        try:
+            with open(ruta, "rb") as f, open(tmp, "wb") as out:
+                for bloque in iter(lambda: f.read(1 << 20), b""):
+                    h.update(bloque)
+                    out.write(bloque)
+        except FileNotFoundError:
+            return None
+        if not os.path.getsize(tmp):
+            os.remove(tmp)
+            return None
+        h = h.hexdigest()
+        destino = self._obj_path(h, BACKUP_CLAVE_ARCHIVO)
+        if os.path.exists(destino):
+            os.remove(tmp)
+        else:
+            os.makedirs(os.path.dirname(destino), exist_ok=True)
+            os.replace(tmp, destino)
+        return h
+
+    def _cargar_manifiestos(self):
+        if self._manifiestos is None:
+            self._manifiestos = {}
+            if os.path.isdir(self.man_dir):
+                for nombre in sorted(os.listdir(self.man_dir)):
+                    if not nombre.endswith(".json"):
+                        continue
+                    try:
+                        with open(os.path.join(self.man_dir, nombre), "r", encoding="utf-8") as f:
+                            self._manifiestos[nombre] = json.load(f).get("chunks", {})
+                    except Exception:
+                        continue
+        return self._manifiestos
+
+    def points(self):
+        """Puntos retenidos, del más reciente al más antiguo: [(nombre, datetime)]."""
+        res = []
+        for nombre in sorted(self._cargar_manifiestos(), reverse=True):
+            try:
+                res.append((nombre, datetime.strptime(nombre[:-5], "%Y%m%d_%H%M%S_%f")))
+            except ValueError:
+                continue
+        return res
+
+    def snapshot(self, pagos, compras, dirty=None, archivo=None):
+        """Crea un punto nuevo. `dirty` limita el trabajo a los bloques tocados
+        desde el anterior (None = revisar todos). `archivo` es la ruta del
+        archivo histórico: se copia si dirty es None o trae
+        BACKUP_CLAVE_ARCHIVO. Devuelve None si nada cambió."""
+        manifiestos = self._cargar_manifiestos()
+        previo = manifiestos[max(manifiestos)] if manifiestos else None
+
+        if dirty is None or previo is None:
+            grupos = self.agrupar(pagos, compras)
+            claves = set(grupos) | set(previo or {})
+            chunks = {}
+        else:
+            grupos = self.agrupar(pagos, compras, solo=dirty)
+            claves = set(dirty)
+            chunks = dict(previo)
+
+        for k in claves:
+            if k == BACKUP_CLAVE_ARCHIVO:
+                continue
+            if k in grupos:
+                # Orden canónico: el hash del bloque no depende de cómo se reunió
+                chunks[k] = self._put(sorted(grupos[k], key=lambda x: (str(x.get("fecha", "")), str(x.get("uid", "")))))
+            else:
+                chunks.pop(k, None)
+        if archivo is not None and (dirty is None or BACKUP_CLAVE_ARCHIVO in dirty):
+            h = self._put_archivo(archivo)
+            if h is None:
+                chunks.pop(BACKUP_CLAVE_ARCHIVO, None)
+            else:
+                chunks[BACKUP_CLAVE_ARCHIVO] = h
+        elif previo and BACKUP_CLAVE_ARCHIVO in previo:
+            # Sin ruta no se sabe nada del archivo: se conserva el del punto anterior
+            chunks[BACKUP_CLAVE_ARCHIVO] = previo[BACKUP_CLAVE_ARCHIVO]
+
+        if chunks == previo:
+            return None
+
+        ahora = datetime.now()
+        nombre = ahora.strftime("%Y%m%d_%H%M%S_%f") + ".json"
+        os.makedirs(self.man_dir, exist_ok=True)
+        escribir_json_atomico(
+            os.path.join(self.man_dir, nombre),
+            {"ts": ahora.isoformat(timespec="seconds"), "chunks": chunks},
+            indent=None,
+        )
+        manifiestos[nombre] = chunks
+        self.prune()
+        return os.path.join(self.man_dir, nombre)
+
+    def prune(self):
+        puntos = self.points()
+        if not puntos:
+            return
+        recientes = max(1, int(self.retention.get("recent", 1) or 1))
+        conservar = {nombre for nombre, _ in puntos[:recientes]}
+        for politica, fmt in BACKUP_BUCKETS:
+            limite = int(self.retention.get(politica, 0) or 0)
+            vistos = set()
+            for nombre, ts in puntos:
+                if len(vistos) >= limite:
+                    break
+                bucket = ts.strftime(fmt)
+                if bucket not in vistos:
+                    vistos.add(bucket)
+                    conservar.add(nombre)
+
+        manifiestos = self._cargar_manifiestos()
+        borrar = [n for n, _ in puntos if n not in conservar]
+        if not borrar:
+            return
+
+        vivos = set()
+        for n in conservar:
+            vivos.update(self._obj_path(h, k) for k, h in manifiestos.get(n, {}).items())
+        huerfanos = set()
+        for n in borrar:
+            huerfanos.update(self._obj_path(h, k) for k, h in manifiestos.pop(n, {}).items())
+            try:
+                os.remove(os.path.join(self.man_dir, n))
+            except OSError:
+                pass
+        for ruta in huerfanos - vivos:
+            try:
+                os.remove(ruta)
+            except OSError:
+                pass
+
+    def restore(self, nombre, archivo=None):
+        """(pagos, compras) del punto `nombre`. Si el punto guardó el archivo
+        histórico y se pasa su ruta, también lo devuelve a su sitio; los
+        puntos sin él dejan el archivo actual como está."""
+        chunks = self._cargar_manifiestos()[nombre]
+        listas = {"pago": [], "compra": []}
+        for k in sorted(chunks):
+            if k == BACKUP_CLAVE_ARCHIVO:
+                continue
+            tipo = k.split(":", 1)[0]
+            with open(self._obj_path(chunks[k]), "r", encoding="utf-8") as f:
+                listas.setdefault(tipo, []).extend(json.load(f))
+        if archivo is not None and BACKUP_CLAVE_ARCHIVO in chunks:
+            shutil.copyfile(self._obj_path(chunks[BACKUP_CLAVE_ARCHIVO], BACKUP_CLAVE_ARCHIVO), archivo + ".tmp")
+            os.replace(archivo + ".tmp", archivo)
+        return listas["pago"], listas["compra"]
+
+
+# ================== GUARDADO EN SEGUNDO PLANO ==================
+
+# Espera antes de encolar un guardado (agrupa clics seguidos en la UI)
+SAVE_DEBOUNCE_MS = 150
+# Ventana del hilo para fundir trabajos que llegan casi juntos
+SAVE_COALESCE_S = 0.2
+
+
+def fundir_guardados(a, b):
+    """Funde dos trabajos de guardado consecutivos.
+
+    Un trabajo es {"base": (pagos, compras) que sustituyen al ledger o None,
+    "reescribir": bool (reescritura completa en el store), "cambios": lista
+    de cambios posteriores a la base, "bloques": claves de backup tocadas
+    (None = todas), "numero": de store.reservar() (0 = nada reservado)}.
+    """
+    if b["base"] is not None:
+        # La base nueva ya contiene todo lo anterior
+        base, cambios = b["base"], b["cambios"]
+    else:
+        base, cambios = a["base"], a["cambios"] + b["cambios"]
+    bloques = None if a["bloques"] is None or b["bloques"] is None else a["bloques"] | b["bloques"]
+    return {
+        "base": base,
+        "reescribir": a["reescribir"] or b["reescribir"],
+        "cambios": cambios,
+        "bloques": bloques,
+        "numero": max(a["numero"], b["numero"]),
+    }
+
+
+class LedgerEspejo:
+    """Copia del ledger que solo toca el hilo de guardado.
+
+    Arranca con los dicts recién cargados o restaurados (la app trabaja con
+    sus Transaction y ya no los toca) y sigue cada trabajo con sus cambios,
+    que llevan su propia copia del registro. Con ella el hilo arma el
+    snapshot completo y los bloques de backup sin que el hilo de Tk copie
+    el ledger.
+    """
+
+    def __init__(self):
+        self._listas = {"pago": {}, "compra": {}}  # uid -> registro, en orden
+        self._bloques = {}  # clave de backup -> {uid: registro}
+        self._clave = {}    # uid -> clave de backup
+
+    def reset(self, pagos, compras):
+        self._listas = {"pago": {}, "compra": {}}
+        self._bloques.clear()
+        self._clave.clear()
+        for tipo, lst in (("pago", pagos), ("compra", compras)):
+            for x in lst:
+                self._poner(tipo, x)
+
+    def _poner(self, tipo, x):
+        uid = x.get("uid")
+        self._quitar(uid)
+        self._listas[tipo][uid] = x
+        k = self._clave[uid] = BackupStore.clave(tipo, x)
+        self._bloques.setdefault(k, {})[uid] = x
+
+    def _quitar(self, uid):
+        k = self._clave.pop(uid, None)
+        if k is None:
+            return
+        self._bloques[k].pop(uid, None)
+        if not self._bloques[k]:
+            del self._bloques[k]
+
+    def aplicar(self, cambios):
+        for rec in cambios:
+            op, uid = rec.get("op"), rec.get("uid")
+            if op == "reset":
+                self.reset([], [])
+            elif op in ("add", "upd") and rec.get("tipo") in self._listas:
+                lst = self._listas[rec["tipo"]]
+                if uid in lst:
+                    # Se queda en su sitio: el orden del archivo no cambia con una edición
+                    lst[uid] = rec.get("data", {})
+                    self._quitar(uid)
+                    k = self._clave[uid] = BackupStore.clave(rec["tipo"], lst[uid])
+                    self._bloques.setdefault(k, {})[uid] = lst[uid]
+                else:
+                    self._poner(rec["tipo"], rec.get("data", {}))
+            elif op == "del":
+                self._quitar(uid)
+                for lst in self._listas.values():
+                    lst.pop(uid, None)
+
+    def listas(self):
+        return list(self._listas["pago"].values()), list(self._listas["compra"].values())
+
+    def bloques(self, claves=None):
+        """{clave: registros} de las claves pedidas (None = todas)."""
+        claves = self._bloques if claves is None else claves
+        return {k: list(self._bloques[k].values()) for k in claves if k in self._bloques}
+
+
+class WriteBehind:
+    """Hilo de persistencia: la UI encola trabajos y aquí se escriben a disco.
+
+    Los trabajos que llegan dentro de `ventana` se funden con
+    fundir_guardados, así una ráfaga de ediciones acaba en una sola escritura.
+    flush() espera a que todo lo encolado esté escrito (cierre, restaurar).
+    """
+
+    def __init__(self, escribir, ventana=SAVE_COALESCE_S):
+        self.escribir = escribir
+        self.ventana = ventana
+        self.ultimo_error = None
+        self._cola = queue.Queue()
+        self._pendientes = 0
+        self._urgente = False
+        self._cond = threading.Condition()
+        threading.Thread(target=self._run, name="persistencia", daemon=True).start()
+
+    def submit(self, trabajo):
+        with self._cond:
+            self._pendientes += 1
+        self._cola.put(trabajo)
+
+    def flush(self, timeout=None):
+        """True si todo quedó escrito antes de `timeout` segundos."""
+        with self._cond:
+            self._urgente = True
+            try:
+                return self._cond.wait_for(lambda: self._pendientes == 0, timeout)
+            finally:
+                self._urgente = False
+
+    def _run(self):
+        while True:
+            lote = [self._cola.get()]
+            limite = time.monotonic() + self.ventana
+            while not self._urgente:
+                resto = limite - time.monotonic()
+                if resto <= 0:
+                    break
+                try:
+                    lote.append(self._cola.get(timeout=min(resto, 0.02)))
+                except queue.Empty:
+                    continue
+            while True:
+                try:
+                    lote.append(self._cola.get_nowait())
+                except queue.Empty:
+                    break
+
+            trabajo = lote[0]
+            for t in lote[1:]:
+                trabajo = fundir_guardados(trabajo, t)
+            try:
+                self.escribir(trabajo)
+                self.ultimo_error = None
+            except Exception as e:
+                self.ultimo_error = e
+
+            with self._cond:
+                self._pendientes -= len(lote)
+                self._cond.notify_all()
+
+
+# ================== COMPONENTES UI ==================
+
+class CanvasCalendar:
+    """Mes completo dibujado en un único tk.Canvas (rectángulos y textos).
+
+    Alternativa al pool de CTkFrame/CTkLabel: consume el mismo modelo de
+    celdas que update_calendar y resuelve los clics por posición.
+    """
+
+    COLS, ROWS = 7, 6
+    PAD = 3
+
+    def __init__(self, master, on_click, width=910, height=600):
+        self.canvas = tk.Canvas(master, bg=STYLE["white"], highlightthickness=0, width=width, height=height)
+        self.on_click = on_click
+        self.modelo = [None] * (self.COLS * self.ROWS)
+        self.selected = None
+        self._fonts = {
+            "day": tkfont.Font(family="Segoe UI", size=11, weight="bold"),
+            "item": tkfont.Font(family="Segoe UI", size=9),
+            "more": tkfont.Font(family="Segoe UI", size=9, weight="bold"),
+        }
+        self.canvas.bind("<Configure>", lambda e: self.redraw())
+        self.canvas.bind("<Button-1>", self._click)
+
+    def _cell_size(self):
+        w = max(self.canvas.winfo_width(), self.COLS)
+        h = max(self.canvas.winfo_height(), self.ROWS)
+        return w / self.COLS, h / self.ROWS
+
+    def _round_rect(self, x1, y1, x2, y2, r, **kw):
+        pts = [
+            x1 + r, y1, x2 - r, y1, x2, y1, x2, y1 + r,
+            x2, y2 - r, x2, y2, x2 - r, y2, x1 + r, y2,
+            x1, y2, x1, y2 - r, x1, y1 + r, x1, y1,
+        ]
+        return self.canvas.create_polygon(pts, smooth=True, **kw)
+
+    def _ajustar(self, texto, font, ancho):
+        # Recorta con "…" lo que no cabe en la celda
+        f = self._fonts[font]
+        if f.measure(texto) <= ancho:
+            return texto
+        while texto and f.measure(texto + "…") > ancho:
+            texto = texto[:-1]
+        return texto + "…"
+
+    def _borde(self, selected):
+        return {
+            "outline": STYLE["primary"] if selected else STYLE["line"],
+            "width": 2 if selected else 1,
+        }
+
+    def render(self, modelo, selected):
+        self.modelo = modelo
+        self.selected = selected
+        self.redraw()
+
+    def redraw(self):
+        c = self.canvas
+        c.delete("all")
+        cw, ch = self._cell_size()
+        p = self.PAD
+
+        for i, m in enumerate(self.modelo):
+            if m is None:
+                continue
+            r, col = divmod(i, self.COLS)
+            x1, y1 = col * cw + p, r * ch + p
+            x2, y2 = (col + 1) * cw - p, (r + 1) * ch - p
+
+            self._round_rect(
+                x1, y1, x2, y2, 10, fill=m["bg"],
+                tags=("cell", f"rect{i}"), **self._borde(m["fecha"] == self.selected)
+            )
+            c.create_text(
+                x1 + 8, y1 + 6, anchor="nw", text=str(m["day"]), font=self._fonts["day"],
+                fill=STYLE["primary"] if m["today"] else STYLE["text_main"],
+            )
+
+            y = y1 + 28
+            ancho = x2 - x1 - 12
+            for linea in m["lineas"]:
+                c.create_text(
+                    x1 + 6, y, anchor="nw", text=self._ajustar(linea, "item", ancho),
+                    font=self._fonts["item"], fill=STYLE["text_main"],
+                )
+                y += 16
+            if m["mas"]:
+                c.create_text(
+                    x1 + 6, y + 2, anchor="nw", text=f"+ {m['mas']} más...",
+                    font=self._fonts["more"], fill=STYLE["text_light"],
+                )
+
+    def set_selected(self, fecha):
+        for i, m in enumerate(self.modelo):
+            if m and m["fecha"] in (self.selected, fecha):
+                self.canvas.itemconfigure(f"rect{i}", **self._borde(m["fecha"] == fecha))
+        self.selected = fecha
+
+    def _click(self, event):
+        cw, ch = self._cell_size()
+        col, r = int(event.x // cw), int(event.y // ch)
+        if 0 <= col < self.COLS and 0 <= r < self.ROWS:
+            m = self.modelo[r * self.COLS + col]
+            if m:
+                self.on_click(m["fecha"])
+
+
+def unbind_all_funcid(widget, sequence, funcid):
+    # tkinter no sabe quitar un solo handler de bind_all: se filtra el script
+    script = widget.tk.call("bind", "all", sequence)
+    keep = "\n".join(line for line in str(script).split("\n") if funcid not in line)
+    widget.tk.call("bind", "all", sequence, keep)
+    try:
+        widget.deletecommand(funcid)
+    except tk.TclError:
+        pass
+
+
+class VirtualList:
+    """Lista con scroll que solo crea widgets para las filas visibles.
+
+    `kinds` describe cada tipo de fila: {kind: (alto_px, crear, cargar)}, con
+    crear(parent) -> dict con al menos "frame" y cargar(fila, dato). Las filas
+    que salen de la vista vuelven a un pool y se reutilizan con otro dato, así
+    que el número de widgets no depende del número de filas.
+    """
+
+    OVERSCAN = 2
+
+    def __init__(self, master, kinds, bg=None):
+        self.frame = ctk.CTkFrame(master, fg_color="transparent")
+        self.canvas = tk.Canvas(
+            self.frame, bg=bg or STYLE["white"], highlightthickness=0, yscrollincrement=20
+        )
+        self.scrollbar = ttk.Scrollbar(self.frame, orient="vertical", command=self.canvas.yview)
+        self.canvas.configure(yscrollcommand=self._on_scroll)
+        self.scrollbar.pack(side="right", fill="y")
+        self.canvas.pack(side="left", fill="both", expand=True)
+
+        self.kinds = kinds
+        self.rows = []
+        self._offsets = [0]
+        self._libres = {k: [] for k in kinds}
+        self._activas = {}  # idx -> (kind, fila, id de la ventana en el canvas)
+        self._ancho = 1
+
+        self.canvas.bind("<Configure>", self._on_configure)
+        self.canvas.bind("<Destroy>", self._on_destroy)
+        self._wheel_ids = [
+            (seq, self.canvas.bind_all(seq, self._on_wheel, add="+"))
+            for seq in ("<MouseWheel>", "<Button-4>", "<Button-5>")
+        ]
+
+    def pack(self, **kw):
+        self.frame.pack(**kw)
+
+    def pack_forget(self):
+        self.frame.pack_forget()
+
+    def widget_count(self):
+        return len(self._activas) + sum(len(v) for v in self._libres.values())
+
+    def set_rows(self, rows, keep_scroll=False):
+        """rows: lista de (kind, dato)."""
+        for idx in list(self._activas):
+            self._soltar(idx)
+        self.rows = list(rows)
+        self._offsets = [0]
+        for kind, _ in self.rows:
+            self._offsets.append(self._offsets[-1] + self.kinds[kind][0])
+        self.canvas.configure(scrollregion=(0, 0, self._ancho, self._offsets[-1]))
+        if not keep_scroll:
+            self.canvas.yview_moveto(0)
+        self._refresh()
+
+    def _soltar(self, idx):
+        kind, fila, wid = self._activas.pop(idx)
+        self.canvas.delete(wid)
+        self._libres[kind].append(fila)
+
+    def _refresh(self):
+        top = self.canvas.canvasy(0)
+        bottom = top + max(self.canvas.winfo_height(), 1)
+        first = max(0, bisect.bisect_right(self._offsets, top) - 1 - self.OVERSCAN)
+        last = min(len(self.rows), bisect.bisect_left(self._offsets, bottom) + self.OVERSCAN)
+
+        for idx in [i for i in self._activas if i < first or i >= last]:
+            self._soltar(idx)
+
+        for idx in range(first, last):
+            if idx in self._activas:
+                continue
+            kind, dato = self.rows[idx]
+            alto, crear, cargar = self.kinds[kind]
+            fila = self._libres[kind].pop() if self._libres[kind] else crear(self.canvas)
+            cargar(fila, dato)
+            wid = self.canvas.create_window(
+                0, self._offsets[idx], window=fila["frame"], anchor="nw", width=self._ancho, height=alto
+            )
+            self._activas[idx] = (kind, fila, wid)
+
+    def _on_scroll(self, first, last):
+        self.scrollbar.set(first, last)
+        self._refresh()
+
+    def _on_configure(self, event):
+        self._ancho = event.width
+        for _, _, wid in self._activas.values():
+            self.canvas.itemconfigure(wid, width=event.width)
+        self.canvas.configure(scrollregion=(0, 0, self._ancho, self._offsets[-1]))
+        self._refresh()
+
+    def _on_wheel(self, event):
+        w = self.canvas.winfo_containing(event.x_root, event.y_root)
+        if w is None or not str(w).startswith(str(self.canvas)):
+            return
+        if event.num == 4:
+            paso = -1
+        elif event.num == 5:
+            paso = 1
+        else:
+            paso = -1 if event.delta > 0 else 1
+        self.canvas.yview_scroll(paso * 3, "units")
+
+    def _on_destroy(self, event):
+        if event.widget is not self.canvas:
+            return
+        for seq, funcid in self._wheel_ids:
+            unbind_all_funcid(self.canvas, seq, funcid)
+        self._wheel_ids = []
+
+
+# Imágenes de gráficos renderizadas que se guardan en memoria (LRU)
+CHART_CACHE_MAX = 48
+
+
+class ChartView:
+    """Figura de matplotlib fuera de pantalla, creada una vez y actualizada en sitio.
+
+    Usa matplotlib.figure.Figure con el canvas Agg (ni pyplot ni Tk), así que
+    solo la toca el hilo de ChartRenderer. Si la forma del gráfico no cambia
+    (mismo tipo y número de barras/porciones) solo se actualizan los datos de
+    los artistas antes de renderizar.
+    """
+
+    def __init__(self, dpi=100):
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+        self.fig = Figure(dpi=dpi)
+        self.ax = self.fig.add_subplot(111)
+        self.canvas = FigureCanvasAgg(self.fig)
+        self._forma = None
+        self._artistas = []
+        self._textos = []
+
+    def _reiniciar(self, forma):
+        self.ax.clear()
+        self._forma = forma
+        self._artistas = []
+        self._textos = []
+
+    def _reescalar(self):
+        self.ax.relim()
+        self.ax.autoscale_view()
+
+    def barh(self, labels, values, color="#3B82F6"):
+        forma = ("barh", len(values))
+        if self._forma == forma:
+            for rect, v in zip(self._artistas, values):
+                rect.set_width(v)
+        else:
+            self._reiniciar(forma)
+            self._artistas = list(self.ax.barh(range(len(values)), values, color=color))
+            self.ax.set_yticks(range(len(values)))
+            self.ax.tick_params(axis="y", labelsize=9)
+            self.ax.tick_params(axis="x", labelsize=9)
+        self.ax.set_yticklabels(labels)
+        self._reescalar()
+
+    def bar(self, labels, values, colors):
+        forma = ("bar", tuple(labels))
+        if self._forma == forma:
+            for rect, v in zip(self._artistas, values):
+                rect.set_height(v)
+        else:
+            self._reiniciar(forma)
+            self._artistas = list(self.ax.bar(labels, values, color=colors))
+        self._reescalar()
+
+    def line(self, xs, ys, title="", xlabel="", estilo=None):
+        if self._forma == "line":
+            self._artistas[0].set_data(xs, ys)
+            self._artistas[0].set(**(estilo or {}))
+        else:
+            self._reiniciar("line")
+            self._artistas = self.ax.plot(xs, ys, **(estilo or {}))
+            self.ax.tick_params(axis="x", rotation=45)
+        self.ax.set_title(title)
+        self.ax.set_xlabel(xlabel)
+        self._reescalar()
+
+    def pie(self, labels, values):
+        # Mismas categorías: se recolocan las porciones y los textos
+        total = sum(values)
+        forma = ("pie", tuple(labels))
+        if self._forma != forma or total <= 0:
+            self._reiniciar(forma)
+            if total > 0:
+                wedges, textos, pcts = self.ax.pie(values, labels=labels, autopct="%1.1f%%", startangle=90)
+                self._artistas = list(wedges)
+                self._textos = list(zip(textos, pcts))
+            return
+
+        theta = 90.0
+        for wedge, (txt, pct), v in zip(self._artistas, self._textos, values):
+            frac = v / total
+            wedge.set_theta1(theta)
+            wedge.set_theta2(theta + 360.0 * frac)
+            medio = math.radians(theta + 180.0 * frac)
+            x, y = math.cos(medio), math.sin(medio)
+            txt.set_position((1.1 * x, 1.1 * y))
+            txt.set_horizontalalignment("left" if x >= 0 else "right")
+            pct.set_position((0.6 * x, 0.6 * y))
+            pct.set_text(f"{frac * 100:.1f}%")
+            theta += 360.0 * frac
+
+    def render(self, ancho, alto):
+        """PNG de la figura a ancho x alto píxeles, en base64 (listo para tk.PhotoImage)."""
+        self.fig.set_size_inches(ancho / self.fig.dpi, alto / self.fig.dpi)
+        buf = io.BytesIO()
+        self.canvas.print_png(buf)
+        return base64.b64encode(buf.getvalue()).decode("ascii")
+
+    def close(self):
+        self._reiniciar(None)
+        self.fig.clear()
+
+
+class ChartRenderer:
+    """Renderiza gráficos en un hilo de trabajo y guarda las imágenes en caché.
+
+    Las claves son (vista, mes, versión de datos, ancho, alto). Cada vista
+    tiene su ChartView, que solo existe en el hilo de trabajo; Tk solo recibe
+    el PNG ya codificado, que se entrega en el hilo de Tk con after().
+    """
+
+    def __init__(self, root, max_cache=CHART_CACHE_MAX):
+        self.root = root
+        self.max_cache = max_cache
+        self._cache = OrderedDict()
+        self._pendientes = {}  # clave -> callbacks esperando esa imagen
+        self._trabajos = queue.Queue()
+        self._hechos = queue.Queue()
+        self._vistas = {}  # vista -> ChartView (solo hilo de trabajo)
+        self._drenando = False
+        threading.Thread(target=self._worker, name="charts", daemon=True).start()
+
+    def get(self, key):
+        png = self._cache.get(key)
+        if png is not None:
+            self._cache.move_to_end(key)
+        return png
+
+    def request(self, key, kind, args, callback):
+        png = self.get(key)
+        if png is not None:
+            callback(key, png)
+            return
+        if key in self._pendientes:
+            self._pendientes[key].append(callback)
+            return
+        self._pendientes[key] = [callback]
+        self._trabajos.put(("render", key, kind, args))
+        self._programar()
+
+    def release(self, vista):
+        """Cierra la figura de una vista (las imágenes siguen en caché)."""
+        self._trabajos.put(("release", vista, None, None))
+
+    def _worker(self):
+        while True:
+            op, key, kind, args = self._trabajos.get()
+            if op == "release":
+                chart = self._vistas.pop(key, None)
+                if chart is not None:
+                    chart.close()
+                continue
+
+            try:
+                chart = self._vistas.get(key[0])
+                if chart is None:
+                    chart = self._vistas[key[0]] = ChartView()
+                getattr(chart, kind)(*args)
+                png = chart.render(key[-2], key[-1])
+            except Exception:
+                png = None
+            self._hechos.put((key, png))
+
+    def _programar(self):
+        if not self._drenando:
+            self._drenando = True
+            self.root.after(30, self._drenar)
+
+    def _drenar(self):
+        self._drenando = False
+        while True:
+            try:
+                key, png = self._hechos.get_nowait()
+            except queue.Empty:
+                break
+            callbacks = self._pendientes.pop(key, [])
+            if png is None:
+                continue
+            self._cache[key] = png
+            while len(self._cache) > self.max_cache:
+                self._cache.popitem(last=False)
+            for cb in callbacks:
+                cb(key, png)
+        if self._pendientes:
+            self._programar()
+
+
+class ChartImage:
+    """Canvas de Tk que muestra la imagen de una vista de ChartRenderer.
+
+    Mientras llega una imagen nueva (datos o tamaño distintos) se sigue
+    mostrando la anterior.
+    """
+
+    def __init__(self, master, renderer, vista, ancho=500, alto=400, bg=None):
+        self.renderer = renderer
+        self.vista = vista
+        self.widget = tk.Canvas(master, width=ancho, height=alto, bg=bg or STYLE["white"], highlightthickness=0)
+        self._size = (ancho, alto)
+        self._actual = None  # (clave, datos) pedida por última vez
+        self._mostrada = None
+        self._foto = None
+        self._item = None
+        self._after = None
+        self.widget.bind("<Configure>", self._on_configure)
+
+    def pack(self, **kw):
+        self.widget.pack(**kw)
+
+    def pack_forget(self):
+        self.widget.pack_forget()
+
+    def _key(self, clave):
+        return (self.vista,) + tuple(clave) + self._size
+
+    def mostrar(self, clave, datos):
+        """clave: (mes, versión de datos); datos() -> (kind, args) solo se
+        llama si la imagen no está ya en caché."""
+        self._actual = (clave, datos)
+        key = self._key(clave)
+        if key == self._mostrada:
+            return
+        png = self.renderer.get(key)
+        if png is not None:
+            self._pintar(key, png)
+            return
+        kind, args = datos()
+        self.renderer.request(key, kind, args, self._on_render)
+
+    def _on_render(self, key, png):
+        if self._actual is not None and key == self._key(self._actual[0]):
+            self._pintar(key, png)
+
+    def _pintar(self, key, png):
+        foto = tk.PhotoImage(master=self.widget, data=png)
+        if self._item is None:
+            self._item = self.widget.create_image(0, 0, anchor="nw", image=foto)
+        else:
+            self.widget.itemconfigure(self._item, image=foto)
+        self._foto = foto
+        self._mostrada = key
+
+    def _on_configure(self, event):
+        size = (max(event.width, 50), max(event.height, 50))
+        if size == self._size:
+            return
+        self._size = size
+        if self._after is not None:
+            self.widget.after_cancel(self._after)
+        self._after = self.widget.after(120, self._on_resize)
+
+    def _on_resize(self):
+        self._after = None
+        if self._actual is not None:
+            self.mostrar(*self._actual)
+
+    def close(self):
+        if self._after is not None:
+            self.widget.after_cancel(self._after)
+            self._after = None
+        self._actual = None
+        self._foto = None
+        self.renderer.release(self.vista)
+        try:
+            self.widget.destroy()
+        except tk.TclError:
+            pass
+
+
+def precargar_dependencias():
+    """Importa en un hilo los módulos pesados que todavía no estén cargados."""
+    def cargar():
+        for nombre in MODULOS_PESADOS:
+            try:
+                importlib.import_module(nombre)
+            except Exception:
+                pass
+
+    threading.Thread(target=cargar, name="precarga", daemon=True).start()
+
+
 # ================== APP PRINCIPAL ==================
 
 class PagoApp(ctk.CTk):
-    def __init__(self):
+    def __init__(self, perfil=None):
         super().__init__()
 
-        self.title("Finance Pro - Simple Banking")
+        # perfil: dict donde se anotan los tiempos de arranque (--profile-startup)
+        self._perfil = perfil
+
+        self._titulo = "Finance Pro - Simple Banking"
+        self.title(self._titulo)
         self.geometry("1500x900")
         self.minsize(1200, 750)
         self.configure(fg_color=STYLE["bg_app"])
-               
-        # Cache de rendimiento
-        self._cache_month_key = None
-        self._cache_month_data = {}
-    
+
         # Debounce del buscador
         self._search_after_id = None
 
         # Variables que causaban AttributeError
         self._last_month = None
         self.dark_mode = False
-    
+
         # Paths
-        if getattr(sys, "frozen", False):
-            self.base_path = os.path.dirname(sys.executable)
-        else:
-            self.base_path = os.path.dirname(os.path.abspath(__file__))
+        self.base_path = app_base_path()
 
         self.ruta_datos = os.path.join(self.base_path, "finanzas_v4.json")
+        self.ruta_db = os.path.join(self.base_path, "finanzas_v4.db")
+        self.ruta_particiones = os.path.join(self.base_path, "finanzas_v4")
+        self.ruta_archivo = os.path.join(self.base_path, "finanzas_v4.archivo")
         self.ruta_config = os.path.join(self.base_path, "config.json")
         self.backup_dir = os.path.join(self.base_path, "backups")
 
@@ -144,8 +3998,65 @@ class PagoApp(ctk.CTk):
         self.compras = []
         self.weekly_salary = 0.0
         self.salary_history = {}
+        self.payday_weekday = DIA_DE_COBRO
+        # Saldo en cuenta conocido y su fecha: punto de partida de la proyección
+        self.opening_balance = 0.0
+        self.opening_balance_date = ""
         self.budgets = {}
         self.savings_goals = []
+        self.recurrentes = RecurringRules()
+
+        # Persistencia: "json" (reescritura completa), "journal" (snapshot + diario),
+        # "sqlite" (finanzas_v4.db con índices; también hace de repo de consultas)
+        # o "particiones" (un archivo por mes, abiertos a demanda)
+        self.storage_mode = "json"
+        self.store = None
+        self.repo = None
+        self.index = LedgerIndex()
+        self.search_index = SearchIndex(self.index)
+        self.series = DailySeries(self.index)
+        self.vencimientos = DueIndex(self.index)
+        self.upcoming_days = PROXIMOS_DIAS
+        self.proyeccion = CashFlowProjection(self.index, self.series)
+        self.projection_months = PROYECCION_MESES
+        self._version_config = 0  # sube con cada guardar_config (clave de la proyección)
+        # Budgets: límites globales, ajustes por mes ({ym: {cat: límite}}, 0 = sin
+        # límite ese mes) y umbrales de aviso como fracción del límite
+        self.budget_overrides = {}
+        self.budget_alerts = list(BUDGET_UMBRALES)
+        self.control_budgets = BudgetTracker(self.index, self.presupuestos_mes, self.recurrentes)
+        self.control_budgets.subscribe(self._on_budget_alerta)
+        self._alertas_budget = {}
+        # Metas de ahorro (savings_goals) y ahorro acumulado
+        self.ahorros = SavingsTracker(self.index, self.savings_goals)
+        self._cambios_pendientes = []
+
+        # Carga progresiva: meses aún sin indexar (ym -> [(tipo, item)]) y
+        # avisos de la carga (archivo ilegible, registros en cuarentena)
+        self._carga_pendiente = None
+        self._carga_total = 0
+        self._avisos_carga = []
+        # Modo particiones: meses ya abiertos (None = el ledger entero está en memoria)
+        self._meses_cargados = None
+
+        # Archivo histórico: PAID de meses cerrados, fuera del ledger vivo.
+        # archive_after_months = meses recientes que se quedan vivos (0 = no archivar)
+        self.archivo = None
+        self._busqueda_archivo = None  # SearchIndex del archivo, al primer uso
+        self.archive_after_months = ARCHIVO_MESES_ABIERTOS
+
+        # Guardado en segundo plano: guardar_datos agenda, WriteBehind escribe
+        self.persistencia = WriteBehind(self._escribir_guardado)
+        self._guardado_after = None
+        # (pagos, compras) que sustituyen al ledger en el próximo guardado
+        # (restaurar, vaciar); pasan al hilo tal cual, sin copiar
+        self._base_guardado = None
+        self._espejo = LedgerEspejo()  # solo lo usa el hilo de guardado
+
+        # Backups deduplicados: bloques (tipo, mes) tocados desde el último punto
+        self.backup_retention = dict(BACKUP_RETENTION_DEFAULT)
+        self.backups = None
+        self._meses_sucios = None
 
         # Estado UI
         self.hoy = date.today()
@@ -156,76 +4067,391 @@ class PagoApp(ctk.CTk):
         # view_mode: DASH, MONTH, DAY, SEARCH
         self.view_mode = "DASH"
 
-        # Cargar datos antes de UI
-        self.cargar_datos()
+        # Paneles del detalle por modo, construidos una vez y refrescados
+        # cuando el ledger avisa de un cambio que les afecta
+        self._paneles = {}
+        self._panel_actual = None
+        self._stats = None  # ventana de estadísticas abierta y sus ChartImage
+
+        # Gráficos renderizados fuera de pantalla en un hilo, con caché por
+        # (vista, mes, versión del ledger, tamaño)
+        self.charts = ChartRenderer(self)
+        self.index.subscribe(self._on_ledger_change)
+
+        # Render del calendario: "widgets" (pool de CTkFrame) o "canvas"
+        self.calendar_renderer = "widgets"
+
+        # Repo columnar con NumPy (opcional, modos json/journal)
+        self.columnar_ledger = False
+
+        # Cargar datos antes de UI (la config decide el modo de almacenamiento)
+        t = time.perf_counter()
         self.cargar_config()
+        self.backups = BackupStore(self.backup_dir, self.backup_retention)
+        self.cargar_datos()
+        t = self._marca_arranque("cargar_datos", t)
 
         # UI
         self.setup_ui()
+        t = self._marca_arranque("setup_ui", t)
+
+        # Al cerrar se espera a que el hilo de guardado termine
+        self.protocol("WM_DELETE_WINDOW", self.cerrar)
 
-        # Render inicial
+        # Render inicial; el primer ciclo idle marca el primer pintado
         self.actualizar_vistas()
+        self.after_idle(self._primer_pintado, t)
+
+    def _marca_arranque(self, fase, t0):
+        ahora = time.perf_counter()
+        if self._perfil is not None:
+            self._perfil[fase] = ahora - t0
+        return ahora
+
+    def _primer_pintado(self, t0):
+        self._marca_arranque("primer_render", t0)
+        if self._perfil is not None:
+            self._perfil["total"] = time.perf_counter() - _T_INICIO
+            self._perfil["pesados"] = [m for m in MODULOS_PESADOS if m in sys.modules]
+            self.after(0, self.destroy)
+            return
+        if self._carga_pendiente:
+            self.after(1, self._cargar_resto)
+        else:
+            self.after(500, self._archivar_cerrados)
+        if self._avisos_carga:
+            self.after(50, self._avisar_carga)
+        self.after(300, precargar_dependencias)
 
     def get_month_cache(self):
         key = f"{self.anio_vis}-{self.mes_vis:02d}"
-        if self._cache_month_key == key:
-            return self._cache_month_data
-
-        data = {
-            "items": [],
-            "by_day": {},
-            "spent_by_cat": {},
-            "total": 0.0,
+        by_day = self.repo.month_by_day(key)
+        return {
+            "items": [x for items in by_day.values() for x in items],
+            "by_day": by_day,
+            "spent_by_cat": self.repo.month_by_cat(key),
+            "total": self.repo.month_total(key),
         }
 
-        for x in (self.pagos + self.compras):
-            if x.get("status", "PENDING") == "PAID":
-                continue
-            if not str(x.get("fecha", "")).startswith(key):
-                continue
+    # ================== CARGA Y GUARDADO ==================
 
-            data["items"].append(x)
-            data["total"] += safe_float(x.get("monto", 0))
+    def _crear_store(self):
+        store = self._crear_store_base()
+        # Las vistas ven también las ocurrencias de los pagos recurrentes
+        self.repo = RecurringRepo(self.repo, self.recurrentes)
+        return store
+
+    def _crear_store_base(self):
+        if self.storage_mode == "sqlite":
+            store = SqliteLedgerStore(self.ruta_db, ruta_json=self.ruta_datos)
+            store.resolver = self.index.get
+            store.respaldo = self.index
+            self.repo = store
+            return store
+
+        self.repo = self.index
+        if self.columnar_ledger and numpy_disponible():
+            self.repo = ColumnarLedger(self.index)
+        if self.storage_mode == "journal":
+            return JournalLedgerStore(self.ruta_datos)
+        if self.storage_mode == "particiones":
+            return PartitionedLedgerStore(self.ruta_particiones, ruta_json=self.ruta_datos)
+        return JsonLedgerStore(self.ruta_datos)
 
-            f = x.get("fecha")
-            data["by_day"].setdefault(f, []).append(x)
+    def cargar_datos(self):
+        self.store = self._crear_store()
+        try:
+            if self.store.parcial:
+                # Solo el mes visible y sus vecinos: cubren los próximos pagos y los budgets
+                self._meses_cargados = set(self._meses_cercanos())
+                pagos, compras = self.store.load_months(sorted(self._meses_cargados))
+            else:
+                pagos, compras = self.store.load()
+        except FileNotFoundError:
+            pagos, compras = [], []
+        except Exception as e:
+            # Ilegible: se aparta una copia antes de que un guardado lo pise
+            pagos, compras = [], []
+            self._avisos_carga.append(f"No se pudo leer {self.store.ruta}:\n{e}\n\n"
+                                      f"Copia conservada en {self._apartar_archivo(self.store.ruta)}")
+
+        self._registrar_cuarentena()
+        self._abrir_archivo()
+
+        # El diario identifica registros por uid: se completan los antiguos
+        sin_uid = [x for x in (pagos + compras) if not x.get("uid")]
+        for x in sin_uid:
+            x["uid"] = str(uuid.uuid4())
+        self.pagos = [Transaction(x) for x in pagos]
+        self.compras = [Transaction(x) for x in compras]
+        if not self.store.lee_bloques:
+            # Los dicts leídos son la copia del ledger del hilo de guardado (la
+            # app ya trabaja con sus Transaction). Aún no hay nada encolado, así
+            # que se le dan aquí; solo se reescribe si faltaban uid o toca compactar
+            self._espejo.reset(pagos, compras)
+            if sin_uid or self.store.needs_compaction():
+                self.persistencia.submit({
+                    "base": None, "reescribir": True, "cambios": [], "bloques": set(), "numero": 0,
+                })
+        if self._quitar_archivados():
+            self.guardar_datos()
 
-            cat = x.get("categoria", "OTHER")
-            data["spent_by_cat"][cat] = data["spent_by_cat"].get(cat, 0) + safe_float(x.get("monto", 0))
+        # Primero los meses que se ven al abrir; el resto se indexa por
+        # bloques después del primer pintado (_cargar_resto)
+        if len(self.pagos) + len(self.compras) <= LOAD_PROGRESIVO_MIN:
+            self.index.rebuild(self.pagos, self.compras)
+            return
+        visibles = set(self._meses_cercanos())
+        ya = {"pago": [], "compra": []}
+        resto = {}
+        for tipo, lst in (("pago", self.pagos), ("compra", self.compras)):
+            for x in lst:
+                ym = ym_from_date_str(str(x.get("fecha", "") or ""))
+                if ym in visibles:
+                    ya[tipo].append(x)
+                else:
+                    resto.setdefault(ym, []).append((tipo, x))
+        self.index.rebuild(ya["pago"], ya["compra"])
+        # Los meses más cercanos al visible van primero
+        actual = self.anio_vis * 12 + self.mes_vis - 1
+        orden = sorted(resto, key=lambda ym: abs(_codigo_mes(ym) - actual))
+        self._carga_pendiente = OrderedDict((ym, resto[ym]) for ym in orden)
+        self._carga_total = sum(len(v) for v in resto.values())
+
+    def _abrir_archivo(self):
+        try:
+            self.archivo = LedgerArchive(self.ruta_archivo)
+        except (OSError, ValueError) as e:
+            # Sin archivo legible no se archiva nada más en esta sesión
+            self.archivo = None
+            self._avisos_carga.append(f"No se pudo abrir el archivo histórico {self.ruta_archivo}:\n{e}")
+        self._busqueda_archivo = None
+        activo = self.archivo if self.archivo is not None and len(self.archivo) else None
+        # Al reabrir (restauración) también hay que soltar el archivo anterior
+        if activo is not None or self.series.archivo is not None:
+            self.series.set_archivo(activo)
+            self.ahorros.set_archivo(activo)
+
+    def _quitar_archivados(self):
+        """Saca del ledger vivo lo que ya está en el archivo histórico (un
+        archivado que escribió el archivo pero no llegó a guardar las bajas).
+        Devuelve cuántos registros quitó."""
+        if self.archivo is None or not len(self.archivo):
+            return 0
+        archivados = self.archivo.uids()
+        pares = [(tipo, x) for tipo, lst in (("pago", self.pagos), ("compra", self.compras))
+                 for x in lst if x.get("uid") in archivados]
+        if pares:
+            self._retirar_registros(pares)
+        return len(pares)
+
+    def _archivar_cerrados(self):
+        """Pasa al archivo los registros PAID de meses cerrados y los saca
+        del ledger vivo (y del próximo guardado)."""
+        if self.archivo is None or self.archive_after_months <= 0 or self._carga_pendiente:
+            return
+        limite = self.hoy.year * 12 + self.hoy.month - 1 - self.archive_after_months
+        # Solo fechas completas y válidas: LedgerArchive.agregar rechaza "2024-01-32"
+        candidatos = [
+            (tipo, x) for tipo, lst in (("pago", self.pagos), ("compra", self.compras)) for x in lst
+            if x.get("status") == "PAID" and _ordinal_fecha(str(x.get("fecha", "") or "")) >= 0
+            and _codigo_mes(ym_from_date_str(str(x.get("fecha", "") or ""))) <= limite
+        ]
+        if not candidatos:
+            return
+        try:
+            self.archivo = self.archivo.agregar(candidatos)
+        except OSError as e:
+            messagebox.showerror("Archivo", f"No se pudo escribir el archivo histórico:\n{e}")
+            self.archivo = LedgerArchive(self.ruta_archivo)
+            return
+        self._busqueda_archivo = None
+        self._retirar_registros(candidatos)
+        if self._meses_sucios is not None:
+            self._meses_sucios.add(BACKUP_CLAVE_ARCHIVO)
+        self.series.set_archivo(self.archivo)
+        self.ahorros.set_archivo(self.archivo)
+        self.guardar_datos()
+        self.actualizar_vistas()
 
-        self._cache_month_key = key
-        self._cache_month_data = data
-        return data
+    def _registrar_cuarentena(self):
+        cuarentena = self.store.cuarentena
+        if cuarentena:
+            informe = guardar_cuarentena(self.ruta_datos, self.store.ruta, cuarentena)
+            self._avisos_carga.append(f"{len(cuarentena)} registros dañados se apartaron del ledger.\n"
+                                      f"Detalle en {informe}")
+
+    def _asegurar_meses(self, meses=None):
+        """Modo particiones: abre los meses que aún no están en memoria
+        (None = todos los que haya en disco)."""
+        if self._meses_cargados is None:
+            return
+        if meses is None:
+            faltan = [p for p in self.store.meses() if p not in self._meses_cargados]
+            self._meses_cargados = None
+        else:
+            faltan = [p for p in meses if p not in self._meses_cargados]
+            self._meses_cargados.update(faltan)
+        if not faltan:
+            return
 
-    # ================== CARGA Y GUARDADO ==================
+        pagos, compras = self.store.load_months(faltan)
+        self._registrar_cuarentena()
+        # Lo que ya está en memoria manda: un registro movido a un mes cerrado
+        # puede estar también en su partición si el guardado ya se escribió
+        nuevos = [(tipo, Transaction(x)) for tipo, lst in (("pago", pagos), ("compra", compras))
+                  for x in lst if self.index.get(x["uid"]) is None]
+        for tipo, x in nuevos:
+            (self.pagos if tipo == "pago" else self.compras).append(x)
+        if self._quitar_archivados():
+            self.guardar_datos()
+            nuevos = [(tipo, x) for tipo, x in nuevos if x.get("uid") not in self.archivo.uids()]
+        if len(nuevos) > LOAD_PROGRESIVO_MIN:
+            self.index.rebuild(self.pagos, self.compras)
+        else:
+            self.control_budgets.avisos = False
+            try:
+                for tipo, x in nuevos:
+                    self.index.add(tipo, x)
+            finally:
+                self.control_budgets.avisos = True
+        if self._avisos_carga:
+            self.after(50, self._avisar_carga)
+
+    def _meses_cercanos(self):
+        base = date(self.anio_vis, self.mes_vis, 1)
+        anterior = base - timedelta(days=1)
+        siguiente = base + timedelta(days=31)
+        return (base.strftime("%Y-%m"), anterior.strftime("%Y-%m"), siguiente.strftime("%Y-%m"))
+
+    def _cargar_resto(self):
+        """Indexa meses pendientes durante ~LOAD_SLICE_MS y se vuelve a agendar.
+        Los meses cercanos al visible se adelantan; cada mes entra entero."""
+        pendiente = self._carga_pendiente
+        if not pendiente:
+            self.title(self._titulo)
+            return
+        t_fin = time.perf_counter() + LOAD_SLICE_MS / 1000
+        visible = False
+        for ym in self._meses_cercanos():
+            if ym in pendiente:
+                pendiente.move_to_end(ym, last=False)
+                visible = True
+        # Registros que ya existían: no son gasto nuevo para los avisos de budget
+        self.control_budgets.avisos = False
+        try:
+            while pendiente and time.perf_counter() < t_fin:
+                _, bloque = pendiente.popitem(last=False)
+                for tipo, x in bloque:
+                    self.index.add(tipo, x)
+        finally:
+            self.control_budgets.avisos = True
+
+        if pendiente:
+            hecho = 100 - 100 * sum(len(v) for v in pendiente.values()) // max(1, self._carga_total)
+            self.title(f"{self._titulo} — cargando historial {hecho}%")
+            if visible:
+                self.actualizar_vistas()
+            self.after(1, self._cargar_resto)
+        else:
+            self._carga_pendiente = None
+            self.title(self._titulo)
+            self.actualizar_vistas()
+            self.after(500, self._archivar_cerrados)
 
-    def cargar_datos(self):
+    def _apartar_archivo(self, ruta):
+        copia = f"{ruta}.ilegible-{datetime.now().strftime('%Y%m%d-%H%M%S')}"
         try:
-            with open(self.ruta_datos, "r", encoding="utf-8") as f:
-                d = json.load(f)
-            self.pagos = d.get("pagos", [])
-            self.compras = d.get("compras", [])
-        except Exception:
-            self.pagos, self.compras = [], []
+            shutil.copy2(ruta, copia)
+        except OSError:
+            return "(no se pudo copiar)"
+        return copia
+
+    def _avisar_carga(self):
+        avisos, self._avisos_carga = self._avisos_carga, []
+        if avisos:
+            messagebox.showwarning("Carga de datos", "\n\n".join(avisos))
 
     def guardar_datos(self):
-        data = {"pagos": self.pagos, "compras": self.compras}
-        with open(self.ruta_datos, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-        self.auto_backup(silent=True)
-        self._cache_month_key = None
+        # Solo agenda el guardado: el disco lo toca el hilo de WriteBehind.
+        # En sqlite los cambios se aplican ya (sin commit) para que el repo los
+        # vea, salvo detrás de una reescritura pendiente (ver SqliteLedgerStore).
+        if self._base_guardado is None and self.store.stage(self._cambios_pendientes):
+            self._cambios_pendientes = []
+        if self._guardado_after is None:
+            self._guardado_after = self.after(SAVE_DEBOUNCE_MS, self._despachar_guardado)
         self._last_month = None
 
+    def _despachar_guardado(self):
+        self._guardado_after = None
+        error, self.persistencia.ultimo_error = self.persistencia.ultimo_error, None
+        if error is not None:
+            messagebox.showerror("Guardar", f"Error guardando los datos:\n{error}")
+
+        cambios, self._cambios_pendientes = self._cambios_pendientes, []
+        base, self._base_guardado = self._base_guardado, None
+        sucios, self._meses_sucios = self._meses_sucios, set()
+        # Lo que el store no aplicó en stage viaja en orden por la cola
+        numero = self.store.reservar() if base is not None or cambios else 0
+        self.persistencia.submit({
+            "base": base, "reescribir": base is not None, "cambios": cambios,
+            "bloques": sucios, "numero": numero,
+        })
+
+    def _escribir_guardado(self, trabajo):
+        # Hilo de WriteBehind: solo usa el trabajo y su copia del ledger
+        if trabajo["base"] is not None:
+            self._espejo.reset(*trabajo["base"])
+        self._espejo.aplicar(trabajo["cambios"])
+        if trabajo["reescribir"]:
+            self.store.save(*self._espejo.listas(), None)
+        else:
+            pagos = compras = None
+            if self.store.needs_snapshot(trabajo["cambios"]):
+                pagos, compras = self._espejo.listas()
+            self.store.save(pagos, compras, trabajo["cambios"])
+        self.store.confirmar(trabajo["numero"])
+        if trabajo["bloques"] != set():
+            self._snapshot_bloques(trabajo["bloques"])
+
+    def _snapshot_bloques(self, claves):
+        """Punto de backup de las claves tocadas (None = todo el ledger)."""
+        solo = None if claves is None else claves - {BACKUP_CLAVE_ARCHIVO}
+        fuente = self.store if self.store.lee_bloques else self._espejo
+        bloques = fuente.bloques(solo)
+        pagos = [x for k, xs in bloques.items() if k.startswith("pago:") for x in xs]
+        compras = [x for k, xs in bloques.items() if k.startswith("compra:") for x in xs]
+        return self.backups.snapshot(pagos, compras, claves, archivo=self.ruta_archivo)
+
+    def _vaciar_guardados(self, timeout=None):
+        """Encola lo pendiente y espera a que el hilo lo escriba."""
+        if self._guardado_after is not None:
+            self.after_cancel(self._guardado_after)
+            self._despachar_guardado()
+        return self.persistencia.flush(timeout)
+
+    def cerrar(self):
+        ok = self._vaciar_guardados(timeout=15)
+        error = self.persistencia.ultimo_error
+        if not ok or error is not None:
+            motivo = error or "el guardado no terminó a tiempo"
+            if not messagebox.askyesno("Guardar", f"No se pudieron guardar los últimos cambios:\n{motivo}\n\n"
+                                                  "¿Cerrar de todos modos?"):
+                return
+        self.destroy()
+
     def auto_backup(self, silent=False):
+        # El hilo de guardado también usa BackupStore: primero se vacía la cola
+        self._vaciar_guardados()
         try:
-            os.makedirs(self.backup_dir, exist_ok=True)
-            ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-            backup_file = os.path.join(self.backup_dir, f"finanzas_backup_{ts}.json")
-            if os.path.exists(self.ruta_datos):
-                with open(self.ruta_datos, "r", encoding="utf-8") as src, open(backup_file, "w", encoding="utf-8") as dst:
-                    dst.write(src.read())
+            # Con la cola vacía el hilo está parado: su copia del ledger se puede leer aquí
+            backup_file = self._snapshot_bloques(self._meses_sucios)
+            self._meses_sucios = set()
             if not silent:
-                messagebox.showinfo("Backup", f"Backup creado:\n{backup_file}")
+                if backup_file:
+                    messagebox.showinfo("Backup", f"Backup creado:\n{backup_file}")
+                else:
+                    messagebox.showinfo("Backup", "Sin cambios desde el último backup.")
         except Exception as e:
             if not silent:
                 messagebox.showerror("Backup", f"Error creando backup:\n{e}")
@@ -238,6 +4464,21 @@ class PagoApp(ctk.CTk):
             self.salary_history = d.get("salary_history", {})
             self.budgets = d.get("budgets", {})
             self.savings_goals = d.get("savings_goals", [])
+            self.recurrentes.reglas[:] = d.get("recurring_rules", [])
+            self.recurrentes.invalidar()
+            self.budget_overrides = d.get("budget_overrides", {})
+            self.budget_alerts = umbrales_budget(d.get("budget_alerts"))
+            self.control_budgets.umbrales = self.budget_alerts
+            self.storage_mode = d.get("storage_mode", "json")
+            self.backup_retention = dict(BACKUP_RETENTION_DEFAULT, **d.get("backup_retention", {}))
+            self.calendar_renderer = d.get("calendar_renderer", "widgets")
+            self.columnar_ledger = bool(d.get("columnar_ledger", False))
+            self.archive_after_months = safe_int(d.get("archive_after_months"), ARCHIVO_MESES_ABIERTOS, minimo=0)
+            self.upcoming_days = safe_int(d.get("upcoming_days"), PROXIMOS_DIAS, minimo=1)
+            self.projection_months = safe_int(d.get("projection_months"), PROYECCION_MESES, minimo=1)
+            self.payday_weekday = safe_int(d.get("payday_weekday"), DIA_DE_COBRO, minimo=0, maximo=6)
+            self.opening_balance = safe_float(d.get("opening_balance"), 0.0)
+            self.opening_balance_date = normalizar_fecha(str(d.get("opening_balance_date", "") or ""))
             if not self.salary_history:
                 self.salary_history["2020-01-01"] = float(self.weekly_salary or 0.0)
         except Exception:
@@ -245,16 +4486,33 @@ class PagoApp(ctk.CTk):
             self.salary_history = {"2020-01-01": 0.0}
             self.budgets = {}
             self.savings_goals = []
+        self.ahorros.set_metas(self.savings_goals)
 
     def guardar_config(self):
         data = {
             "salary": self.weekly_salary,
             "salary_history": self.salary_history,
             "budgets": self.budgets,
+            "budget_overrides": self.budget_overrides,
+            "budget_alerts": self.budget_alerts,
             "savings_goals": self.savings_goals,
+            "recurring_rules": self.recurrentes.reglas,
+            "storage_mode": self.storage_mode,
+            "backup_retention": self.backup_retention,
+            "calendar_renderer": self.calendar_renderer,
+            "columnar_ledger": self.columnar_ledger,
+            "archive_after_months": self.archive_after_months,
+            "upcoming_days": self.upcoming_days,
+            "projection_months": self.projection_months,
+            "payday_weekday": self.payday_weekday,
+            "opening_balance": self.opening_balance,
+            "opening_balance_date": self.opening_balance_date,
         }
         with open(self.ruta_config, "w", encoding="utf-8") as f:
             json.dump(data, f, ensure_ascii=False, indent=2)
+        self._version_config += 1
+        # Salario, budgets y metas alimentan los KPIs del dashboard
+        self._invalidar_paneles()
 
     # ================== UI PRINCIPAL ==================
 
@@ -273,6 +4531,8 @@ class PagoApp(ctk.CTk):
         ctk.CTkButton(nav, text="◀", width=40, command=self.atras).pack(side="left", padx=2)
         ctk.CTkButton(nav, text="Hoy", width=60, command=self.ir_hoy).pack(side="left", padx=2)
         ctk.CTkButton(nav, text="▶", width=40, command=self.adelante).pack(side="left", padx=2)
+        ctk.CTkButton(nav, text="▦", width=32, fg_color="#6B7280",
+                      command=self.cambiar_renderer_calendario).pack(side="left", padx=(8, 2))
 
         # Buscador
         self.search_var = tk.StringVar()
@@ -280,7 +4540,7 @@ class PagoApp(ctk.CTk):
         search = ctk.CTkEntry(
             header,
             textvariable=self.search_var,
-            placeholder_text="🔍 Buscar (nombre, categoría, método, fecha)...",
+            placeholder_text="🔍 Buscar... (cat:  metodo:  monto>  fecha:2025-01..2025-03  status:  tipo:)",
             width=350,
             height=32,
             corner_radius=16,
@@ -293,6 +4553,9 @@ class PagoApp(ctk.CTk):
 
         btn_style = {"height": 32, "corner_radius": 16, "font": ("Segoe UI", 11, "bold")}
 
+        ctk.CTkButton(actions, text="♻️ Restore", fg_color="#0284C7",
+                      command=self.restaurar_backup, width=90, **btn_style).pack(side="right", padx=3)
+
         ctk.CTkButton(actions, text="💾 Backup", fg_color="#0EA5E9",
                       command=self.auto_backup, width=90, **btn_style).pack(side="right", padx=3)
 
@@ -311,6 +4574,9 @@ class PagoApp(ctk.CTk):
         ctk.CTkButton(actions, text="🛒 Buy", fg_color="#10B981",
                       command=self.abrir_ventana_compra, width=80, **btn_style).pack(side="right", padx=3)
 
+        ctk.CTkButton(actions, text="🎯 Goals", fg_color="#0D9488",
+                      command=self.gestionar_metas, width=80, **btn_style).pack(side="right", padx=3)
+
         ctk.CTkButton(actions, text="💸 Save", fg_color="#059669",
                       command=self.abrir_ventana_ahorro, width=80, **btn_style).pack(side="right", padx=3)
 
@@ -369,28 +4635,84 @@ class PagoApp(ctk.CTk):
         self.actualizar_vistas()
 
     def actualizar_vistas(self):
+        self._asegurar_meses(self._meses_cercanos())
         self.lbl_mes.configure(text=f"{calendar.month_name[self.mes_vis]} {self.anio_vis}")
 
         if getattr(self, "_last_month", None) != (self.anio_vis, self.mes_vis):
             self.update_calendar()
             self._last_month = (self.anio_vis, self.mes_vis)
+        else:
+            self._pintar_seleccion()
 
         self.update_detail()
+        if self._stats is not None:
+            self._refrescar_stats()
 
     # ================== MÉTODOS AUXILIARES ==================
 
     def calcular_balance_mensual(self):
         mes_prefix = f"{self.anio_vis}-{self.mes_vis:02d}"
+        gastos = self.repo.month_total(mes_prefix)
 
-        gastos = 0.0
-        for x in (self.pagos + self.compras):
-            if str(x.get("fecha", "")).startswith(mes_prefix) and x.get("status", "PENDING") != "PAID":
-                gastos += safe_float(x.get("monto", 0.0))
-
-        semanas_mes = len(calendar.monthcalendar(self.anio_vis, self.mes_vis))
-        ingreso = safe_float(self.weekly_salary, 0.0) * semanas_mes
+        # Un cobro por semana, con el salario vigente ese día según salary_history
+        tramos = tramos_salario(self.salary_history)
+        cobros = cobros_mes(self.anio_vis, self.mes_vis, self.payday_weekday)
+        ingreso = sum(salario_vigente(tramos, o) for o in cobros)
         balance = ingreso - gastos
-        return ingreso, gastos, balance, semanas_mes
+        return ingreso, gastos, balance, len(cobros)
+
+    def presupuestos_mes(self, ym):
+        """Límites de budget {categoría: límite} vigentes en el mes `ym`."""
+        ajustes = self.budget_overrides.get(ym)
+        if not ajustes:
+            return self.budgets
+        return {c: l for c, l in dict(self.budgets, **ajustes).items() if safe_float(l, 0.0) > 0}
+
+    def _on_budget_alerta(self, ym, cat, umbral, gastado, limite):
+        # Se agrupan y se muestran cuando termina la mutación que las disparó
+        if not self._alertas_budget:
+            self.after(0, self._mostrar_alertas_budget)
+        self._alertas_budget[(ym, cat)] = (umbral, gastado, limite)
+
+    def _mostrar_alertas_budget(self):
+        alertas, self._alertas_budget = self._alertas_budget, {}
+        if not alertas:
+            return
+        lineas = [
+            f"{cat} ({ym}): {fmt_money(gastado)} de {fmt_money(limite)} "
+            f"({'superado' if umbral >= 1 else f'{umbral * 100:.0f}%'})"
+            for (ym, cat), (umbral, gastado, limite) in sorted(alertas.items())
+        ]
+        messagebox.showwarning("Budgets", "\n".join(lineas))
+
+    def _proyectar(self):
+        """(ordinal del día 0, saldo diario) de la proyección."""
+        hoy = date.today()
+        actual = hoy.year * 12 + hoy.month - 1
+        self._asegurar_meses([f"{k // 12}-{k % 12 + 1:02d}" for k in range(actual, actual + self.projection_months)])
+        return self.proyeccion.proyectar(
+            hoy.toordinal(), self.projection_months, tramos_salario(self.salary_history),
+            self.presupuestos_mes, self.recurrentes, (self._version_config, self.recurrentes.version),
+            saldo_inicial=self._saldo_inicial(hoy), dia_cobro=self.payday_weekday,
+        )
+
+    def _saldo_inicial(self, hoy):
+        """(importe, ordinal) del saldo en cuenta configurado; sin fecha vale para hoy."""
+        o = _ordinal_fecha(self.opening_balance_date) if self.opening_balance_date else -1
+        if o < 0 and not self.opening_balance:
+            return None
+        return self.opening_balance, o if o >= 0 else hoy.toordinal()
+
+    def _compute_proyeccion_mes(self):
+        """(saldo proyectado al cierre del mes visible o None, primer día con saldo negativo o None)."""
+        base, saldo = self._proyectar()
+        y, m = self.anio_vis, self.mes_vis
+        cierre = date(y, m, calendar.monthrange(y, m)[1]).toordinal() - base
+        fin_mes = float(saldo[cierre]) if 0 <= cierre < len(saldo) else None
+        hoy = date.today().toordinal() - base
+        negativo = next((i for i in range(hoy, len(saldo)) if saldo[i] < 0), None)
+        primer_negativo = date.fromordinal(base + negativo) if negativo is not None else None
+        return fin_mes, primer_negativo
 
     def _kpi_color_balance(self, balance):
         return STYLE["success"] if balance >= 0 else STYLE["danger"]
@@ -415,115 +4737,219 @@ class PagoApp(ctk.CTk):
         return STYLE["danger"]
 
     def _compute_budget_usage_month(self):
-        mes_prefix = f"{self.anio_vis}-{self.mes_vis:02d}"
-        spent_by_cat = {}
-
-        for x in (self.pagos + self.compras):
-            if x.get("status", "PENDING") == "PAID":
-                continue
-            if not str(x.get("fecha", "")).startswith(mes_prefix):
-                continue
-            cat = x.get("categoria", "OTHER")
-            spent_by_cat[cat] = spent_by_cat.get(cat, 0.0) + safe_float(x.get("monto", 0.0))
-
-        if not self.budgets:
-            return spent_by_cat, -1.0
-
-        total_budget = 0.0
-        total_spent_in_budgeted = 0.0
-        for cat, lim in self.budgets.items():
-            limf = safe_float(lim, 0.0)
-            if limf <= 0:
-                continue
-            total_budget += limf
-            total_spent_in_budgeted += spent_by_cat.get(cat, 0.0)
-
-        if total_budget <= 0:
-            return spent_by_cat, -1.0
-
-        return spent_by_cat, (total_spent_in_budgeted / total_budget)
-
-    def _compute_upcoming_10d(self):
-        hoy = date.today()
-        limite = hoy + timedelta(days=10)
-
-        proximos = []
-        for p in self.pagos:
-            if p.get("status", "PENDING") == "PAID":
-                continue
-            f = parse_date_ymd(p.get("fecha", ""))
-            if not f:
-                continue
-            if hoy <= f <= limite:
-                proximos.append(p)
-
-        proximos.sort(key=lambda x: x.get("fecha", ""))
-        total = sum(safe_float(x.get("monto", 0.0)) for x in proximos)
-        return proximos, total
+        # Totales por (mes, categoría) ya acumulados por el BudgetTracker
+        return self.control_budgets.uso(f"{self.anio_vis}-{self.mes_vis:02d}")
+
+    def _compute_upcoming(self):
+        """(vencidos, próximos `upcoming_days` días, total de los próximos)."""
+        hoy = date.today().toordinal()
+        limite = hoy + self.upcoming_days
+
+        def pendientes(xs):
+            return [x for x in xs if x.get("status", "PENDING") != "PAID"]
+
+        # Cortes del índice por vencimiento más las ocurrencias recurrentes del rango
+        vencidos = self.vencimientos.vencidos(hoy)
+        vencidos += pendientes(self.recurrentes.rango(hoy - RECURRENTES_VENCIDOS_DIAS, hoy - 1))
+        proximos = self.vencimientos.rango(hoy, limite) + pendientes(self.recurrentes.rango(hoy, limite))
+        vencidos.sort(key=ordinal_de)
+        proximos.sort(key=ordinal_de)
+        return vencidos, proximos, sum(monto_de(x) for x in proximos)
+
+    def _compute_siguientes(self, desde, k=PROXIMOS_SIGUIENTES):
+        """Los `k` siguientes pagos pendientes a partir del ordinal `desde`."""
+        res = self.vencimientos.siguientes(desde, k)
+        # Las reglas no tienen fin: basta mirar hasta el último de los guardados (o un año)
+        hasta = ordinal_de(res[-1]) if len(res) == k else desde + 366
+        res += [x for x in self.recurrentes.rango(desde, hasta) if x.get("status", "PENDING") != "PAID"]
+        res.sort(key=ordinal_de)
+        return res[:k]
+
+    def version_datos(self):
+        """Cambia con cualquier edición del ledger o de las reglas recurrentes (claves de caché)."""
+        return (self.index.version, self.recurrentes.version)
 
     def marcar_pagado(self, item):
         nombre = item.get("nombre") or item.get("item", "Item")
         if messagebox.askyesno("Marcar Pagado", f"¿Marcar '{nombre}' como PAGADO?"):
-            item["status"] = "PAID"
+            self.actualizar_registro(item, {"status": "PAID"})
             self.guardar_datos()
             self.actualizar_vistas()
 
+    # ================== MUTACIONES ==================
+
+    def _tipo_de(self, item):
+        return "pago" if "nombre" in item else "compra"
+
+    def _registrar_cambio(self, op, tipo=None, item=None):
+        rec = {"ts": datetime.now().isoformat(timespec="seconds"), "op": op}
+        if item is not None:
+            rec["tipo"] = tipo
+            rec["uid"] = item.get("uid")
+            if op != "del":
+                rec["data"] = dict(item)
+        self._cambios_pendientes.append(rec)
+
+    def _marcar_sucio(self, tipo, item):
+        if self._meses_sucios is not None:
+            self._meses_sucios.add(BackupStore.clave(tipo, item))
+
+    def agregar_registro(self, tipo, item):
+        item = Transaction.from_dict(item)
+        item.setdefault("uid", str(uuid.uuid4()))
+        (self.pagos if tipo == "pago" else self.compras).append(item)
+        self.index.add(tipo, item)
+        self._marcar_sucio(tipo, item)
+        self._registrar_cambio("add", tipo, item)
+        return item
+
+    def actualizar_registro(self, item, cambios):
+        if RecurringRules.es_ocurrencia(item):
+            # Ocurrencia de un pago recurrente: solo se guarda la excepción
+            self.recurrentes.excepcion(item, cambios)
+            self.guardar_config()
+            return
+        tipo = self._tipo_de(item)
+        self._marcar_sucio(tipo, item)
+        item.update(cambios)
+        self._marcar_sucio(tipo, item)
+        self.index.update(item)
+        self._registrar_cambio("upd", tipo, item)
+
+    def eliminar_registro(self, item):
+        if RecurringRules.es_ocurrencia(item):
+            self.recurrentes.borrar(item)
+            self.guardar_config()
+            return True
+        for tipo, lst in (("pago", self.pagos), ("compra", self.compras)):
+            for i, x in enumerate(lst):
+                if x is item:
+                    del lst[i]
+                    self.index.remove(item)
+                    self._marcar_sucio(tipo, item)
+                    self._registrar_cambio("del", tipo, item)
+                    return True
+        return False
+
+    def _retirar_registros(self, pares):
+        """Baja en bloque de [(tipo, item)] (una pasada por lista, no una por registro)."""
+        fuera = {id(x) for _, x in pares}
+        self.pagos = [x for x in self.pagos if id(x) not in fuera]
+        self.compras = [x for x in self.compras if id(x) not in fuera]
+        for tipo, x in pares:
+            self.index.remove(x)
+            self._marcar_sucio(tipo, x)
+            self._registrar_cambio("del", tipo, x)
+
+    def vaciar_registros(self):
+        self.pagos.clear()
+        self.compras.clear()
+        self.index.rebuild(self.pagos, self.compras)
+        # La reescritura (vacía) la hace el hilo de guardado
+        self._base_guardado = ([], [])
+        self._cambios_pendientes = []
+        self._meses_sucios = None
+        self._meses_cargados = None
+
+    def reemplazar_registros(self, pagos, compras):
+        # Cambio masivo (restauración): el siguiente guardado reescribe todo.
+        # Lo que ya está en el archivo histórico no vuelve al ledger vivo
+        archivados = self.archivo.uids() if self.archivo is not None else {}
+        listas = []
+        for lst in (pagos, compras):
+            lst = [x.to_dict() if isinstance(x, Transaction) else x for x in lst if x.get("uid") not in archivados]
+            for x in lst:
+                x.setdefault("uid", str(uuid.uuid4()))
+            listas.append(lst)
+        # La app trabaja con sus Transaction; los dicts pasan al hilo sin copiar
+        self.pagos = [Transaction(x) for x in listas[0]]
+        self.compras = [Transaction(x) for x in listas[1]]
+        self.index.rebuild(self.pagos, self.compras)
+        self._base_guardado = tuple(listas)
+        self._cambios_pendientes = []
+        self._meses_sucios = None
+        self._meses_cargados = None
+
     # ================== VISTAS (CORREGIDO) ==================
+    #
+    # Cada modo (DASH, SEARCH, MONTH, DAY) tiene un panel que se construye una
+    # sola vez. update_detail muestra el panel del modo actual y solo lo
+    # refresca si cambió lo que muestra (mes, día, consulta) o si una
+    # notificación del ledger lo marcó como sucio.
 
     def update_detail(self):
-        for w in self.detail_frame.winfo_children():
-            w.destroy()
-
-        container = ctk.CTkFrame(self.detail_frame, fg_color="transparent")
-        container.pack(fill="both", expand=True, padx=10, pady=10)
-
-        if self.view_mode == "DASH":
-            self.render_dashboard(container)
-        elif self.view_mode == "SEARCH":
-            self.render_busqueda_editable(container)
-        elif self.view_mode == "MONTH":
-            self.render_resumen_mensual(container)
-        elif self.view_mode == "DAY":
-            self.render_detalle_dia(container)
-        else:
-            self.render_dashboard(container)
-
-    def render_dashboard(self, parent):
-        cache = self.get_month_cache()
-        gastos = cache["total"]
-        spent_by_cat = cache["spent_by_cat"]
-
-        ingreso, gastos_calc, balance, semanas_mes = self.calcular_balance_mensual()
-        spent_by_cat_all, pct_budget = self._compute_budget_usage_month()
-        proximos, total_prox = self._compute_upcoming_10d()
+        ym = f"{self.anio_vis}-{self.mes_vis:02d}"
+        paneles = {
+            "DASH": (self._crear_panel_dashboard, self.render_dashboard, ym),
+            "SEARCH": (self._crear_panel_busqueda, self.render_busqueda_editable, self.search_var.get().strip()),
+            "MONTH": (self._crear_panel_mes, self.render_resumen_mensual, ym),
+            "DAY": (self._crear_panel_dia, self.render_detalle_dia, self.fecha_seleccionada),
+        }
+        modo = self.view_mode if self.view_mode in paneles else "DASH"
+        crear, render, clave = paneles[modo]
+
+        panel = self._paneles.get(modo)
+        if panel is None:
+            frame = ctk.CTkFrame(self.detail_frame, fg_color="transparent")
+            panel = crear(frame)
+            panel.update({"frame": frame, "key": None, "dirty": True})
+            self._paneles[modo] = panel
+
+        if self._panel_actual is not panel:
+            if self._panel_actual is not None:
+                self._panel_actual["frame"].pack_forget()
+            panel["frame"].pack(fill="both", expand=True, padx=10, pady=10)
+            self._panel_actual = panel
+
+        if panel["dirty"] or panel["key"] != clave:
+            nuevo = panel["key"] != clave
+            panel["key"] = clave
+            panel["dirty"] = False
+            render(panel, nuevo)
+
+    def _on_ledger_change(self, op, item, antes):
+        # antes = entrada previa del LedgerIndex: (tipo, item, ym, fecha, ...)
+        if op == "reset":
+            # Restauración o vaciado: se reindexó todo, ya no queda carga pendiente
+            self._carga_pendiente = None
+        fechas = set()
+        if item is not None:
+            fechas.add(str(item.get("fecha", "")))
+        if antes:
+            fechas.add(antes[3])
+
+        for modo, panel in self._paneles.items():
+            if op == "reset" or modo in ("DASH", "SEARCH"):
+                panel["dirty"] = True
+            elif modo == "MONTH":
+                panel["dirty"] = panel["dirty"] or any(f[:7] == panel["key"] for f in fechas)
+            elif modo == "DAY":
+                panel["dirty"] = panel["dirty"] or panel["key"] in fechas
+
+    def _invalidar_paneles(self):
+        for panel in self._paneles.values():
+            panel["dirty"] = True
+
+    def _crear_panel_dashboard(self, parent):
+        p = {"kpi": {}}
 
         # ===== Barra de KPIs =====
         kpi_row = ctk.CTkFrame(parent, fg_color="transparent")
         kpi_row.pack(fill="x", pady=(0, 12))
 
-        def kpi_card(title, value, subtitle="", color=STYLE["primary"]):
-            card = ctk.CTkFrame(parent=kpi_row, fg_color=STYLE["white"], corner_radius=12, border_width=1, border_color=STYLE["line"])
+        for key, title in (("ingreso", "Ingreso estimado"), ("gastos", "Gastos del mes"),
+                           ("balance", "Balance"), ("proyeccion", "Saldo al cierre (proyectado)"),
+                           ("budgets", "Budgets")):
+            card = ctk.CTkFrame(kpi_row, fg_color=STYLE["white"], corner_radius=12, border_width=1, border_color=STYLE["line"])
             card.pack(side="left", expand=True, fill="x", padx=6)
 
-            ctk.CTkLabel(card, text=title, font=("Segoe UI", 11, "bold"), text_color=STYLE["text_light"]).pack(anchor="w", padx=12, pady=(10, 0))
-            ctk.CTkLabel(card, text=value, font=("Segoe UI", 18, "bold"), text_color=color).pack(anchor="w", padx=12, pady=(0, 0))
-            if subtitle:
-                ctk.CTkLabel(card, text=subtitle, font=("Segoe UI", 10), text_color=STYLE["text_light"]).pack(anchor="w", padx=12, pady=(0, 10))
-            else:
-                ctk.CTkLabel(card, text="", font=("Segoe UI", 10), text_color=STYLE["text_light"]).pack(anchor="w", padx=12, pady=(0, 10))
-
-        kpi_card("Ingreso estimado", fmt_money(ingreso), f"Salario semanal × {semanas_mes} semanas", STYLE["success"])
-        kpi_card("Gastos del mes", fmt_money(gastos), "Pagos + compras (pendientes)", self._kpi_color_gastos(gastos, ingreso))
-        kpi_card("Balance", fmt_money(balance), "Ingreso − gastos", self._kpi_color_balance(balance))
-
-        if pct_budget < 0:
-            pct_txt = "Sin budgets"
-            pct_color = STYLE["text_light"]
-        else:
-            pct_txt = f"{pct_budget * 100:.0f}% usado"
-            pct_color = self._kpi_color_budget(pct_budget)
-
-        kpi_card("Budgets", pct_txt, "Uso global mensual", pct_color)
+            ctk.CTkLabel(card, text=title, font=("Segoe UI", 11, "bold"),
+                         text_color=STYLE["text_light"]).pack(anchor="w", padx=12, pady=(10, 0))
+            value = ctk.CTkLabel(card, text="", font=("Segoe UI", 18, "bold"), text_color=STYLE["primary"])
+            value.pack(anchor="w", padx=12, pady=(0, 0))
+            subtitle = ctk.CTkLabel(card, text="", font=("Segoe UI", 10), text_color=STYLE["text_light"])
+            subtitle.pack(anchor="w", padx=12, pady=(0, 10))
+            p["kpi"][key] = (value, subtitle)
 
         # ===== Fila 2: Próximos pagos + Top categorías =====
         row2 = ctk.CTkFrame(parent, fg_color="transparent")
@@ -538,46 +4964,20 @@ class PagoApp(ctk.CTk):
         # ---- Próximos pagos ----
         header = ctk.CTkFrame(left, fg_color=STYLE["header_soft"], corner_radius=12)
         header.pack(fill="x")
-        ctk.CTkLabel(
-            header, text="🔔 Próximos pagos (10 días)",
+        p["prox_titulo"] = ctk.CTkLabel(
+            header, text="🔔 Próximos pagos",
             font=("Segoe UI", 14, "bold"), text_color=STYLE["text_main"]
-        ).pack(anchor="w", padx=12, pady=8)
+        )
+        p["prox_titulo"].pack(anchor="w", padx=12, pady=8)
 
         ctk.CTkFrame(left, fg_color=STYLE["line"], height=1).pack(fill="x")
 
-        if not proximos:
-            ctk.CTkLabel(left, text="No hay pagos próximos.", text_color=STYLE["text_light"]).pack(anchor="w", padx=12, pady=12)
-        else:
-            ctk.CTkLabel(
-                left,
-                text=f"Total: {fmt_money(total_prox)}",
-                font=("Segoe UI", 12, "bold"),
-                text_color=STYLE["text_main"]
-            ).pack(anchor="w", padx=12, pady=(10, 6))
-
-            sc = ctk.CTkScrollableFrame(left, fg_color="transparent")
-            sc.pack(fill="both", expand=True, padx=10, pady=(0, 10))
-
-            for p in proximos[:20]:
-                fecha_obj = parse_date_ymd(p.get("fecha", ""))
-                fecha_txt = fecha_obj.strftime("%d %b").upper() if fecha_obj else str(p.get("fecha", ""))
-                icon = get_cat_icon(p.get("categoria"))
-                nombre = p.get("nombre") or p.get("item") or ""
-                monto = safe_float(p.get("monto", 0))
-
-                r = ctk.CTkFrame(sc, fg_color=STYLE["white"], corner_radius=10, border_width=1, border_color=STYLE["line"])
-                r.pack(fill="x", pady=6)
-
-                ctk.CTkLabel(r, text=f"{fecha_txt}", width=90, anchor="w").pack(side="left", padx=(10, 0), pady=8)
-                ctk.CTkLabel(r, text=icon, width=40).pack(side="left", pady=8)
-                ctk.CTkLabel(r, text=nombre[:30], anchor="w").pack(side="left", fill="x", expand=True, padx=6, pady=8)
-                ctk.CTkLabel(r, text=fmt_money(monto), width=120, anchor="e").pack(side="left", padx=6, pady=8)
-                ctk.CTkButton(
-                    r, text="Pagar", width=80, height=28,
-                    fg_color="#D1D5DB", text_color=STYLE["text_main"],
-                    hover_color="#9CA3AF",
-                    command=lambda p=p: self.marcar_pagado(p)
-                ).pack(side="right", padx=10, pady=8)
+        p["prox_vacio"] = ctk.CTkLabel(left, text="No hay pagos próximos.", text_color=STYLE["text_light"])
+        p["prox_total"] = ctk.CTkLabel(left, text="", font=("Segoe UI", 12, "bold"), text_color=STYLE["text_main"])
+        p["prox_lista"] = VirtualList(left, {
+            "seccion": (30, self._crear_fila_fecha, self._cargar_fila_seccion),
+            "prox": (52, self._crear_fila_proximo, self._cargar_fila_proximo),
+        })
 
         # ---- Top categorías del mes ----
         header2 = ctk.CTkFrame(right, fg_color=STYLE["header_soft"], corner_radius=12)
@@ -589,30 +4989,173 @@ class PagoApp(ctk.CTk):
 
         ctk.CTkFrame(right, fg_color=STYLE["line"], height=1).pack(fill="x")
 
-        if not spent_by_cat:
-            ctk.CTkLabel(right, text="Sin gastos para graficar.", text_color=STYLE["text_light"]).pack(anchor="w", padx=12, pady=12)
-        else:
-            items = sorted(spent_by_cat.items(), key=lambda x: x[1], reverse=True)[:10]
-            cats = [k for k, _ in items][::-1]
-            vals = [v for _, v in items][::-1]
+        p["chart_vacio"] = ctk.CTkLabel(right, text="Sin gastos para graficar.", text_color=STYLE["text_light"])
 
-            fig = plt.Figure(figsize=(5, 3), dpi=100)
-            ax = fig.add_subplot(111)
-            ax.barh(cats, vals, color="#3B82F6")
-            ax.tick_params(axis="y", labelsize=9)
-            ax.tick_params(axis="x", labelsize=9)
+        p["chart"] = ChartImage(right, self.charts, "dash_cat", 500, 300)
 
-            canvas = FigureCanvasTkAgg(fig, master=right)
-            canvas.get_tk_widget().pack(fill="both", expand=True, padx=10, pady=10)
-            canvas.draw()
+        # ===== Fila 3: Metas de ahorro =====
+        metas = ctk.CTkFrame(parent, fg_color=STYLE["white"], corner_radius=12, border_width=1, border_color=STYLE["line"])
+        metas.pack(fill="both", expand=True, pady=(12, 0))
+
+        header3 = ctk.CTkFrame(metas, fg_color=STYLE["header_soft"], corner_radius=12)
+        header3.pack(fill="x")
+        ctk.CTkLabel(
+            header3, text="🎯 Metas de ahorro",
+            font=("Segoe UI", 14, "bold"), text_color=STYLE["text_main"]
+        ).pack(side="left", padx=12, pady=8)
+        p["ahorro_total"] = ctk.CTkLabel(header3, text="", font=("Segoe UI", 12, "bold"), text_color=STYLE["success"])
+        p["ahorro_total"].pack(side="right", padx=12, pady=8)
+
+        p["metas_vacio"] = ctk.CTkLabel(metas, text="Sin metas de ahorro (botón 🎯 Goals).", text_color=STYLE["text_light"])
+        p["metas_lista"] = VirtualList(metas, {
+            "meta": (56, self._crear_fila_meta, self._cargar_fila_meta),
+        })
 
         # ===== Atajos inferiores =====
         shortcuts = ctk.CTkFrame(parent, fg_color="transparent")
         shortcuts.pack(fill="x", pady=(12, 0))
 
-        ctk.CTkButton(shortcuts, text="📅 Ver mes detallado", fg_color="#111827", command=self.ir_mes, height=34, corner_radius=14).pack(side="left", padx=5)
-        ctk.CTkButton(shortcuts, text="📌 Ir a día seleccionado", fg_color="#111827", command=self.ir_dia, height=34, corner_radius=14).pack(side="left", padx=5)
-        
+        ctk.CTkButton(shortcuts, text="📅 Ver mes detallado", fg_color="#111827", command=self.ir_mes,
+                      height=34, corner_radius=14).pack(side="left", padx=5)
+        ctk.CTkButton(shortcuts, text="📌 Ir a día seleccionado", fg_color="#111827", command=self.ir_dia,
+                      height=34, corner_radius=14).pack(side="left", padx=5)
+        return p
+
+    def _crear_fila_proximo(self, parent):
+        outer = ctk.CTkFrame(parent, fg_color="transparent")
+        row = ctk.CTkFrame(outer, fg_color=STYLE["white"], corner_radius=10, border_width=1, border_color=STYLE["line"])
+        row.pack(fill="both", expand=True, pady=6)
+
+        r = {"frame": outer, "item": None}
+        r["fecha"] = ctk.CTkLabel(row, text="", width=90, anchor="w")
+        r["fecha"].pack(side="left", padx=(10, 0), pady=8)
+        r["icon"] = ctk.CTkLabel(row, text="", width=40)
+        r["icon"].pack(side="left", pady=8)
+        r["name"] = ctk.CTkLabel(row, text="", anchor="w")
+        r["name"].pack(side="left", fill="x", expand=True, padx=6, pady=8)
+        r["monto"] = ctk.CTkLabel(row, text="", width=120, anchor="e")
+        r["monto"].pack(side="left", padx=6, pady=8)
+        ctk.CTkButton(
+            row, text="Pagar", width=80, height=28,
+            fg_color="#D1D5DB", text_color=STYLE["text_main"],
+            hover_color="#9CA3AF",
+            command=lambda: self.marcar_pagado(r["item"])
+        ).pack(side="right", padx=10, pady=8)
+        return r
+
+    def _crear_fila_meta(self, parent):
+        outer = ctk.CTkFrame(parent, fg_color="transparent")
+        r = {"frame": outer}
+        top = ctk.CTkFrame(outer, fg_color="transparent")
+        top.pack(fill="x", padx=6, pady=(6, 0))
+        r["nombre"] = ctk.CTkLabel(top, text="", anchor="w", font=("Segoe UI", 12, "bold"))
+        r["nombre"].pack(side="left")
+        r["texto"] = ctk.CTkLabel(top, text="", anchor="e", font=("Segoe UI", 10), text_color=STYLE["text_light"])
+        r["texto"].pack(side="right")
+        r["barra"] = ctk.CTkProgressBar(outer, height=8)
+        r["barra"].pack(fill="x", padx=6, pady=(4, 6))
+        return r
+
+    def _cargar_fila_meta(self, r, dato):
+        meta, p = dato
+        r["nombre"].configure(text=meta.get("nombre", ""))
+        r["texto"].configure(text=self._texto_meta(meta, p))
+        r["barra"].configure(progress_color=STYLE["success"] if p["fraccion"] >= 1 else STYLE["primary"])
+        r["barra"].set(min(p["fraccion"], 1.0))
+
+    def _cargar_fila_seccion(self, r, texto):
+        r["frame"].configure(text=texto)
+
+    def _cargar_fila_proximo(self, r, p):
+        r["item"] = p
+        fecha_obj = parse_date_ymd(p.get("fecha", ""))
+        vencido = fecha_obj is not None and fecha_obj < date.today()
+        r["fecha"].configure(
+            text=fecha_obj.strftime("%d %b").upper() if fecha_obj else str(p.get("fecha", "")),
+            text_color=STYLE["danger"] if vencido else STYLE["text_main"],
+        )
+        r["icon"].configure(text=get_cat_icon(p.get("categoria")))
+        r["name"].configure(text=(p.get("nombre") or p.get("item") or "")[:30])
+        r["monto"].configure(text=fmt_money(monto_de(p)))
+
+    def render_dashboard(self, p, nuevo=False):
+        cache = self.get_month_cache()
+        gastos = cache["total"]
+        spent_by_cat = cache["spent_by_cat"]
+
+        ingreso, gastos_calc, balance, semanas_mes = self.calcular_balance_mensual()
+        spent_by_cat_all, pct_budget = self._compute_budget_usage_month()
+        vencidos, proximos, total_prox = self._compute_upcoming()
+
+        # ===== KPIs: solo texto y color =====
+        def kpi(key, value, subtitle, color):
+            lbl_value, lbl_sub = p["kpi"][key]
+            lbl_value.configure(text=value, text_color=color)
+            lbl_sub.configure(text=subtitle)
+
+        kpi("ingreso", fmt_money(ingreso), f"Salario semanal × {semanas_mes} cobros", STYLE["success"])
+        kpi("gastos", fmt_money(gastos), "Pagos + compras (pendientes)", self._kpi_color_gastos(gastos, ingreso))
+        kpi("balance", fmt_money(balance), "Ingreso − gastos", self._kpi_color_balance(balance))
+
+        fin_mes, primer_negativo = self._compute_proyeccion_mes()
+        if primer_negativo is not None:
+            aviso = f"Negativo desde el {primer_negativo.strftime('%d %b %Y')}"
+        else:
+            aviso = f"Sin saldo negativo en {self.projection_months} meses"
+        if fin_mes is None:
+            kpi("proyeccion", "—", aviso, STYLE["text_light"])
+        else:
+            kpi("proyeccion", fmt_money(fin_mes), aviso, self._kpi_color_balance(fin_mes))
+
+        if pct_budget < 0:
+            kpi("budgets", "Sin budgets", "Uso global mensual", STYLE["text_light"])
+        else:
+            kpi("budgets", f"{pct_budget * 100:.0f}% usado", "Uso global mensual", self._kpi_color_budget(pct_budget))
+
+        # ---- Próximos pagos: vencidos aparte, luego el horizonte ----
+        dias = self.upcoming_days
+        p["prox_titulo"].configure(text=f"🔔 Próximos pagos ({dias} días)")
+        rows = []
+        if vencidos:
+            rows.append(("seccion", f"⚠ Vencidos ({len(vencidos)}) · {fmt_money(sum(monto_de(x) for x in vencidos))}"))
+            rows.extend(("prox", x) for x in vencidos)
+        if proximos:
+            if vencidos:
+                rows.append(("seccion", f"📅 Próximos {dias} días"))
+            rows.extend(("prox", x) for x in proximos)
+        else:
+            siguientes = self._compute_siguientes(date.today().toordinal() + dias + 1)
+            if siguientes:
+                rows.append(("seccion", f"Nada en {dias} días · siguientes pagos"))
+                rows.extend(("prox", x) for x in siguientes)
+
+        self._mostrar_pack(p, "prox_vacio", not rows, anchor="w", padx=12, pady=12)
+        self._mostrar_pack(p, "prox_total", bool(proximos), anchor="w", padx=12, pady=(10, 6))
+        if proximos:
+            p["prox_total"].configure(text=f"Total: {fmt_money(total_prox)}")
+        if rows:
+            p["prox_lista"].set_rows(rows, keep_scroll=not nuevo)
+        self._mostrar_pack(p, "prox_lista", bool(rows), fill="both", expand=True, padx=10, pady=(0, 10))
+
+        # ---- Metas de ahorro: totales ya acumulados por SavingsTracker ----
+        hoy = date.today()
+        metas = [("meta", (m, self.ahorros.progreso(m, hoy))) for m in self.savings_goals]
+        p["ahorro_total"].configure(text=f"Ahorro total: {fmt_money(self.ahorros.total)}")
+        self._mostrar_pack(p, "metas_vacio", not metas, anchor="w", padx=12, pady=12)
+        if metas:
+            p["metas_lista"].set_rows(metas, keep_scroll=not nuevo)
+        self._mostrar_pack(p, "metas_lista", bool(metas), fill="both", expand=True, padx=10, pady=(0, 10))
+
+        # ---- Top categorías del mes: misma figura, datos nuevos ----
+        self._mostrar_pack(p, "chart_vacio", not spent_by_cat, anchor="w", padx=12, pady=12)
+        self._mostrar_pack(p, "chart", bool(spent_by_cat), fill="both", expand=True, padx=10, pady=10)
+        if spent_by_cat:
+            def datos():
+                items = sorted(spent_by_cat.items(), key=lambda x: x[1], reverse=True)[:10]
+                return "barh", ([k for k, _ in items][::-1], [v for _, v in items][::-1])
+
+            p["chart"].mostrar((p["key"], self.version_datos()), datos)
+
     # ================== CALENDARIO ==================
 
     def init_calendar_grid(self):
@@ -626,6 +5169,27 @@ class PagoApp(ctk.CTk):
                 text_color=STYLE["text_light"]
             ).pack(side="left", expand=True)
 
+        self.cal_grid = None
+        self.cal_canvas = None
+        self._montar_calendario()
+
+    def _montar_calendario(self):
+        if self.cal_grid is not None:
+            self.cal_grid.destroy()
+            self.cal_grid = None
+        if self.cal_canvas is not None:
+            self.cal_canvas.canvas.destroy()
+            self.cal_canvas = None
+
+        self._cal_cells = []
+        self._cal_por_fecha = {}
+        self._cal_sel_pintada = None
+
+        if self.calendar_renderer == "canvas":
+            self.cal_canvas = CanvasCalendar(self.cal_frame, self.seleccionar_dia)
+            self.cal_canvas.canvas.pack(fill="both", expand=True, padx=8, pady=8)
+            return
+
         self.cal_grid = ctk.CTkFrame(self.cal_frame, fg_color="transparent")
         self.cal_grid.pack(fill="both", expand=True, padx=8, pady=8)
 
@@ -634,81 +5198,172 @@ class PagoApp(ctk.CTk):
         for i in range(6):
             self.cal_grid.rowconfigure(i, weight=1)
 
-    def update_calendar(self):
-        for w in self.cal_grid.winfo_children():
-            w.destroy()
+        # Pool fijo de 6x7 celdas: update_calendar solo reconfigura texto,
+        # colores y bordes, y muestra u oculta lo que sobra.
+        for i in range(42):
+            r, c = divmod(i, 7)
+            frame = ctk.CTkFrame(
+                self.cal_grid, fg_color=STYLE["white"], corner_radius=10,
+                border_width=1, border_color=STYLE["line"]
+            )
+            frame.grid(row=r, column=c, sticky="nsew", padx=3, pady=3)
+            frame.grid_remove()
+
+            lbl_day = ctk.CTkLabel(frame, text="", font=("Segoe UI", 11, "bold"), text_color=STYLE["text_main"])
+            lbl_day.grid(row=0, column=0, sticky="nw", padx=5, pady=3)
+
+            lbl_items = []
+            for k in range(3):
+                lbl = ctk.CTkLabel(frame, text="", font=("Segoe UI", 9), text_color=STYLE["text_main"])
+                lbl.grid(row=1 + k, column=0, sticky="w", padx=5)
+                lbl.grid_remove()
+                lbl_items.append(lbl)
+
+            lbl_more = ctk.CTkLabel(frame, text="", font=("Segoe UI", 9, "bold"), text_color=STYLE["text_light"])
+            lbl_more.grid(row=4, column=0, sticky="w", padx=5, pady=(2, 4))
+            lbl_more.grid_remove()
+
+            for w in [frame, lbl_day, lbl_more] + lbl_items:
+                w.bind("<Button-1>", lambda e, i=i: self._click_celda(i))
+
+            self._cal_cells.append({
+                "frame": frame, "day": lbl_day, "items": lbl_items, "more": lbl_more,
+                "fecha": None, "cfg": {}, "visible": set(),
+            })
 
+    def _bg_por_total(self, total_day):
+        if total_day == 0:
+            return STYLE["white"]
+        if total_day < 500:
+            return STYLE["success_soft"]
+        if total_day < 2000:
+            return STYLE["warn_soft"]
+        return STYLE["danger_soft"]
+
+    def _modelo_calendario(self):
+        """Contenido de las 42 celdas del mes visible (None = hueco)."""
         weeks = calendar.Calendar(6).monthdayscalendar(self.anio_vis, self.mes_vis)
-        cache = self.get_month_cache()
-        mapa_items = cache["by_day"]
+        mapa_items = self.get_month_cache()["by_day"]
+        hoy_str = self.hoy.strftime("%Y-%m-%d")
 
-        for r, week in enumerate(weeks):
-            for c, day in enumerate(week):
+        celdas = []
+        for week in weeks:
+            for day in week:
                 if day == 0:
+                    celdas.append(None)
                     continue
 
                 f_str = f"{self.anio_vis}-{self.mes_vis:02d}-{day:02d}"
-                is_today = (f_str == self.hoy.strftime("%Y-%m-%d"))
-                is_selected = (f_str == self.fecha_seleccionada)
+                items = mapa_items.get(f_str, [])
+                total_day = sum(monto_de(x) for x in items)
+
+                lineas = []
+                for item in items[:3]:
+                    icon = get_cat_icon(item.get("categoria", "OTHER"))
+                    name = item.get("nombre") or item.get("item") or "ITEM"
+                    lineas.append(f"{icon} {name[:12]} {fmt_money(monto_de(item))}")
+
+                celdas.append({
+                    "day": day,
+                    "fecha": f_str,
+                    "bg": self._bg_por_total(total_day),
+                    "today": f_str == hoy_str,
+                    "lineas": lineas,
+                    "mas": max(0, len(items) - 3),
+                })
+
+        celdas.extend([None] * (42 - len(celdas)))
+        return celdas
+
+    def _cfg(self, cell, key, widget, **kw):
+        # Solo se llama a configure (que redibuja) si el valor cambió
+        if cell["cfg"].get(key) != kw:
+            widget.configure(**kw)
+            cell["cfg"][key] = kw
+
+    def _mostrar(self, cell, key, widget, visible):
+        if (key in cell["visible"]) == visible:
+            return
+        if visible:
+            widget.grid()
+            cell["visible"].add(key)
+        else:
+            widget.grid_remove()
+            cell["visible"].discard(key)
+
+    def _cfg_borde(self, cell, selected):
+        self._cfg(
+            cell, "border", cell["frame"],
+            border_width=2 if selected else 1,
+            border_color=STYLE["primary"] if selected else STYLE["line"],
+        )
 
-                total_day = sum(safe_float(x.get("monto", 0)) for x in mapa_items.get(f_str, []))
+    def cambiar_renderer_calendario(self):
+        self.calendar_renderer = "widgets" if self.calendar_renderer == "canvas" else "canvas"
+        self.guardar_config()
+        self._montar_calendario()
+        self.update_calendar()
 
-                if total_day == 0:
-                    bg = STYLE["white"]
-                elif total_day < 500:
-                    bg = STYLE["success_soft"]
-                elif total_day < 2000:
-                    bg = STYLE["warn_soft"]
-                else:
-                    bg = STYLE["danger_soft"]
+    def update_calendar(self):
+        if self.cal_canvas is not None:
+            self.cal_canvas.render(self._modelo_calendario(), self.fecha_seleccionada)
+            self._cal_sel_pintada = self.fecha_seleccionada
+            return
 
-                border_w = 2 if is_selected else 1
-                border_c = STYLE["primary"] if is_selected else STYLE["line"]
+        self._cal_por_fecha = {}
 
-                cell = ctk.CTkFrame(
-                    self.cal_grid, fg_color=bg, corner_radius=10,
-                    border_width=border_w, border_color=border_c
-                )
-                cell.grid(row=r, column=c, sticky="nsew", padx=3, pady=3)
+        for cell, m in zip(self._cal_cells, self._modelo_calendario()):
+            if m is None:
+                cell["fecha"] = None
+                self._mostrar(cell, "frame", cell["frame"], False)
+                continue
 
-                num_color = STYLE["primary"] if is_today else STYLE["text_main"]
-                lbl_day = ctk.CTkLabel(
-                    cell, text=str(day),
-                    font=("Segoe UI", 11, "bold"),
-                    text_color=num_color
-                )
-                lbl_day.pack(anchor="nw", padx=5, pady=3)
+            cell["fecha"] = m["fecha"]
+            self._cal_por_fecha[m["fecha"]] = cell
 
-                cell.bind("<Button-1>", lambda e, f=f_str: self.seleccionar_dia(f))
-                lbl_day.bind("<Button-1>", lambda e, f=f_str: self.seleccionar_dia(f))
+            self._cfg(cell, "bg", cell["frame"], fg_color=m["bg"])
+            self._cfg_borde(cell, m["fecha"] == self.fecha_seleccionada)
+            self._cfg(
+                cell, "day", cell["day"], text=str(m["day"]),
+                text_color=STYLE["primary"] if m["today"] else STYLE["text_main"],
+            )
 
-                for item in mapa_items.get(f_str, [])[:3]:
-                    cat = item.get("categoria", "OTHER")
-                    icon = get_cat_icon(cat)
-                    name = item.get("nombre") or item.get("item") or "ITEM"
-                    lbl_item = ctk.CTkLabel(
-                        cell,
-                        text=f"{icon} {name[:12]} {fmt_money(safe_float(item.get('monto', 0)))}",
-                        font=("Segoe UI", 9),
-                        text_color=STYLE["text_main"],
-                    )
-                    lbl_item.pack(anchor="w", padx=5)
-                    lbl_item.bind("<Button-1>", lambda e, f=f_str: self.seleccionar_dia(f))
-
-                if len(mapa_items.get(f_str, [])) > 3:
-                    lbl_more = ctk.CTkLabel(
-                        cell,
-                        text=f"+ {len(mapa_items[f_str]) - 3} más...",
-                        font=("Segoe UI", 9, "bold"),
-                        text_color=STYLE["text_light"]
-                    )
-                    lbl_more.pack(anchor="w", padx=5, pady=(2, 4))
-                    lbl_more.bind("<Button-1>", lambda e, f=f_str: self.seleccionar_dia(f))
+            for k, lbl in enumerate(cell["items"]):
+                if k < len(m["lineas"]):
+                    self._cfg(cell, f"item{k}", lbl, text=m["lineas"][k])
+                self._mostrar(cell, f"item{k}", lbl, k < len(m["lineas"]))
+
+            if m["mas"]:
+                self._cfg(cell, "more", cell["more"], text=f"+ {m['mas']} más...")
+            self._mostrar(cell, "more", cell["more"], bool(m["mas"]))
+
+            self._mostrar(cell, "frame", cell["frame"], True)
+
+        self._cal_sel_pintada = self.fecha_seleccionada
+
+    def _pintar_seleccion(self):
+        # Solo se tocan la celda seleccionada antes y la nueva
+        if self._cal_sel_pintada == self.fecha_seleccionada:
+            return
+        if self.cal_canvas is not None:
+            self.cal_canvas.set_selected(self.fecha_seleccionada)
+            self._cal_sel_pintada = self.fecha_seleccionada
+            return
+        for f, selected in ((self._cal_sel_pintada, False), (self.fecha_seleccionada, True)):
+            cell = self._cal_por_fecha.get(f)
+            if cell:
+                self._cfg_borde(cell, selected)
+        self._cal_sel_pintada = self.fecha_seleccionada
+
+    def _click_celda(self, i):
+        f = self._cal_cells[i]["fecha"]
+        if f:
+            self.seleccionar_dia(f)
 
     def seleccionar_dia(self, f):
         self.fecha_seleccionada = f
         self.view_mode = "DAY"
-        self.update_calendar()
+        self._pintar_seleccion()
         self.update_detail()
 
     # ================== BUSCADOR ==================
@@ -716,268 +5371,313 @@ class PagoApp(ctk.CTk):
     def on_search_change(self, *_):
         if self._search_after_id:
             self.after_cancel(self._search_after_id)
-        self._search_after_id = self.after(400, self._apply_search)
+        self._search_after_id = self.after(SEARCH_DEBOUNCE_MS, self._apply_search)
 
     def _apply_search(self):
         text = self.search_var.get().strip()
         self.view_mode = "SEARCH" if text else "DASH"
         self.update_detail()
 
-    def render_busqueda_editable(self, parent):
-        q = self.search_var.get().strip().upper()
-
+    def _crear_panel_busqueda(self, parent):
+        p = {}
         ctk.CTkLabel(
-            parent, text=f"🔍 Resultados de búsqueda",
+            parent, text="🔍 Resultados de búsqueda",
             font=("Segoe UI", 16, "bold"),
             text_color=STYLE["text_main"]
-        ).pack(anchor="w", pady=(0, 10))
+        ).pack(anchor="w", pady=(0, 2))
+
+        p["resumen"] = ctk.CTkLabel(parent, text="", font=("Segoe UI", 11), text_color=STYLE["text_light"])
+        p["resumen"].pack(anchor="w", pady=(0, 10))
+
+        p["vacio"] = ctk.CTkLabel(parent, text="Sin resultados.", text_color=STYLE["text_light"])
+        p["lista"] = VirtualList(parent, {
+            "row": (90, self._crear_fila_busqueda, self._cargar_fila_busqueda),
+        }, bg=STYLE["bg_app"])
+        return p
+
+    def buscar(self, texto):
+        """Busca en el ledger vivo y, si la consulta admite PAID, en el archivo."""
+        items, total = self.search_index.query(texto)
+        q = parse_search_query(texto)
+        if self.archivo is not None and len(self.archivo) and (not q.status or "PAID" in q.status):
+            if self._busqueda_archivo is None:
+                self._busqueda_archivo = SearchIndex(self.archivo)
+            viejos, total_viejos = self._busqueda_archivo.query(texto)
+            items = items + viejos
+            total += total_viejos
+        return items, total
+
+    def es_archivado(self, item):
+        return self.index.get(item.get("uid")) is not item
+
+    def render_busqueda_editable(self, p, nuevo=False):
+        if self._meses_cargados is not None:
+            # Con fecha:desde..hasta basta con los meses de ese rango
+            self._asegurar_meses(parse_search_query(p["key"]).particiones(self.store.meses()))
+        items, total = self.buscar(p["key"])
+        p["resumen"].configure(text=f"{len(items)} resultados · Total {fmt_money(total)}")
+
+        self._mostrar_pack(p, "vacio", not items, pady=20)
+        self._mostrar_pack(p, "lista", bool(items), fill="both", expand=True)
+        p["lista"].set_rows([("row", it) for it in items], keep_scroll=not nuevo)
+
+    # ---- Filas reutilizables (VirtualList) ----
+
+    def _guardar_fila(self, r):
+        it = r["item"]
+        cambios = {
+            "monto": safe_float(r["monto_var"].get()),
+            ("nombre" if "nombre" in it else "item"): r["name_var"].get().upper(),
+        }
+        if "fecha_var" in r:
+            cambios["fecha"] = normalizar_fecha(r["fecha_var"].get())
+        self.actualizar_registro(it, cambios)
+        self.guardar_datos()
+        self.actualizar_vistas()
 
-        items = []
-        for x in (self.pagos + self.compras):
-            blob = " ".join(str(v) for v in x.values()).upper()
-            if q in blob:
-                items.append(x)
+    def _eliminar_fila(self, r, pregunta):
+        if messagebox.askyesno("Confirmar", pregunta):
+            self.eliminar_registro(r["item"])
+            self.guardar_datos()
+            self.actualizar_vistas()
 
-        if not items:
-            ctk.CTkLabel(parent, text="Sin resultados.", text_color=STYLE["text_light"]).pack(pady=20)
+    def _mostrar_pack(self, r, key, visible, **pack_kw):
+        if r.get(f"_{key}_visible", False) == visible:
             return
+        if visible:
+            r[key].pack(**pack_kw)
+        else:
+            r[key].pack_forget()
+        r[f"_{key}_visible"] = visible
 
-        if len(items) > 30:
-            ctk.CTkLabel(parent, text=f"Mostrando 30 de {len(items)} resultados.", text_color=STYLE["warn"], font=("Segoe UI", 10, "bold")).pack(pady=5)
-            items = items[:30]
-
+    def _crear_fila_busqueda(self, parent):
         outer = ctk.CTkFrame(parent, fg_color="transparent")
-        outer.pack(fill="both", expand=True)
-
-        canvas = tk.Canvas(outer, bg=STYLE["bg_app"], highlightthickness=0)
-        canvas.pack(side="left", fill="both", expand=True)
+        row = ctk.CTkFrame(outer, fg_color=STYLE["white"], corner_radius=10, border_width=1, border_color=STYLE["line"])
+        row.pack(fill="both", expand=True, pady=4, padx=6)
 
-        v_scroll = ttk.Scrollbar(outer, orient="vertical", command=canvas.yview)
-        v_scroll.pack(side="right", fill="y")
-
-        canvas.configure(yscrollcommand=v_scroll.set)
-
-        inner = ctk.CTkFrame(canvas, fg_color="transparent")
-        canvas.create_window((0, 0), window=inner, anchor="nw")
-
-        def _on_configure(event):
-            canvas.configure(scrollregion=canvas.bbox("all"))
-            canvas.itemconfig(canvas.find_withtag("all")[0], width=event.width)
+        r = {
+            "frame": outer, "item": None,
+            "name_var": tk.StringVar(), "monto_var": tk.StringVar(), "fecha_var": tk.StringVar(),
+        }
 
-        canvas.bind("<Configure>", _on_configure)
-        inner.bind("<Configure>", _on_configure)
+        top = ctk.CTkFrame(row, fg_color="transparent")
+        top.pack(fill="x", padx=10, pady=(8, 0))
 
-        for it in items:
-            row = ctk.CTkFrame(inner, fg_color=STYLE["white"], corner_radius=10, border_width=1, border_color=STYLE["line"])
-            row.pack(fill="x", pady=4, padx=6)
+        r["icon"] = ctk.CTkLabel(top, text="", width=30)
+        r["icon"].pack(side="left")
+        ctk.CTkEntry(top, textvariable=r["name_var"], width=220).pack(side="left", padx=5)
+        ctk.CTkEntry(top, textvariable=r["monto_var"], width=100).pack(side="left", padx=5)
+        ctk.CTkEntry(top, textvariable=r["fecha_var"], width=100).pack(side="left", padx=5)
 
-            name_var = tk.StringVar(value=it.get("nombre") or it.get("item") or "")
-            monto_var = tk.StringVar(value=str(it.get("monto", "")))
-            fecha_var = tk.StringVar(value=it.get("fecha", ""))
+        bottom = ctk.CTkFrame(row, fg_color="transparent")
+        bottom.pack(fill="x", padx=10, pady=(0, 8))
 
-            top = ctk.CTkFrame(row, fg_color="transparent")
-            top.pack(fill="x", padx=10, pady=(8, 0))
+        r["pagar"] = ctk.CTkButton(
+            bottom, text="Pagar",
+            fg_color="#D1D5DB", text_color=STYLE["text_main"],
+            hover_color="#9CA3AF", height=24, width=60,
+            command=lambda: self.marcar_pagado(r["item"])
+        )
+        r["pagado"] = ctk.CTkLabel(bottom, text="✓ PAGADO", text_color=STYLE["success"], font=("Segoe UI", 10, "bold"))
 
-            ctk.CTkLabel(top, text=get_cat_icon(it.get("categoria")), width=30).pack(side="left")
-            ctk.CTkEntry(top, textvariable=name_var, width=220).pack(side="left", padx=5)
-            ctk.CTkEntry(top, textvariable=monto_var, width=100).pack(side="left", padx=5)
-            ctk.CTkEntry(top, textvariable=fecha_var, width=100).pack(side="left", padx=5)
+        # Los registros del archivo histórico son de solo lectura
+        r["guardar"] = ctk.CTkButton(bottom, text="Guardar", command=lambda: self._guardar_fila(r), height=24, width=60)
+        r["eliminar"] = ctk.CTkButton(
+            bottom, text="Eliminar", fg_color=STYLE["danger"], height=24, width=60,
+            command=lambda: self._eliminar_fila(r, "¿Eliminar este registro?")
+        )
+        r["archivado"] = ctk.CTkLabel(bottom, text="🗄 ARCHIVADO", text_color=STYLE["text_light"],
+                                      font=("Segoe UI", 10, "bold"))
+        return r
+
+    def _cargar_fila_busqueda(self, r, it):
+        r["item"] = it
+        r["name_var"].set(it.get("nombre") or it.get("item") or "")
+        r["monto_var"].set(str(it.get("monto", "")))
+        r["fecha_var"].set(it.get("fecha", ""))
+        r["icon"].configure(text=get_cat_icon(it.get("categoria")))
+
+        es_pago = "nombre" in it
+        pagado = it.get("status") == "PAID"
+        archivado = self.es_archivado(it)
+        self._mostrar_pack(r, "pagar", es_pago and not pagado, side="left", padx=5)
+        self._mostrar_pack(r, "pagado", es_pago and pagado, side="left", padx=5)
+        self._mostrar_pack(r, "guardar", not archivado, side="right", padx=5)
+        self._mostrar_pack(r, "eliminar", not archivado, side="right", padx=5)
+        self._mostrar_pack(r, "archivado", archivado, side="right", padx=5)
+
+    def _crear_fila_fecha(self, parent):
+        lbl = ctk.CTkLabel(parent, text="", font=("Segoe UI", 12, "bold"), text_color=STYLE["primary"], anchor="sw")
+        return {"frame": lbl}
+
+    def _cargar_fila_fecha(self, r, fecha):
+        r["frame"].configure(text=f"📅 {fecha}")
+
+    def _crear_fila_mes(self, parent):
+        outer = ctk.CTkFrame(parent, fg_color="transparent")
+        row = ctk.CTkFrame(outer, fg_color=STYLE["bg_app"], corner_radius=8)
+        row.pack(fill="both", expand=True, pady=2)
+
+        r = {"frame": outer, "item": None}
+        r["icon"] = ctk.CTkLabel(row, text="", width=30)
+        r["icon"].pack(side="left", padx=5)
+        r["name"] = ctk.CTkLabel(row, text="", width=250, anchor="w")
+        r["name"].pack(side="left", fill="x", expand=True)
+        r["cat"] = ctk.CTkLabel(row, text="", width=120, anchor="w", text_color=STYLE["text_light"], font=("Segoe UI", 10))
+        r["cat"].pack(side="left")
+        r["monto"] = ctk.CTkLabel(row, text="", width=100, anchor="e", font=("Segoe UI", 12, "bold"))
+        r["monto"].pack(side="right", padx=10)
+
+        def abrir(e=None):
+            it = r["item"]
+            self.editar_item(it, "pago" if "nombre" in it else "compra")
+
+        row.bind("<Button-1>", abrir)
+        for child in row.winfo_children():
+            child.bind("<Button-1>", abrir)
+        return r
+
+    def _cargar_fila_mes(self, r, it):
+        r["item"] = it
+        r["icon"].configure(text=get_cat_icon(it.get("categoria")))
+        r["name"].configure(text=(it.get("nombre") or it.get("item") or "")[:40])
+        r["cat"].configure(text=it.get("categoria", ""))
+        r["monto"].configure(text=fmt_money(monto_de(it)))
+
+    def _crear_fila_dia(self, parent):
+        outer = ctk.CTkFrame(parent, fg_color="transparent")
+        row = ctk.CTkFrame(outer, fg_color=STYLE["bg_app"], corner_radius=10, border_width=1, border_color=STYLE["line"])
+        row.pack(fill="both", expand=True, pady=6)
 
-            bottom = ctk.CTkFrame(row, fg_color="transparent")
-            bottom.pack(fill="x", padx=10, pady=(0, 8))
+        r = {"frame": outer, "item": None, "name_var": tk.StringVar(), "monto_var": tk.StringVar()}
 
-            def guardar(it=it, name_var=name_var, monto_var=monto_var, fecha_var=fecha_var):
-                it["monto"] = safe_float(monto_var.get())
-                it["fecha"] = fecha_var.get()
-                if "nombre" in it:
-                    it["nombre"] = name_var.get().upper()
-                else:
-                    it["item"] = name_var.get().upper()
-                self.guardar_datos()
-                self.actualizar_vistas()
+        top = ctk.CTkFrame(row, fg_color="transparent")
+        top.pack(fill="x", padx=10, pady=(8, 0))
 
-            def eliminar(it=it, row=row):
-                if messagebox.askyesno("Confirmar", "¿Eliminar este registro?"):
-                    if it in self.pagos:
-                        self.pagos.remove(it)
-                    elif it in self.compras:
-                        self.compras.remove(it)
-                    self.guardar_datos()
-                    row.destroy()
-                    self.actualizar_vistas()
+        r["icon"] = ctk.CTkLabel(top, text="", width=30)
+        r["icon"].pack(side="left")
+        ctk.CTkEntry(top, textvariable=r["name_var"], width=260).pack(side="left", padx=5, fill="x", expand=True)
+        ctk.CTkEntry(top, textvariable=r["monto_var"], width=120).pack(side="right", padx=5)
 
-            if "nombre" in it and it.get("status") != "PAID":
-                ctk.CTkButton(
-                    bottom, text="Pagar",
-                    fg_color="#D1D5DB", text_color=STYLE["text_main"],
-                    hover_color="#9CA3AF", height=24, width=60,
-                    command=lambda it=it: self.marcar_pagado(it)
-                ).pack(side="left", padx=5)
-            elif "nombre" in it:
-                ctk.CTkLabel(bottom, text="✓ PAGADO", text_color=STYLE["success"], font=("Segoe UI", 10, "bold")).pack(side="left", padx=5)
-
-            ctk.CTkButton(bottom, text="Guardar", command=guardar, height=24, width=60).pack(side="right", padx=5)
-            ctk.CTkButton(bottom, text="Eliminar", fg_color=STYLE["danger"], command=eliminar, height=24, width=60).pack(side="right", padx=5)
-
-    def render_resumen_mensual(self, parent):
-        if self.view_mode != "MONTH":
-            return
-            
-        mes_prefix = f"{self.anio_vis}-{self.mes_vis:02d}"
-        data = [
-            x for x in (self.pagos + self.compras)
-            if str(x.get("fecha", "")).startswith(mes_prefix)
-            and x.get("status", "PENDING") != "PAID"
-        ]
+        bottom = ctk.CTkFrame(row, fg_color="transparent")
+        bottom.pack(fill="x", padx=10, pady=(4, 8))
 
+        r["pagar"] = ctk.CTkButton(
+            bottom, text="Marcar Pagado",
+            fg_color=STYLE["success"], text_color=STYLE["white"],
+            height=24, width=100,
+            command=lambda: self.marcar_pagado(r["item"])
+        )
+        ctk.CTkButton(
+            bottom, text="Eliminar", fg_color=STYLE["danger"], height=24, width=80,
+            command=lambda: self._eliminar_fila(r, "¿Eliminar registro?")
+        ).pack(side="right", padx=5)
+        ctk.CTkButton(bottom, text="Guardar", height=24, width=80,
+                      command=lambda: self._guardar_fila(r)).pack(side="right", padx=5)
+        return r
+
+    def _cargar_fila_dia(self, r, it):
+        r["item"] = it
+        r["name_var"].set(it.get("nombre") or it.get("item") or "")
+        r["monto_var"].set(str(it.get("monto", "")))
+        r["icon"].configure(text=get_cat_icon(it.get("categoria")))
+        self._mostrar_pack(r, "pagar", "nombre" in it, side="left", padx=5)
+
+    def _crear_panel_mes(self, parent):
+        p = {}
         card = ctk.CTkFrame(parent, fg_color=STYLE["white"], corner_radius=12, border_width=1, border_color=STYLE["line"])
         card.pack(fill="both", expand=True, pady=(0, 15))
 
-        ctk.CTkLabel(
-            card, text=f"📘 Resumen Mensual Completo ({calendar.month_name[self.mes_vis]} {self.anio_vis})",
-            font=("Segoe UI", 16, "bold"), text_color=STYLE["text_main"]
-        ).pack(anchor="w", padx=12, pady=(10, 10))
+        p["titulo"] = ctk.CTkLabel(card, text="", font=("Segoe UI", 16, "bold"), text_color=STYLE["text_main"])
+        p["titulo"].pack(anchor="w", padx=12, pady=(10, 10))
 
-        if not data:
-            ctk.CTkLabel(card, text="No hay transacciones registradas este mes.", text_color=STYLE["text_light"]).pack(pady=20)
-            return
+        p["vacio"] = ctk.CTkLabel(card, text="No hay transacciones registradas este mes.", text_color=STYLE["text_light"])
+        p["lista"] = VirtualList(card, {
+            "fecha": (40, self._crear_fila_fecha, self._cargar_fila_fecha),
+            "item": (40, self._crear_fila_mes, self._cargar_fila_mes),
+        })
+        return p
 
-        scroll = ctk.CTkScrollableFrame(card, fg_color="transparent")
-        scroll.pack(fill="both", expand=True, padx=10, pady=10)
+    def render_resumen_mensual(self, p, nuevo=False):
+        por_fecha = self.repo.month_by_day(p["key"])
+        p["titulo"].configure(text=f"📘 Resumen Mensual Completo ({calendar.month_name[self.mes_vis]} {self.anio_vis})")
 
-        por_fecha = {}
-        for x in data:
-            f = x.get("fecha", "")
-            por_fecha.setdefault(f, []).append(x)
-
-        for f in sorted(por_fecha.keys()):
-            ctk.CTkLabel(scroll, text=f"📅 {f}", font=("Segoe UI", 12, "bold"), text_color=STYLE["primary"]).pack(anchor="w", pady=(10,2))
-            for it in por_fecha[f]:
-                row = ctk.CTkFrame(scroll, fg_color=STYLE["bg_app"], corner_radius=8)
-                row.pack(fill="x", pady=2)
-                
-                icon = get_cat_icon(it.get("categoria"))
-                name = it.get("nombre") or it.get("item") or ""
-                
-                ctk.CTkLabel(row, text=icon, width=30).pack(side="left", padx=5)
-                ctk.CTkLabel(row, text=name[:40], width=250, anchor="w").pack(side="left", fill="x", expand=True)
-                ctk.CTkLabel(row, text=it.get("categoria", ""), width=120, anchor="w", text_color=STYLE["text_light"], font=("Segoe UI", 10)).pack(side="left")
-                ctk.CTkLabel(row, text=fmt_money(safe_float(it.get("monto", 0))), width=100, anchor="e", font=("Segoe UI", 12, "bold")).pack(side="right", padx=10)
-
-                tipo_obj = 'pago' if 'nombre' in it else 'compra'
-                row.bind("<Button-1>", lambda e, x=it, t=tipo_obj: self.editar_item(x, t))
-                for child in row.winfo_children():
-                    child.bind("<Button-1>", lambda e, x=it, t=tipo_obj: self.editar_item(x, t))
-
-    def render_detalle_dia(self, parent):
-        if self.view_mode != "DAY":
-            return
-            
+        rows = []
+        for f in sorted(por_fecha):
+            rows.append(("fecha", f))
+            rows.extend(("item", it) for it in por_fecha[f])
+
+        self._mostrar_pack(p, "vacio", not rows, pady=20)
+        self._mostrar_pack(p, "lista", bool(rows), fill="both", expand=True, padx=10, pady=10)
+        p["lista"].set_rows(rows, keep_scroll=not nuevo)
+
+    def _crear_panel_dia(self, parent):
+        p = {}
         card = ctk.CTkFrame(parent, fg_color=STYLE["white"], corner_radius=12, border_width=1, border_color=STYLE["line"])
         card.pack(fill="both", expand=True, pady=(0, 15))
 
         header = ctk.CTkFrame(card, fg_color="transparent")
         header.pack(fill="x", padx=12, pady=(10, 4))
-        
-        ctk.CTkLabel(
-            header, text=f"📅 Detalle del Día: {self.fecha_seleccionada}",
-            font=("Segoe UI", 16, "bold"), text_color=STYLE["text_main"]
-        ).pack(side="left")
-
-        ctk.CTkButton(header, text="Cerrar Día", width=80, height=24, fg_color=STYLE["line"], text_color=STYLE["text_main"], hover_color="#9CA3AF", command=self.ir_mes).pack(side="right")
-
-        scroll = ctk.CTkScrollableFrame(card, fg_color="transparent")
-        scroll.pack(fill="both", expand=True, padx=10, pady=10)
-
-        items = [
-            x for x in (self.pagos + self.compras)
-            if x.get("fecha") == self.fecha_seleccionada and x.get("status", "PENDING") != "PAID"
-        ]
 
-        if not items:
-            ctk.CTkLabel(scroll, text="No hay movimientos en esta fecha.", text_color=STYLE["text_light"]).pack(pady=20)
-            return
-
-        for it in items:
-            row = ctk.CTkFrame(scroll, fg_color=STYLE["bg_app"], corner_radius=10, border_width=1, border_color=STYLE["line"])
-            row.pack(fill="x", pady=6)
-
-            name_var = tk.StringVar(value=it.get("nombre") or it.get("item") or "")
-            monto_var = tk.StringVar(value=str(it.get("monto", "")))
-            
-            top = ctk.CTkFrame(row, fg_color="transparent")
-            top.pack(fill="x", padx=10, pady=(8, 0))
-
-            ctk.CTkLabel(top, text=get_cat_icon(it.get("categoria")), width=30).pack(side="left")
-            ctk.CTkEntry(top, textvariable=name_var, width=260).pack(side="left", padx=5, fill="x", expand=True)
-            ctk.CTkEntry(top, textvariable=monto_var, width=120).pack(side="right", padx=5)
+        p["titulo"] = ctk.CTkLabel(header, text="", font=("Segoe UI", 16, "bold"), text_color=STYLE["text_main"])
+        p["titulo"].pack(side="left")
 
-            bottom = ctk.CTkFrame(row, fg_color="transparent")
-            bottom.pack(fill="x", padx=10, pady=(4, 8))
-
-            def guardar(it=it, n_var=name_var, m_var=monto_var):
-                it["monto"] = safe_float(m_var.get())
-                if "nombre" in it:
-                    it["nombre"] = n_var.get().upper()
-                else:
-                    it["item"] = n_var.get().upper()
-                self.guardar_datos()
-                self.actualizar_vistas()
+        ctk.CTkButton(header, text="Cerrar Día", width=80, height=24, fg_color=STYLE["line"], text_color=STYLE["text_main"],
+                      hover_color="#9CA3AF", command=self.ir_mes).pack(side="right")
 
-            def eliminar(it=it):
-                if messagebox.askyesno("Confirmar", "¿Eliminar registro?"):
-                    if it in self.pagos:
-                        self.pagos.remove(it)
-                    elif it in self.compras:
-                        self.compras.remove(it)
-                    self.guardar_datos()
-                    self.actualizar_vistas()
+        p["vacio"] = ctk.CTkLabel(card, text="No hay movimientos en esta fecha.", text_color=STYLE["text_light"])
+        p["lista"] = VirtualList(card, {
+            "row": (100, self._crear_fila_dia, self._cargar_fila_dia),
+        })
+        return p
 
-            if "nombre" in it:
-                ctk.CTkButton(
-                    bottom, text="Marcar Pagado",
-                    fg_color=STYLE["success"], text_color=STYLE["white"],
-                    height=24, width=100,
-                    command=lambda it=it: self.marcar_pagado(it)
-                ).pack(side="left", padx=5)
+    def render_detalle_dia(self, p, nuevo=False):
+        p["titulo"].configure(text=f"📅 Detalle del Día: {p['key']}")
+        items = self.repo.day_items(p["key"])
 
-            ctk.CTkButton(bottom, text="Eliminar", fg_color=STYLE["danger"], height=24, width=80, command=eliminar).pack(side="right", padx=5)
-            ctk.CTkButton(bottom, text="Guardar", height=24, width=80, command=guardar).pack(side="right", padx=5)
+        self._mostrar_pack(p, "vacio", not items, pady=20)
+        self._mostrar_pack(p, "lista", bool(items), fill="both", expand=True, padx=10, pady=10)
+        p["lista"].set_rows([("row", it) for it in items], keep_scroll=not nuevo)
 
     # ================== BUDGETS ==================
 
     def manage_budgets(self):
         v = ctk.CTkToplevel(self)
         v.title("Presupuestos y Avances")
-        v.geometry("500x600")
+        v.geometry("500x680")
         v.attributes("-topmost", True)
 
         ctk.CTkLabel(v, text="Control de Presupuestos Mensuales", font=("Segoe UI", 16, "bold")).pack(pady=10)
-        
+
         mes_prefix = f"{self.anio_vis}-{self.mes_vis:02d}"
-        spent_by_cat = {}
-        for x in (self.pagos + self.compras):
-            if str(x.get("fecha", "")).startswith(mes_prefix) and x.get("status", "PENDING") != "PAID":
-                cat = x.get("categoria", "OTHER")
-                spent_by_cat[cat] = spent_by_cat.get(cat, 0.0) + safe_float(x.get("monto", 0.0))
+        spent_by_cat = self.control_budgets.por_categoria(mes_prefix)
+        limites = self.presupuestos_mes(mes_prefix)
+        ajustes = self.budget_overrides.get(mes_prefix, {})
+
+        solo_mes = ctk.CTkCheckBox(v, text=f"Guardar como ajuste solo para {mes_prefix}")
+        if ajustes:
+            solo_mes.select()
+        solo_mes.pack(pady=(0, 4))
 
         scroll = ctk.CTkScrollableFrame(v, fg_color="transparent")
         scroll.pack(fill="both", expand=True, padx=10, pady=10)
 
         entries = {}
-        all_cats = sorted(list(set(self.categorias_pago + self.categorias_compra)))
-        
+        # El ahorro no es gasto: SAVINGS se sigue con las metas, no con budgets
+        all_cats = sorted(set(self.categorias_pago + self.categorias_compra) - {AHORRO_CATEGORIA})
+
         for c in all_cats:
             row = ctk.CTkFrame(scroll, fg_color=STYLE["white"], corner_radius=8, border_width=1, border_color=STYLE["line"])
             row.pack(fill="x", pady=4, padx=5)
 
             spent = spent_by_cat.get(c, 0.0)
-            budget = self.budgets.get(c, 0.0)
+            budget = safe_float(limites.get(c), 0.0)
 
             top_row = ctk.CTkFrame(row, fg_color="transparent")
-            top_row.pack(fill="x", padx=10, pady=(8,0))
+            top_row.pack(fill="x", padx=10, pady=(8, 0))
 
-            ctk.CTkLabel(top_row, text=c, width=150, anchor="w", font=("Segoe UI", 12, "bold")).pack(side="left")
+            ctk.CTkLabel(top_row, text=c + (" *" if c in ajustes else ""), width=150, anchor="w",
+                         font=("Segoe UI", 12, "bold")).pack(side="left")
 
             e = ctk.CTkEntry(top_row, width=90, placeholder_text="Límite $")
             if budget > 0:
@@ -986,7 +5686,7 @@ class PagoApp(ctk.CTk):
             entries[c] = e
 
             bottom_row = ctk.CTkFrame(row, fg_color="transparent")
-            bottom_row.pack(fill="x", padx=10, pady=(4,8))
+            bottom_row.pack(fill="x", padx=10, pady=(4, 8))
 
             if budget > 0:
                 pct = spent / budget
@@ -996,28 +5696,141 @@ class PagoApp(ctk.CTk):
 
                 pb = ctk.CTkProgressBar(bottom_row, height=8, progress_color=color)
                 pb.set(min(pct, 1.0))
-                pb.pack(side="right", fill="x", expand=True, padx=(10,0))
+                pb.pack(side="right", fill="x", expand=True, padx=(10, 0))
             else:
-                ctk.CTkLabel(bottom_row, text=f"Gastado: {fmt_money(spent)} (Sin límite definido)", text_color=STYLE["text_light"], font=("Segoe UI", 10)).pack(side="left")
+                ctk.CTkLabel(bottom_row, text=f"Gastado: {fmt_money(spent)} (Sin límite definido)",
+                             text_color=STYLE["text_light"], font=("Segoe UI", 10)).pack(side="left")
+
+        # Umbrales de aviso en % del límite
+        avisos_row = ctk.CTkFrame(v, fg_color="transparent")
+        avisos_row.pack(fill="x", padx=15)
+        ctk.CTkLabel(avisos_row, text="Avisar al llegar a (%):", font=("Segoe UI", 11)).pack(side="left")
+        e_avisos = ctk.CTkEntry(avisos_row, width=140)
+        e_avisos.insert(0, ", ".join(f"{u * 100:g}" for u in self.budget_alerts))
+        e_avisos.pack(side="right")
 
         def save():
-            self.budgets.clear()
-            for c, e in entries.items():
-                val = e.get().strip()
-                if val and safe_float(val) > 0:
-                    self.budgets[c] = safe_float(val)
+            if solo_mes.get():
+                # Ajuste del mes: lo que coincide con el global no se guarda; 0 = sin límite
+                mes = {}
+                for c, e in entries.items():
+                    val = safe_float(e.get().strip(), 0.0)
+                    if val != safe_float(self.budgets.get(c), 0.0):
+                        mes[c] = max(val, 0.0)
+                if mes:
+                    self.budget_overrides[mes_prefix] = mes
+                else:
+                    self.budget_overrides.pop(mes_prefix, None)
+            else:
+                self.budgets.clear()
+                for c, e in entries.items():
+                    val = e.get().strip()
+                    if val and safe_float(val) > 0:
+                        self.budgets[c] = safe_float(val)
+                self.budget_overrides.pop(mes_prefix, None)
+            umbrales = sorted({safe_float(u) / 100 for u in e_avisos.get().replace(";", ",").split(",") if safe_float(u) > 0})
+            self.budget_alerts = umbrales or list(BUDGET_UMBRALES)
+            self.control_budgets.umbrales = self.budget_alerts
             self.guardar_config()
             self.actualizar_vistas()
             v.destroy()
 
         ctk.CTkButton(v, text="Guardar Presupuestos", command=save, fg_color=STYLE["primary"]).pack(pady=10)
 
+    # ================== METAS DE AHORRO ==================
+
+    def gestionar_metas(self):
+        v = ctk.CTkToplevel(self)
+        v.title("Metas de Ahorro")
+        v.geometry("500x640")
+        v.attributes("-topmost", True)
+
+        ctk.CTkLabel(v, text="Metas de Ahorro", font=("Segoe UI", 16, "bold")).pack(pady=(10, 0))
+        ctk.CTkLabel(v, text=f"Ahorro total ({AHORRO_CATEGORIA}): {fmt_money(self.ahorros.total)}",
+                     text_color=STYLE["text_light"]).pack(pady=(0, 6))
+
+        scroll = ctk.CTkScrollableFrame(v, fg_color="transparent")
+        scroll.pack(fill="both", expand=True, padx=10, pady=5)
+
+        def reabrir():
+            self.ahorros.set_metas(self.savings_goals)
+            self.guardar_config()
+            self.actualizar_vistas()
+            v.destroy()
+            self.gestionar_metas()
+
+        def borrar(meta):
+            if messagebox.askyesno("Confirmar", f"¿Eliminar la meta '{meta.get('nombre', '')}'?\n"
+                                                "Los ahorros registrados no se borran."):
+                self.savings_goals[:] = [m for m in self.savings_goals if m is not meta]
+                reabrir()
+
+        if not self.savings_goals:
+            ctk.CTkLabel(scroll, text="Sin metas todavía.", text_color=STYLE["text_light"]).pack(pady=20)
+        for meta in self.savings_goals:
+            p = self.ahorros.progreso(meta, date.today())
+            row = ctk.CTkFrame(scroll, fg_color=STYLE["white"], corner_radius=8, border_width=1, border_color=STYLE["line"])
+            row.pack(fill="x", pady=4, padx=5)
+
+            top_row = ctk.CTkFrame(row, fg_color="transparent")
+            top_row.pack(fill="x", padx=10, pady=(8, 0))
+            ctk.CTkLabel(top_row, text=meta.get("nombre", ""), anchor="w", font=("Segoe UI", 12, "bold")).pack(side="left")
+            ctk.CTkButton(top_row, text="Eliminar", width=70, height=24, fg_color=STYLE["danger"],
+                          command=lambda m=meta: borrar(m)).pack(side="right")
+
+            color = STYLE["success"] if p["fraccion"] >= 1 else STYLE["primary"]
+            pb = ctk.CTkProgressBar(row, height=8, progress_color=color)
+            pb.set(min(p["fraccion"], 1.0))
+            pb.pack(fill="x", padx=10, pady=(6, 0))
+            ctk.CTkLabel(row, text=self._texto_meta(meta, p), text_color=STYLE["text_light"],
+                         font=("Segoe UI", 10), anchor="w", justify="left").pack(fill="x", padx=10, pady=(2, 8))
+
+        # ---- Nueva meta ----
+        form = ctk.CTkFrame(v, fg_color="transparent")
+        form.pack(fill="x", padx=15, pady=5)
+        en = ctk.CTkEntry(form, placeholder_text="Nombre de la meta")
+        em = ctk.CTkEntry(form, placeholder_text="Monto objetivo")
+        ef = ctk.CTkEntry(form, placeholder_text="Fecha límite YYYY-MM-DD (opcional)")
+        ep = ctk.CTkEntry(form, placeholder_text="Prefijo del concepto (vacío = toda la categoría)")
+        ec = ctk.CTkComboBox(form, values=sorted(set(self.categorias_compra + self.categorias_pago)))
+        ec.set(AHORRO_CATEGORIA)
+        for w in (en, em, ef, ep, ec):
+            w.pack(fill="x", pady=3)
+
+        def agregar():
+            objetivo = safe_float(em.get(), 0.0)
+            if not en.get().strip() or objetivo <= 0:
+                messagebox.showerror("Error", "Indica un nombre y un monto objetivo mayor que 0")
+                return
+            if ef.get().strip() and not parse_date_ymd(ef.get().strip()):
+                messagebox.showerror("Error", "Fecha límite inválida (YYYY-MM-DD)")
+                return
+            self.savings_goals.append({
+                "id": f"m{uuid.uuid4().hex[:12]}",
+                "nombre": en.get().strip().upper(),
+                "meta": objetivo,
+                "fecha_limite": normalizar_fecha(ef.get().strip()),
+                "categoria": ec.get(),
+                "prefijo": ep.get().strip().upper(),
+            })
+            reabrir()
+
+        ctk.CTkButton(v, text="Agregar Meta", command=agregar, fg_color=STYLE["primary"]).pack(pady=10)
+
+    def _texto_meta(self, meta, p):
+        texto = f"{fmt_money(p['ahorrado'])} de {fmt_money(safe_float(meta.get('meta'), 0.0))} ({p['fraccion'] * 100:.0f}%)"
+        if p["falta"] <= 0:
+            return texto + " · ¡Meta cumplida!"
+        if p["mensual"] is not None:
+            texto += f" · {fmt_money(p['mensual'])}/mes hasta {meta.get('fecha_limite')}"
+        return texto + f" · este mes {fmt_money(p['este_mes'])}"
+
     # ================== SALARIO ==================
 
     def set_salary(self):
         v = ctk.CTkToplevel(self)
         v.title("Salario Semanal")
-        v.geometry("300x200")
+        v.geometry("320x420")
         v.attributes("-topmost", True)
 
         ctk.CTkLabel(v, text="Ingresa tu salario semanal:", font=("Segoe UI", 14)).pack(pady=10)
@@ -1025,19 +5838,88 @@ class PagoApp(ctk.CTk):
         e.insert(0, str(self.weekly_salary))
         e.pack(pady=10)
 
+        ctk.CTkLabel(v, text="Día de cobro:", font=("Segoe UI", 12)).pack(pady=(6, 2))
+        dia = ctk.CTkComboBox(v, values=list(DIAS_SEMANA), state="readonly")
+        dia.set(DIAS_SEMANA[self.payday_weekday])
+        dia.pack(pady=(0, 6))
+
+        # Punto de partida de la proyección de saldo
+        ctk.CTkLabel(v, text="Saldo actual en cuenta:", font=("Segoe UI", 12)).pack(pady=(6, 2))
+        es = ctk.CTkEntry(v)
+        es.insert(0, str(self.opening_balance))
+        es.pack(pady=(0, 6))
+        ctk.CTkLabel(v, text="Fecha del saldo (YYYY-MM-DD):", font=("Segoe UI", 12)).pack(pady=(6, 2))
+        ef = ctk.CTkEntry(v)
+        ef.insert(0, self.opening_balance_date or datetime.now().strftime("%Y-%m-%d"))
+        ef.pack(pady=(0, 6))
+
         def save():
+            fecha_saldo = normalizar_fecha(ef.get().strip())
+            if not parse_date_ymd(fecha_saldo):
+                messagebox.showerror("Error", "Fecha del saldo inválida (YYYY-MM-DD)")
+                return
             self.weekly_salary = safe_float(e.get())
             self.salary_history[datetime.now().strftime("%Y-%m-%d")] = self.weekly_salary
+            self.payday_weekday = DIAS_SEMANA.index(dia.get())
+            self.opening_balance = safe_float(es.get())
+            self.opening_balance_date = fecha_saldo
             self.guardar_config()
             self.actualizar_vistas()
             v.destroy()
 
         ctk.CTkButton(v, text="Guardar", command=save).pack(pady=10)
 
+    def restaurar_backup(self):
+        self._vaciar_guardados()
+        puntos = self.backups.points()
+        if not puntos:
+            messagebox.showinfo("Restore", "No hay backups disponibles.")
+            return
+
+        v = ctk.CTkToplevel(self)
+        v.title("Restaurar Backup")
+        v.geometry("420x500")
+        v.attributes("-topmost", True)
+
+        ctk.CTkLabel(v, text="Puntos de restauración", font=("Segoe UI", 16, "bold")).pack(pady=10)
+
+        scroll = ctk.CTkScrollableFrame(v, fg_color="transparent")
+        scroll.pack(fill="both", expand=True, padx=10, pady=10)
+
+        def restaurar(nombre, ts):
+            if not messagebox.askyesno("Restore", f"¿Restaurar el estado del {ts:%Y-%m-%d %H:%M:%S}?\n"
+                                                  "Los cambios posteriores se perderán."):
+                return
+            self._vaciar_guardados()
+            # En Windows no se puede reemplazar el archivo histórico con su mmap abierto
+            if self.archivo is not None:
+                self.archivo.close()
+            try:
+                pagos, compras = self.backups.restore(nombre, archivo=self.ruta_archivo)
+            except Exception as e:
+                messagebox.showerror("Restore", f"No se pudo restaurar:\n{e}")
+                return
+            finally:
+                if self.archivo is not None:
+                    self._abrir_archivo()
+                    self._avisar_carga()
+            self.reemplazar_registros(pagos, compras)
+            self.guardar_datos()
+            self.actualizar_vistas()
+            v.destroy()
+
+        for nombre, ts in puntos:
+            row = ctk.CTkFrame(scroll, fg_color=STYLE["white"], corner_radius=8, border_width=1, border_color=STYLE["line"])
+            row.pack(fill="x", pady=4, padx=5)
+            ctk.CTkLabel(row, text=ts.strftime("%Y-%m-%d %H:%M:%S"), anchor="w").pack(side="left", padx=10, pady=8)
+            ctk.CTkButton(
+                row, text="Restaurar", width=90, height=26,
+                command=lambda n=nombre, t=ts: restaurar(n, t)
+            ).pack(side="right", padx=10, pady=8)
+
     def confirmar_reset(self):
         if messagebox.askyesno("Reset", "¿Estás seguro de borrar TODOS los datos de compras y pagos?"):
-            self.pagos.clear()
-            self.compras.clear()
+            self.vaciar_registros()
             self.guardar_datos()
             self.actualizar_vistas()
 
@@ -1047,7 +5929,11 @@ class PagoApp(ctk.CTk):
             return
         mes_prefix = f"{self.anio_vis}-{self.mes_vis:02d}"
         items = [x for x in (self.pagos + self.compras) if str(x.get("fecha", "")).startswith(mes_prefix)]
-        df = pd.DataFrame(items)
+        if self.archivo is not None:
+            items += self.archivo.month_items(mes_prefix)
+        import pandas as pd
+
+        df = pd.DataFrame([dict(x) for x in items])
         try:
             df.to_csv(f, index=False)
             messagebox.showinfo("Export", "Reporte guardado exitosamente.")
@@ -1055,6 +5941,12 @@ class PagoApp(ctk.CTk):
             messagebox.showerror("Error", f"No se pudo guardar: {e}")
 
     def show_statistics(self):
+        # Una sola ventana de estadísticas: si ya está abierta se refresca
+        if self._stats is not None and self._stats["win"].winfo_exists():
+            self._refrescar_stats()
+            self._stats["win"].lift()
+            return
+
         v = ctk.CTkToplevel(self)
         v.title("Statistics")
         v.geometry("1000x800")
@@ -1067,70 +5959,112 @@ class PagoApp(ctk.CTk):
         t_trend = tabview.add("Trends")
         t_comp = tabview.add("Comparison")
 
+        # Trends: alcance de la curva, status y totales rápidos (DailySeries)
+        controles = ctk.CTkFrame(t_trend, fg_color="transparent")
+        controles.pack(fill="x", pady=(0, 6))
+        alcance = ctk.CTkSegmentedButton(controles, values=["Mes", "Año", "Todo"], command=lambda _: self._refrescar_stats())
+        alcance.set("Mes")
+        alcance.pack(side="left", padx=(0, 8))
+        estado = ctk.CTkSegmentedButton(controles, values=["Pendientes", "Todos"], command=lambda _: self._refrescar_stats())
+        estado.set("Pendientes")
+        estado.pack(side="left")
+        resumen = ctk.CTkLabel(controles, text="", font=("Segoe UI", 11), text_color=STYLE["text_light"])
+        resumen.pack(side="right")
+
+        charts = {
+            "pie": ChartImage(t_over, self.charts, "stats_pie"),
+            "trend": ChartImage(t_trend, self.charts, "stats_trend"),
+            "comp": ChartImage(t_comp, self.charts, "stats_comp"),
+        }
+        for chart in charts.values():
+            chart.pack(fill="both", expand=True)
+
+        self._stats = {"win": v, "charts": charts, "alcance": alcance, "estado": estado, "resumen": resumen}
+
+        def on_destroy(event):
+            if event.widget is not v:
+                return
+            for chart in charts.values():
+                chart.close()
+            if self._stats is not None and self._stats["win"] is v:
+                self._stats = None
+
+        v.bind("<Destroy>", on_destroy, add="+")
+        self._refrescar_stats()
+
+    def _refrescar_stats(self):
+        # Los datos solo se calculan si la imagen de ese mes/versión no está en caché
+        charts = self._stats["charts"]
         mes_prefix = f"{self.anio_vis}-{self.mes_vis:02d}"
-        data = [x for x in (self.pagos + self.compras) if str(x.get("fecha", "")).startswith(mes_prefix) and x.get("status", "PENDING") != "PAID"]
+        alcance = self._stats["alcance"].get()
+        status = None if self._stats["estado"].get() == "Pendientes" else "ALL"
+        ref = self.fecha_seleccionada if _ordinal_fecha(str(self.fecha_seleccionada or "")) >= 0 else f"{mes_prefix}-01"
+
+        # Año y YTD necesitan los doce meses; "Todo", el ledger entero
+        if alcance == "Todo":
+            self._asegurar_meses()
+        else:
+            self._asegurar_meses([f"{y}-{m:02d}" for y in {self.anio_vis, int(ref[:4])} for m in range(1, 13)])
+        clave = (mes_prefix, self.version_datos())
 
         # Overview (Pie)
-        cats = {}
-        for x in data:
-            cats[x.get("categoria", "OTHER")] = cats.get(x.get("categoria", "OTHER"), 0.0) + float(x.get("monto", 0))
-
-        fig1, ax1 = plt.subplots(figsize=(5, 4))
-        if cats:
-            ax1.pie(cats.values(), labels=cats.keys(), autopct="%1.1f%%", startangle=90)
-        canvas1 = FigureCanvasTkAgg(fig1, master=t_over)
-        canvas1.draw()
-        canvas1.get_tk_widget().pack(fill="both", expand=True)
-
-        # Trends (Line)
-        dates = sorted(list(set([x.get("fecha") for x in data if x.get("fecha")])))
-        cum_spend = []
-        curr = 0.0
-        for d in dates:
-            day_sum = sum(float(x.get("monto", 0)) for x in data if x.get("fecha") == d)
-            curr += day_sum
-            cum_spend.append(curr)
-
-        fig2, ax2 = plt.subplots(figsize=(5, 4))
-        ax2.plot(dates, cum_spend, marker="o", color="b")
-        ax2.set_title("Cumulative Spending this Month")
-        ax2.tick_params(axis="x", rotation=45)
-        canvas2 = FigureCanvasTkAgg(fig2, master=t_trend)
-        canvas2.draw()
-        canvas2.get_tk_widget().pack(fill="both", expand=True)
+        def datos_pie():
+            cats = self.repo.month_by_cat(mes_prefix)
+            return "pie", (list(cats), list(cats.values()))
+
+        # Trends (Line): curva acumulada sacada de las sumas prefijo diarias
+        self._stats["resumen"].configure(text=(
+            f"Semana {fmt_money(self.series.week_total(ref, status))} · "
+            f"Mes {fmt_money(self.series.month_total(mes_prefix, status))} · "
+            f"Año (YTD) {fmt_money(self.series.ytd_total(ref, status))}"
+        ))
+
+        def datos_trend():
+            if alcance == "Mes":
+                ultimo = calendar.monthrange(self.anio_vis, self.mes_vis)[1]
+                desde, hasta, titulo = f"{mes_prefix}-01", f"{mes_prefix}-{ultimo:02d}", "this Month"
+            elif alcance == "Año":
+                desde, hasta, titulo = f"{self.anio_vis}-01-01", f"{self.anio_vis}-12-31", str(self.anio_vis)
+            else:
+                desde, hasta = self.series.span() or (f"{mes_prefix}-01", f"{mes_prefix}-01")
+                titulo = f"{desde[:4]}–{hasta[:4]}"
+            fechas, valores = self.series.cumulative(desde, hasta, status)
+            estilo = {"color": "b", "marker": "o" if alcance == "Mes" else ""}
+            return "line", (fechas, valores, f"Cumulative Spending {titulo}", "Fecha", estilo)
 
         # Comparison
-        last_m = self.mes_vis - 1 if self.mes_vis > 1 else 12
-        last_y = self.anio_vis if self.mes_vis > 1 else self.anio_vis - 1
-        last_prefix = f"{last_y}-{last_m:02d}"
-        last_data = [x for x in (self.pagos + self.compras) if str(x.get("fecha", "")).startswith(last_prefix) and x.get("status", "PENDING") != "PAID"]
-
-        fig3, ax3 = plt.subplots(figsize=(5, 4))
-        ax3.bar(
-            ["Mes Anterior", "Este Mes"],
-            [sum(float(x.get("monto", 0)) for x in last_data), sum(float(x.get("monto", 0)) for x in data)],
-            color=["gray", "blue"],
-        )
-        canvas3 = FigureCanvasTkAgg(fig3, master=t_comp)
-        canvas3.draw()
-        canvas3.get_tk_widget().pack(fill="both", expand=True)
+        def datos_comp():
+            last_m = self.mes_vis - 1 if self.mes_vis > 1 else 12
+            last_y = self.anio_vis if self.mes_vis > 1 else self.anio_vis - 1
+            last_prefix = f"{last_y}-{last_m:02d}"
+            return "bar", (
+                ["Mes Anterior", "Este Mes"],
+                [self.repo.month_total(last_prefix), self.repo.month_total(mes_prefix)],
+                ["gray", "blue"],
+            )
+
+        charts["pie"].mostrar(clave, datos_pie)
+        charts["trend"].mostrar(clave + (alcance, status), datos_trend)
+        charts["comp"].mostrar(clave, datos_comp)
 
     # ================== ALTAS / EDICIÓN ==================
 
     def abrir_ventana_pago(self):
         v = ctk.CTkToplevel(self)
         v.title("Nuevo Pago")
-        v.geometry("360x400")
+        v.geometry("360x500")
         v.attributes("-topmost", True)
 
         ctk.CTkLabel(v, text="Registrar Pago Fijo", font=("Segoe UI", 16, "bold")).pack(pady=15)
-        
+
         en = ctk.CTkEntry(v, placeholder_text="Nombre del Pago")
         em = ctk.CTkEntry(v, placeholder_text="Monto")
         ef = ctk.CTkEntry(v)
         ef.insert(0, self.fecha_seleccionada)
 
-        en.pack(pady=5); em.pack(pady=5); ef.pack(pady=5)
+        en.pack(pady=5)
+        em.pack(pady=5)
+        ef.pack(pady=5)
 
         ec = ctk.CTkComboBox(v, values=self.categorias_pago)
         ec.set("SERVICE")
@@ -1140,15 +6074,44 @@ class PagoApp(ctk.CTk):
         emp.set("CREDIT CARD")
         emp.pack(pady=5)
 
+        # Pago fijo: una regla en lugar de un registro por mes
+        erep = ctk.CTkComboBox(v, values=list(RECURRENCIAS))
+        erep.set("No")
+        erep.pack(pady=5)
+        efin = ctk.CTkEntry(v, placeholder_text="Hasta (YYYY-MM-DD, opcional)")
+        efin.pack(pady=5)
+
         def save():
             if not en.get() or not parse_date_ymd(ef.get()):
                 messagebox.showerror("Error", "Datos inválidos (Verifica formato de fecha YYYY-MM-DD)")
                 return
-            self.pagos.append({
+            repetir = RECURRENCIAS.get(erep.get())
+            if repetir is not None:
+                if efin.get() and not parse_date_ymd(efin.get()):
+                    messagebox.showerror("Error", "Fecha final inválida (YYYY-MM-DD)")
+                    return
+                freq, intervalo = repetir
+                self.recurrentes.agregar({
+                    "nombre": en.get().upper(),
+                    "monto": safe_float(em.get()),
+                    "categoria": ec.get(),
+                    "metodo": emp.get(),
+                    "freq": freq,
+                    "intervalo": intervalo,
+                    "dia": parse_date_ymd(ef.get()).day,
+                    "inicio": normalizar_fecha(ef.get()),
+                    "fin": normalizar_fecha(efin.get()),
+                })
+                self.guardar_config()
+                self._last_month = None
+                self.actualizar_vistas()
+                v.destroy()
+                return
+            self.agregar_registro("pago", {
                 "uid": str(uuid.uuid4()),
                 "nombre": en.get().upper(),
                 "monto": safe_float(em.get()),
-                "fecha": ef.get(),
+                "fecha": normalizar_fecha(ef.get()),
                 "categoria": ec.get(),
                 "metodo": emp.get(),
                 "status": "PENDING",
@@ -1166,13 +6129,15 @@ class PagoApp(ctk.CTk):
         v.attributes("-topmost", True)
 
         ctk.CTkLabel(v, text="Registrar Compra/Gasto", font=("Segoe UI", 16, "bold")).pack(pady=15)
-        
+
         en = ctk.CTkEntry(v, placeholder_text="Nombre del Item")
         em = ctk.CTkEntry(v, placeholder_text="Monto")
         ef = ctk.CTkEntry(v)
         ef.insert(0, self.fecha_seleccionada)
 
-        en.pack(pady=5); em.pack(pady=5); ef.pack(pady=5)
+        en.pack(pady=5)
+        em.pack(pady=5)
+        ef.pack(pady=5)
 
         ec = ctk.CTkComboBox(v, values=self.categorias_compra)
         ec.set("SUPERMARKET")
@@ -1186,11 +6151,11 @@ class PagoApp(ctk.CTk):
             if not en.get() or not parse_date_ymd(ef.get()):
                 messagebox.showerror("Error", "Datos inválidos")
                 return
-            self.compras.append({
+            self.agregar_registro("compra", {
                 "uid": str(uuid.uuid4()),
                 "item": en.get().upper(),
                 "monto": safe_float(em.get()),
-                "fecha": ef.get(),
+                "fecha": normalizar_fecha(ef.get()),
                 "categoria": ec.get(),
                 "metodo": emp.get(),
                 "status": "PENDING",
@@ -1204,28 +6169,44 @@ class PagoApp(ctk.CTk):
     def abrir_ventana_ahorro(self):
         v = ctk.CTkToplevel(self)
         v.title("Nuevo Ahorro")
-        v.geometry("360x350")
+        v.geometry("360x400")
         v.attributes("-topmost", True)
 
         ctk.CTkLabel(v, text="Registrar Ahorro", font=("Segoe UI", 16, "bold")).pack(pady=15)
-        
+
         en = ctk.CTkEntry(v, placeholder_text="Concepto del ahorro")
         em = ctk.CTkEntry(v, placeholder_text="Monto ahorrado")
         ef = ctk.CTkEntry(v)
         ef.insert(0, self.fecha_seleccionada)
 
-        en.pack(pady=5); em.pack(pady=5); ef.pack(pady=5)
+        en.pack(pady=5)
+        em.pack(pady=5)
+        ef.pack(pady=5)
+
+        # Con una meta elegida el concepto lleva su prefijo, así el aporte cuenta para ella
+        metas = {m.get("nombre", ""): m for m in self.savings_goals}
+        emeta = ctk.CTkComboBox(v, values=["(Sin meta)"] + list(metas))
+        emeta.set("(Sin meta)")
+        emeta.pack(pady=5)
 
         def save():
             if not en.get():
                 messagebox.showerror("Error", "Ingresa un concepto")
                 return
-            self.compras.append({
+            concepto = en.get().upper()
+            meta = metas.get(emeta.get())
+            categoria = AHORRO_CATEGORIA
+            if meta is not None:
+                categoria = meta.get("categoria") or AHORRO_CATEGORIA
+                prefijo = str(meta.get("prefijo", "")).upper()
+                if prefijo and not concepto_ahorro(concepto).startswith(normalize_name(prefijo)):
+                    concepto = f"{prefijo} {concepto}"
+            self.agregar_registro("compra", {
                 "uid": str(uuid.uuid4()),
-                "item": f"AHORRO - {en.get().upper()}",
+                "item": f"{AHORRO_ETIQUETA} - {concepto}",
                 "monto": safe_float(em.get()),
-                "fecha": ef.get(),
-                "categoria": "SAVINGS",
+                "fecha": normalizar_fecha(ef.get()),
+                "categoria": categoria,
                 "metodo": "TRANSFER",
                 "status": "PAID",
             })
@@ -1238,9 +6219,9 @@ class PagoApp(ctk.CTk):
     def editar_item(self, item, tipo):
         v = ctk.CTkToplevel(self)
         v.title("Editar")
-        v.geometry("360x450")
+        v.geometry("360x500" if RecurringRules.es_ocurrencia(item) else "360x450")
         v.attributes("-topmost", True)
-        
+
         ctk.CTkLabel(v, text="Editar Registro", font=("Segoe UI", 16, "bold")).pack(pady=10)
 
         en = ctk.CTkEntry(v, width=250)
@@ -1267,27 +6248,20 @@ class PagoApp(ctk.CTk):
             if not parse_date_ymd(ef.get()):
                 messagebox.showerror("Error", "Fecha inválida")
                 return
-            item.update({
+            self.actualizar_registro(item, {
                 "monto": safe_float(em.get()),
-                "fecha": ef.get(),
+                "fecha": normalizar_fecha(ef.get()),
                 "categoria": ec.get(),
                 "metodo": emp.get(),
+                ("nombre" if tipo == "pago" else "item"): en.get().upper(),
             })
-            if tipo == "pago":
-                item["nombre"] = en.get().upper()
-            else:
-                item["item"] = en.get().upper()
-                
             self.guardar_datos()
             self.actualizar_vistas()
             v.destroy()
 
         def delete_record():
             if messagebox.askyesno("Confirmar", "¿Eliminar registro permanentemente?"):
-                if tipo == "pago" and item in self.pagos:
-                    self.pagos.remove(item)
-                elif tipo == "compra" and item in self.compras:
-                    self.compras.remove(item)
+                self.eliminar_registro(item)
                 self.guardar_datos()
                 self.actualizar_vistas()
                 v.destroy()
@@ -1295,8 +6269,194 @@ class PagoApp(ctk.CTk):
         btn_f = ctk.CTkFrame(v, fg_color="transparent")
         btn_f.pack(pady=15)
         ctk.CTkButton(btn_f, text="Guardar Cambios", command=save_changes, width=120).pack(side="left", padx=5)
-        ctk.CTkButton(btn_f, text="Eliminar", fg_color=STYLE["danger"], command=delete_record, width=100).pack(side="right", padx=5)
+        ctk.CTkButton(btn_f, text="Eliminar", fg_color=STYLE["danger"], command=delete_record,
+                      width=100).pack(side="right", padx=5)
+
+        if RecurringRules.es_ocurrencia(item):
+            # Guardar/Eliminar tocan solo esta ocurrencia; la serie entera se borra aquí
+            def delete_rule():
+                if messagebox.askyesno("Confirmar", "¿Eliminar el pago recurrente y todas sus ocurrencias?"):
+                    self.recurrentes.eliminar(item.get("regla"))
+                    self.guardar_config()
+                    self._last_month = None
+                    self.actualizar_vistas()
+                    v.destroy()
+
+            ctk.CTkButton(v, text="Eliminar serie", fg_color=STYLE["danger"], command=delete_rule,
+                          width=230).pack(pady=(0, 10))
+
+
+def _registros_sinteticos(n, seed=7):
+    import random
+    rnd = random.Random(seed)
+    cats = ["SUPERMARKET", "RESTAURANT", "LEISURE", "STREAMING", "HEALTH", "CLOTHES", "TRANSPORT", "SERVICE"]
+    metodos = ["CASH", "CREDIT CARD", "DEBIT CARD", "TRANSFER"]
+    inicio = date(2015, 1, 1).toordinal()
+    res = []
+    for i in range(n):
+        tipo = "pago" if i % 4 == 0 else "compra"
+        res.append((tipo, {
+            ("nombre" if tipo == "pago" else "item"): f"R{i}",
+            "uid": str(i),
+            "monto": round(rnd.uniform(1, 500), 2) if i % 3 else str(round(rnd.uniform(1, 500), 2)),
+            "fecha": date.fromordinal(inicio + rnd.randrange(3650)).isoformat(),
+            "categoria": rnd.choice(cats),
+            "metodo": rnd.choice(metodos),
+            "status": "PAID" if rnd.random() < 0.4 else "PENDING",
+        }))
+    return res
+
+
+def benchmark_ledger(tamanos, repeticiones=5):
+    """Compara agregaciones recorriendo dicts contra ColumnarLedger."""
+    if not numpy_disponible():
+        print("numpy no está instalado")
+        return 1
+
+    ym, desde, hasta = "2020-06", "2019-01-01", "2019-12-31"
+
+    def dicts(registros):
+        items = [x for _, x in registros]
+        return {
+            "total mes": lambda: sum(safe_float(x.get("monto")) for x in items
+                                     if str(x.get("fecha", "")).startswith(ym) and x.get("status") != "PAID"),
+            "categorías mes": lambda: _sumar_por(items, "categoria", lambda f: f.startswith(ym)),
+            "días del mes": lambda: _sumar_por(items, "fecha", lambda f: f.startswith(ym)),
+            "total rango": lambda: sum(safe_float(x.get("monto")) for x in items
+                                       if desde <= str(x.get("fecha", "")) <= hasta and x.get("status") != "PAID"),
+            "totales por mes": lambda: _sumar_por(items, "fecha", lambda f: True, clave=lambda f: f[:7]),
+        }
+
+    def columnas(col):
+        return {
+            "total mes": lambda: col.month_total(ym),
+            "categorías mes": lambda: col.month_by_cat(ym),
+            "días del mes": lambda: col.day_totals(ym),
+            "total rango": lambda: col.range_total(desde, hasta),
+            "totales por mes": lambda: col.month_totals(),
+        }
+
+    def medir(fn):
+        mejor = None
+        for _ in range(repeticiones):
+            t = time.perf_counter()
+            fn()
+            dt = time.perf_counter() - t
+            mejor = dt if mejor is None else min(mejor, dt)
+        return mejor
+
+    for n in tamanos:
+        registros = _registros_sinteticos(n)
+        t = time.perf_counter()
+        col = ColumnarLedger(capacidad=n)
+        col.cargar(registros)
+        carga = time.perf_counter() - t
+
+        print(f"\n{n:,} registros (carga columnar {carga:.2f} s)")
+        print(f"  {'consulta':<18}{'dicts ms':>12}{'numpy ms':>12}{'x':>8}")
+        a, b = dicts(registros), columnas(col)
+        for nombre in a:
+            ta, tb = medir(a[nombre]), medir(b[nombre])
+            print(f"  {nombre:<18}{ta * 1000:12.2f}{tb * 1000:12.2f}{ta / tb if tb else 0:8.1f}")
+        del registros, col
+    return 0
+
+
+def _sumar_por(items, campo, filtro, clave=lambda v: v):
+    res = {}
+    for x in items:
+        f = str(x.get("fecha", ""))
+        if x.get("status") != "PAID" and filtro(f):
+            k = clave(str(x.get(campo, "")))
+            res[k] = res.get(k, 0.0) + safe_float(x.get("monto"))
+    return res
+
+
+def _actualizar_config(ruta_config, **cambios):
+    try:
+        with open(ruta_config, "r", encoding="utf-8") as f:
+            d = json.load(f)
+    except Exception:
+        d = {}
+    d.update(cambios)
+    with open(ruta_config, "w", encoding="utf-8") as f:
+        json.dump(d, f, ensure_ascii=False, indent=2)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Finance Pro - Simple Banking")
+    parser.add_argument("--migrate-sqlite", action="store_true",
+                        help="migra finanzas_v4.json a finanzas_v4.db y activa el modo sqlite")
+    parser.add_argument("--migrate-partitions", action="store_true",
+                        help="reparte finanzas_v4.json en finanzas_v4/YYYY-MM.json y activa el modo particiones")
+    parser.add_argument("--export-json", nargs="?", const="", metavar="RUTA",
+                        help="exporta finanzas_v4.db a JSON; sin RUTA vuelve al modo json")
+    parser.add_argument("--archive-after", type=int, metavar="N",
+                        help="archiva los PAID de meses cerrados dejando vivos los N más recientes (0 = no archivar)")
+    parser.add_argument("--benchmark-ledger", nargs="*", type=int, metavar="N",
+                        help="compara agregaciones con dicts y con ColumnarLedger (por defecto 10000 1000000 5000000)")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="abre la app, mide el arranque hasta el primer render, imprime los tiempos y sale")
+    args = parser.parse_args(argv)
+
+    base = app_base_path()
+    ruta_json = os.path.join(base, "finanzas_v4.json")
+    ruta_db = os.path.join(base, "finanzas_v4.db")
+    ruta_config = os.path.join(base, "config.json")
+
+    if args.migrate_sqlite:
+        store = SqliteLedgerStore(ruta_db)
+        n = store.import_json(ruta_json)
+        _actualizar_config(ruta_config, storage_mode="sqlite")
+        print(f"{n} registros migrados a {ruta_db}")
+        if store.cuarentena:
+            informe = guardar_cuarentena(ruta_json, ruta_json, store.cuarentena)
+            print(f"{len(store.cuarentena)} registros apartados en {informe}")
+        return 0
+
+    if args.migrate_partitions:
+        store = PartitionedLedgerStore(os.path.join(base, "finanzas_v4"))
+        n = store.import_json(ruta_json)
+        _actualizar_config(ruta_config, storage_mode="particiones")
+        print(f"{n} registros repartidos en {len(store.meses())} meses en {store.ruta}")
+        if store.cuarentena:
+            informe = guardar_cuarentena(ruta_json, ruta_json, store.cuarentena)
+            print(f"{len(store.cuarentena)} registros apartados en {informe}")
+        return 0
+
+    if args.export_json is not None:
+        n = SqliteLedgerStore(ruta_db).export_json(args.export_json or ruta_json)
+        if not args.export_json:
+            _actualizar_config(ruta_config, storage_mode="json")
+        print(f"{n} registros exportados a {args.export_json or ruta_json}")
+        return 0
+
+    if args.archive_after is not None:
+        meses = max(0, args.archive_after)
+        _actualizar_config(ruta_config, archive_after_months=meses)
+        if meses:
+            print(f"Archivo histórico activado: se dejan vivos los últimos {meses} meses")
+        else:
+            print("Archivo histórico desactivado")
+        return 0
+
+    if args.benchmark_ledger is not None:
+        return benchmark_ledger(args.benchmark_ledger or [10_000, 1_000_000, 5_000_000])
+
+    if args.profile_startup:
+        perfil = {"imports": _T_IMPORTS}
+        PagoApp(perfil=perfil).mainloop()
+        print("Arranque (ms):")
+        for fase in ("imports", "cargar_datos", "setup_ui", "primer_render", "total"):
+            if fase in perfil:
+                print(f"  {fase:<14}{perfil[fase] * 1000:9.1f}")
+        print(f"  módulos pesados al primer render: {', '.join(perfil.get('pesados', [])) or 'ninguno'}")
+        return 0
 
-if __name__ == "__main__":
     app = PagoApp()
     app.mainloop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,87 @@
+from datetime import date
+
+import pytest
+
+cf = pytest.importorskip("calendariofinanzas")
+
+METAS = [
+    {"id": "viaje", "nombre": "Viaje", "meta": 1000, "fecha_limite": "2025-08-31", "prefijo": "viaje"},
+    {"id": "todo", "nombre": "Colchón", "meta": 400},
+    {"id": "coche", "nombre": "Coche", "meta": 300, "categoria": "TRANSPORT", "prefijo": "coche"},
+]
+
+
+def ahorro(uid, nombre, monto, fecha, status="PAID", cat="SAVINGS"):
+    return cf.Transaction({"uid": uid, "item": nombre, "monto": monto, "fecha": fecha,
+                           "categoria": cat, "status": status})
+
+
+@pytest.fixture
+def ahorros():
+    index = cf.LedgerIndex()
+    index.rebuild([], [
+        ahorro("a", "AHORRO - Viaje Japón", 200, "2025-03-03"),
+        ahorro("b", f"{cf.AHORRO_ETIQUETA} VIAJE", 100, "2025-04-10"),
+        ahorro("c", "FONDO", 50, "2025-04-12"),
+        ahorro("p", "VIAJE PENDIENTE", 999, "2025-04-15", status="PENDING"),
+        ahorro("t", "COCHE NUEVO", 120, "2025-04-01", cat="TRANSPORT"),
+        ahorro("x", "VIAJE", 75, "2025-04-02", cat="FOOD"),
+    ])
+    return index, cf.SavingsTracker(index, METAS)
+
+
+def test_progreso_de_las_metas(ahorros):
+    _, control = ahorros
+    # Solo lo PAID de SAVINGS suma al total
+    assert control.total == 350
+    assert (control.ahorrado("viaje"), control.ahorrado("todo"), control.ahorrado("coche")) == (300, 350, 120)
+
+    p = control.progreso(METAS[0], date(2025, 4, 20))
+    assert p["ahorrado"] == 300 and p["fraccion"] == 0.3 and p["falta"] == 700 and p["este_mes"] == 100
+    # Abril a agosto: cinco meses para los 700 que faltan
+    assert p["mensual"] == 140
+    assert control.progreso(METAS[1], date(2025, 4, 20))["mensual"] is None
+    assert control.progreso(METAS[0], date(2025, 9, 1))["mensual"] == 700
+
+
+def test_altas_ediciones_y_bajas(ahorros):
+    index, control = ahorros
+    index.add("compra", ahorro("n", "VIAJE", 40, "2025-04-20"))
+    assert (control.total, control.ahorrado("viaje")) == (390, 340)
+
+    # Pagar el pendiente lo suma; cambiarle concepto y mes lo mueve de meta
+    p = index.get("p")
+    p["status"] = "PAID"
+    index.update(p)
+    assert control.ahorrado("viaje") == 1339
+    p["item"] = "OTRO"
+    p["fecha"] = "2025-05-01"
+    index.update(p)
+    assert control.ahorrado("viaje") == 340 and control.progreso(METAS[1], date(2025, 5, 2))["este_mes"] == 999
+
+    # Sacarlo de SAVINGS lo quita de todo
+    b = index.get("b")
+    b["categoria"] = "OTHER"
+    index.update(b)
+    assert (control.total, control.ahorrado("viaje"), control.ahorrado("todo")) == (1289, 240, 1289)
+
+    index.remove(index.get("a"))
+    index.remove(index.get("t"))
+    assert (control.total, control.ahorrado("viaje"), control.ahorrado("coche")) == (1089, 40, 0)
+
+
+def test_cambiar_las_metas_recalcula(ahorros):
+    _, control = ahorros
+    control.set_metas([{"id": "japon", "meta": 100, "prefijo": "viaje jap"}])
+    assert control.ahorrado("japon") == 200 and control.ahorrado("viaje") == 0
+
+
+def test_archivo_historico_entra_en_los_totales(ahorros, tmp_path):
+    _, control = ahorros
+    archivo = cf.LedgerArchive(str(tmp_path / "finanzas_v4.archivo")).agregar(
+        [("compra", ahorro("viejo", "AHORRO - VIAJE", 500, "2023-06-01"))])
+    control.set_archivo(archivo)
+    assert (control.total, control.ahorrado("viaje")) == (850, 800)
+    control.set_archivo(None)
+    assert control.ahorrado("viaje") == 300
+    archivo.close()
@@ -0,0 +1,55 @@
+import pytest
+
+cf = pytest.importorskip("calendariofinanzas")
+
+
+def registros():
+    res = []
+    for i in range(30):
+        tipo = "pago" if i % 3 else "compra"
+        campo = "nombre" if tipo == "pago" else "item"
+        res.append((tipo, cf.Transaction({"uid": f"u{i}", campo: f"REG {i}", "monto": i + 0.25,
+                                          "fecha": f"2024-{i % 6 + 1:02d}-{i % 28 + 1:02d}",
+                                          "categoria": ("FOOD", "RENT", "OTHER")[i % 3], "status": "PAID",
+                                          "notas": {"i": i}})))
+    return res
+
+
+def test_agregar_y_leer_por_rango(tmp_path):
+    ruta = str(tmp_path / "finanzas_v4.archivo")
+    regs = registros()
+    archivo = cf.LedgerArchive(ruta).agregar(regs[:20])
+    # Los uid ya archivados se saltan al volver a agregar
+    archivo = archivo.agregar(regs[10:])
+    assert len(archivo) == 30
+
+    releido = cf.LedgerArchive(ruta)
+    esperado = sorted((x.to_dict() for _, x in regs), key=lambda d: (d["fecha"], d["uid"]))
+    assert sorted((x.to_dict() for x in releido.all_items()), key=lambda d: (d["fecha"], d["uid"])) == esperado
+
+    marzo = [x.to_dict() for x in releido.range_items("2024-03", "2024-03")]
+    en_marzo = [d for d in esperado if d["fecha"].startswith("2024-03")]
+    assert sorted(marzo, key=lambda d: d["uid"]) == sorted(en_marzo, key=lambda d: d["uid"])
+    assert {x["uid"] for x in releido.range_items("2024-02-01", "2024-04-30")} == {
+        d["uid"] for d in esperado if "2024-02-01" <= d["fecha"] <= "2024-04-30"}
+    assert releido.get("u7")["notas"] == {"i": 7}
+    assert sorted(releido.categories()) == ["FOOD", "OTHER", "RENT"]
+    releido.close()
+    archivo.close()
+
+
+def test_backup_guarda_y_restaura_el_archivo(tmp_path):
+    ruta = tmp_path / "finanzas_v4.archivo"
+    cf.LedgerArchive(str(ruta)).agregar(registros()).close()
+    original = ruta.read_bytes()
+    backups = cf.BackupStore(str(tmp_path / "backups"))
+    pagos = [{"uid": "p", "nombre": "LUZ", "monto": 1, "fecha": "2025-01-01"}]
+
+    assert backups.snapshot(pagos, [], archivo=str(ruta))
+    # Sin cambios en el ledger ni en el archivo no hay punto nuevo
+    assert backups.snapshot(pagos, [], dirty={cf.BACKUP_CLAVE_ARCHIVO}, archivo=str(ruta)) is None
+    (nombre, _), = backups.points()
+
+    ruta.write_bytes(b"roto")
+    assert backups.restore(nombre, archivo=str(ruta)) == (pagos, [])
+    assert ruta.read_bytes() == original
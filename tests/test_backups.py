@@ -0,0 +1,80 @@
+import os
+from datetime import datetime, timedelta
+
+import pytest
+
+cf = pytest.importorskip("calendariofinanzas")
+
+
+class Reloj(datetime):
+    ahora = datetime(2025, 3, 1, 10, 0)
+
+    @classmethod
+    def now(cls, tz=None):
+        return cls.ahora
+
+
+@pytest.fixture
+def reloj(monkeypatch):
+    monkeypatch.setattr(cf, "datetime", Reloj)
+    return Reloj
+
+
+def ledger(monto):
+    pagos = [{"uid": "luz", "nombre": "LUZ", "monto": monto, "fecha": "2025-01-05"},
+             {"uid": "agua", "nombre": "AGUA", "monto": 7, "fecha": "2025-02-05"}]
+    compras = [{"uid": "pan", "item": "PAN", "monto": 2, "fecha": "2025-02-06"}]
+    return pagos, compras
+
+
+def objetos(backups):
+    res = set()
+    for raiz, _, nombres in os.walk(backups.obj_dir):
+        res.update(os.path.join(raiz, n) for n in nombres)
+    return res
+
+
+def test_manifiesto_ida_y_vuelta(tmp_path, reloj):
+    ruta = str(tmp_path / "backups")
+    backups = cf.BackupStore(ruta)
+    pagos, compras = ledger(10)
+    backups.snapshot(pagos, compras)
+
+    # Solo se rehace el bloque tocado; los demás se heredan del punto anterior
+    reloj.ahora += timedelta(minutes=1)
+    pagos[0]["monto"] = 11
+    del compras[0]
+    backups.snapshot(pagos, compras, dirty={"pago:2025-01", "compra:2025-02"})
+    assert backups.snapshot(pagos, compras, dirty={"pago:2025-02"}) is None
+
+    # Otra instancia relee los manifiestos del disco
+    releido = cf.BackupStore(ruta)
+    (nuevo, _), (viejo, _) = releido.points()
+    assert releido.restore(nuevo) == (pagos, compras)
+    assert releido.restore(viejo) == ledger(10)
+    chunks = releido._cargar_manifiestos()
+    assert sorted(chunks[nuevo]) == ["pago:2025-01", "pago:2025-02"]
+    assert chunks[nuevo]["pago:2025-02"] == chunks[viejo]["pago:2025-02"]
+
+
+def test_prune_retencion_y_objetos_huerfanos(tmp_path, reloj):
+    ruta = str(tmp_path / "backups")
+    backups = cf.BackupStore(ruta, retention={"recent": 2, "hourly": 0, "daily": 3, "monthly": 0})
+    for dia in range(1, 6):
+        for hora in (10, 20):
+            reloj.ahora = datetime(2025, 3, dia, hora)
+            backups.snapshot(*ledger(dia * 100 + hora))
+
+    puntos = [ts for _, ts in backups.points()]
+    # Los dos últimos y el último de cada uno de los tres días más recientes
+    assert puntos == [datetime(2025, 3, 5, 20), datetime(2025, 3, 5, 10),
+                      datetime(2025, 3, 4, 20), datetime(2025, 3, 3, 20)]
+
+    releido = cf.BackupStore(ruta)
+    chunks = releido._cargar_manifiestos()
+    assert sorted(os.listdir(releido.man_dir)) == sorted(chunks)
+    # Solo quedan los objetos de los puntos retenidos (los bloques compartidos una vez)
+    vivos = {releido._obj_path(h, k) for c in chunks.values() for k, h in c.items()}
+    assert objetos(releido) == vivos and len(vivos) == 4 + 2
+    for nombre, ts in releido.points():
+        assert releido.restore(nombre) == ledger(ts.day * 100 + ts.hour)
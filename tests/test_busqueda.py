@@ -0,0 +1,84 @@
+import pytest
+
+cf = pytest.importorskip("calendariofinanzas")
+
+
+@pytest.fixture
+def buscador():
+    index = cf.LedgerIndex()
+    index.rebuild([
+        cf.Transaction({"uid": "luz", "nombre": "LUZ IBERDROLA", "monto": 60, "fecha": "2025-03-02",
+                        "categoria": "UTILITIES", "metodo": "CARD"}),
+        cf.Transaction({"uid": "alq", "nombre": "ALQUILER PISO", "monto": 700, "fecha": "2025-03-01",
+                        "categoria": "RENT", "status": "PAID"}),
+    ], [
+        cf.Transaction({"uid": "cena", "item": "CENA ALMUDENA", "monto": 45.5, "fecha": "2025-02-14",
+                        "categoria": "RESTAURANT", "metodo": "CASH"}),
+        cf.Transaction({"uid": "tarj", "item": "LIBROS", "monto": 30, "fecha": "2025-04-20",
+                        "categoria": "CREDIT CARD", "metodo": "CARD"}),
+    ])
+    return index, cf.SearchIndex(index)
+
+
+def uids(resultado):
+    return [x["uid"] for x in resultado[0]]
+
+
+def test_prefijos_acentos_y_fechas(buscador):
+    _, buscar = buscador
+    assert [x["uid"] for x in buscar.search("alq")] == ["alq"]
+    assert [x["uid"] for x in buscar.search("almudéna")] == ["cena"]
+    # Los términos se combinan con AND y el campo nombre pesa más que la categoría
+    assert [x["uid"] for x in buscar.search("cen alm")] == ["cena"]
+    assert buscar.search("luz rent") == []
+    assert sorted(x["uid"] for x in buscar.search("202503")) == ["alq", "luz"]
+
+
+def test_altas_ediciones_y_bajas(buscador):
+    index, buscar = buscador
+    assert buscar.search("luz")
+    x = index.get("luz")
+    x["nombre"] = "GAS NATURAL"
+    index.update(x)
+    assert buscar.search("luz") == [] and [y["uid"] for y in buscar.search("natu")] == ["luz"]
+
+    index.remove(index.get("cena"))
+    assert buscar.search("cena") == [] and "CENA" not in buscar._vocab
+    index.add("compra", cf.Transaction({"uid": "nueva", "item": "CENA AMIGOS", "monto": 20, "fecha": "2025-03-09"}))
+    assert [y["uid"] for y in buscar.search("cena")] == ["nueva"]
+
+
+def test_gramatica_de_filtros():
+    q = cf.parse_search_query('luz cat:"credit card" met:card monto>=10 amount<100 fecha:2025-03.. '
+                              'estado:pagado tipo:compras texto "dos palabras"')
+    assert q.texto == "luz texto dos palabras"
+    assert (q.cats, q.metodos, q.status, q.tipos) == (["CREDIT CARD"], ["CARD"], {"PAID"}, {"compra"})
+    assert q.montos == [(">=", 10.0), ("<", 100.0)]
+    assert (q.desde, q.hasta) == ("2025-03", "")
+
+    q = cf.parse_search_query("fecha:2025-02 cat:CREDIT_CARD cat: sin:filtro 'sin cerrar")
+    assert (q.desde, q.hasta, q.cats) == ("2025-02", "2025-02", ["CREDIT CARD"])
+    # Clave vacía o desconocida y comillas sin cerrar: texto libre
+    assert q.texto == "cat: sin:filtro 'sin cerrar"
+
+
+@pytest.mark.parametrize("texto, esperado", [
+    ("monto>50", ["luz", "alq"]),
+    ("monto<=45.5 monto>30", ["cena"]),
+    ("amount=30", ["tarj"]),
+    ("fecha:2025-03", ["luz", "alq"]),
+    ("fecha:..2025-02-28", ["cena"]),
+    ("cat:rest", ["cena"]),
+    ('cat:"credit card"', ["tarj"]),
+    ("status:pendiente metodo:card", ["tarj", "luz"]),
+    ("tipo:pago status:paid", ["alq"]),
+    ("cat:utilities luz", ["luz"]),
+])
+def test_consultas_con_filtros(buscador, texto, esperado):
+    _, buscar = buscador
+    assert uids(buscar.query(texto)) == esperado
+
+
+def test_total_de_la_consulta(buscador):
+    _, buscar = buscador
+    assert buscar.query("fecha:2025-03")[1] == 760
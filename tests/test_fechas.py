@@ -0,0 +1,38 @@
+import pytest
+
+cf = pytest.importorskip("calendariofinanzas")
+
+
+def test_normalizar_fecha():
+    assert cf.normalizar_fecha("2025-3-5") == "2025-03-05"
+    assert cf.normalizar_fecha("2025-03-05") == "2025-03-05"
+    assert cf.normalizar_fecha("mañana") == "mañana"
+    assert cf.normalizar_fecha("") == ""
+
+
+def test_ordinal_acepta_fechas_sin_ceros():
+    assert cf._ordinal_fecha("2025-3-5") == cf._ordinal_fecha("2025-03-05") > 0
+    assert cf._ordinal_fecha("2024-01-32") == -1
+
+
+def test_transaction_guarda_la_fecha_normalizada():
+    tx = cf.Transaction({"uid": "1", "nombre": "LUZ", "monto": 10, "fecha": "2025-3-5"})
+    assert tx["fecha"] == "2025-03-05" and tx.ordinal > 0
+    tx["fecha"] = "2025-4-1"
+    assert tx["fecha"] == "2025-04-01"
+    tx.update({"fecha": "2025-12-9"})
+    assert tx.to_dict()["fecha"] == "2025-12-09"
+
+
+def test_registro_cargado_con_fecha_sin_ceros():
+    x = cf.normalizar_registro("pagos", {"nombre": "AGUA", "fecha": "2025-3-5"})
+    assert x["fecha"] == "2025-03-05"
+
+
+def test_series_con_fechas_sin_ceros():
+    index = cf.LedgerIndex()
+    serie = cf.DailySeries(index)
+    index.rebuild([cf.Transaction({"uid": "1", "nombre": "LUZ", "monto": 10, "fecha": "2025-3-5"})], [])
+    assert serie.week_total("2025-03-05") == 10
+    assert serie.week_total("2025-3-5") == 10
+    assert serie.week_total("no es fecha") == 0.0
@@ -0,0 +1,116 @@
+import os
+
+import pytest
+
+cf = pytest.importorskip("calendariofinanzas")
+
+
+def cambio(op, tipo, uid, **data):
+    rec = {"op": op, "tipo": tipo, "uid": uid}
+    if op != "del":
+        rec["data"] = dict(data, uid=uid)
+    return rec
+
+
+def test_espejo_sigue_los_cambios():
+    espejo = cf.LedgerEspejo()
+    espejo.reset([{"uid": "a", "nombre": "A", "fecha": "2025-01-05"}, {"uid": "b", "nombre": "B", "fecha": "2025-02-05"}],
+                 [{"uid": "c", "item": "C", "fecha": "2025-01-07"}])
+    espejo.aplicar([
+        cambio("upd", "pago", "a", nombre="A2", fecha="2025-03-01"),
+        cambio("add", "pago", "d", nombre="D", fecha="2025-01-09"),
+        cambio("del", "compra", "c"),
+    ])
+    pagos, compras = espejo.listas()
+    assert [x["uid"] for x in pagos] == ["a", "b", "d"] and pagos[0]["nombre"] == "A2"
+    assert compras == []
+    bloques = espejo.bloques()
+    assert sorted(bloques) == ["pago:2025-01", "pago:2025-02", "pago:2025-03"]
+    assert espejo.bloques({"pago:2025-01", "compra:2025-01"}) == {"pago:2025-01": [pagos[2]]}
+
+
+def test_fundir_con_base_descarta_lo_anterior():
+    a = {"base": None, "reescribir": False, "cambios": [1], "bloques": {"pago:2025-01"}, "numero": 3}
+    b = {"base": ([], []), "reescribir": True, "cambios": [2], "bloques": None, "numero": 4}
+    c = {"base": None, "reescribir": False, "cambios": [3], "bloques": {"compra:2025-02"}, "numero": 0}
+    junto = cf.fundir_guardados(cf.fundir_guardados(a, b), c)
+    assert junto == {"base": ([], []), "reescribir": True, "cambios": [2, 3], "bloques": None, "numero": 4}
+
+
+def test_sqlite_no_aplica_cambios_detras_de_una_reescritura(tmp_path):
+    store = cf.SqliteLedgerStore(str(tmp_path / "finanzas_v4.db"))
+    index = cf.LedgerIndex()
+    store.respaldo = index
+    assert store.stage([cambio("add", "pago", "a", nombre="A", monto=5, fecha="2025-01-05")])
+    assert store.month_total("2025-01") == 5
+
+    numero = store.reservar()
+    assert store.desfasada() and not store.stage([cambio("del", "pago", "a")])
+    # Mientras tanto las consultas salen del índice en memoria
+    assert store.month_total("2025-01") == index.month_total("2025-01") == 0
+    assert store.month_by_cat("2025-01", "PAID") == index.month_by_cat("2025-01", "PAID") == {}
+
+    store.save([{"uid": "x", "nombre": "X", "monto": 2, "fecha": "2025-01-01"}], [], None)
+    store.confirmar(numero)
+    assert not store.desfasada()
+    assert store.month_total("2025-01") == 2
+    assert store.bloques() == {"pago:2025-01": [{"uid": "x", "nombre": "X", "monto": 2, "fecha": "2025-01-01"}]}
+
+
+def app_sin_ventana(tmp_path, modo="json"):
+    """PagoApp sin Tk: solo lo que usan la carga y el guardado."""
+    base = str(tmp_path)
+    app = object.__new__(cf.PagoApp)
+    app.__dict__.update(
+        base_path=base, ruta_datos=os.path.join(base, "finanzas_v4.json"), ruta_db=os.path.join(base, "finanzas_v4.db"),
+        ruta_particiones=os.path.join(base, "finanzas_v4"), ruta_archivo=os.path.join(base, "finanzas_v4.archivo"),
+        backup_dir=os.path.join(base, "backups"), storage_mode=modo, columnar_ledger=False,
+        anio_vis=2025, mes_vis=3, _avisos_carga=[], _carga_pendiente=None, _meses_cargados=None,
+        _cambios_pendientes=[], _meses_sucios=None, _base_guardado=None, _espejo=cf.LedgerEspejo(),
+        _guardado_after=None, archivo=None, _busqueda_archivo=None, _last_month=None,
+        after=lambda ms, fn, *a: "after", after_cancel=lambda ident: None,
+    )
+    app.index = cf.LedgerIndex()
+    app.series = cf.DailySeries(app.index)
+    app.recurrentes = cf.RecurringRules()
+    app.ahorros = cf.SavingsTracker(app.index, [])
+    app.control_budgets = cf.BudgetTracker(app.index, lambda ym: {}, app.recurrentes)
+    app.backups = cf.BackupStore(app.backup_dir)
+    app.persistencia = cf.WriteBehind(app._escribir_guardado, ventana=0.01)
+    return app
+
+
+def test_abrir_sin_cambios_no_reescribe_el_ledger(tmp_path):
+    ruta = tmp_path / "finanzas_v4.json"
+    # Formato a mano (sin normalizar): una reescritura lo cambiaría
+    ruta.write_text('{"pagos": [{"uid": "a", "nombre": "LUZ", "monto": 5, "fecha": "2025-03-05"}],\n'
+                    ' "compras": []}', encoding="utf-8")
+    os.utime(ruta, (1_000_000, 1_000_000))
+    original = ruta.read_bytes()
+
+    app = app_sin_ventana(tmp_path)
+    app.cargar_datos()
+    assert app.persistencia.flush(5)
+    assert ruta.read_bytes() == original and os.path.getmtime(ruta) == 1_000_000
+
+    # Un trabajo solo de backup tampoco lo toca, y el backup ve el ledger cargado
+    app.auto_backup(silent=True)
+    assert ruta.read_bytes() == original
+    (nombre, _), = app.backups.points()
+    assert [x["uid"] for x in app.backups.restore(nombre)[0]] == ["a"]
+
+    # La primera edición sí lo escribe, con el ledger completo
+    app.agregar_registro("pago", {"nombre": "AGUA", "monto": 3, "fecha": "2025-03-06"})
+    app.guardar_datos()
+    app._vaciar_guardados()
+    assert app.persistencia.flush(5) and app.persistencia.ultimo_error is None
+    assert len(cf.leer_ledger(str(ruta))[0]) == 2
+
+
+def test_abrir_completa_los_uid_que_faltan(tmp_path):
+    ruta = tmp_path / "finanzas_v4.json"
+    ruta.write_text('{"pagos": [{"nombre": "LUZ", "monto": 5, "fecha": "2025-03-05"}], "compras": []}', encoding="utf-8")
+    app = app_sin_ventana(tmp_path)
+    app.cargar_datos()
+    assert app.persistencia.flush(5)
+    assert cf.leer_ledger(str(ruta))[0][0]["uid"] == app.pagos[0]["uid"]
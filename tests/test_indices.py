@@ -0,0 +1,72 @@
+import pytest
+
+cf = pytest.importorskip("calendariofinanzas")
+
+
+def pago(uid, fecha, status="PENDING"):
+    return cf.Transaction({"uid": uid, "nombre": f"PAGO {uid}", "monto": 1, "fecha": fecha, "status": status})
+
+
+def test_due_index_altas_progresivas_y_ediciones():
+    index = cf.LedgerIndex()
+    due = cf.DueIndex(index)
+    for i in range(30, 0, -1):
+        index.add("pago", pago(str(i), f"2025-01-{i:02d}", "PAID" if i % 5 == 0 else "PENDING"))
+    assert len(due) == 24
+    hoy = cf._ordinal_fecha("2025-01-10")
+    assert [x["uid"] for x in due.vencidos(hoy)] == ["1", "2", "3", "4", "6", "7", "8", "9"]
+
+    x = index.get("3")
+    x["fecha"] = "2025-1-20"
+    index.update(x)
+    index.add("pago", pago("n", "2025-01-11"))
+    index.remove(index.get("1"))
+    assert [x["uid"] for x in due.siguientes(hoy, 4)] == ["11", "n", "12", "13"]
+    assert [x["uid"] for x in due.rango(hoy + 10, hoy + 10)] == ["3"]
+
+
+def test_budget_solo_pendiente_y_sin_ahorro():
+    index = cf.LedgerIndex()
+    avisos = []
+    control = cf.BudgetTracker(index, lambda ym: {"FOOD": 100.0, "SAVINGS": 50.0})
+    control.subscribe(lambda *a: avisos.append(a[:3]))
+
+    def compra(uid, monto, cat="FOOD", status="PENDING"):
+        return cf.Transaction({"uid": uid, "item": uid, "monto": monto, "fecha": "2025-05-10",
+                               "categoria": cat, "status": status})
+
+    index.add("compra", compra("pagada", 90.0, status="PAID"))
+    index.add("compra", compra("ahorro", 60.0, cat="SAVINGS"))
+    index.add("compra", compra("a", 75.0))
+    assert avisos == [("2025-05", "FOOD", 0.7)]
+    assert control.por_categoria("2025-05") == {"FOOD": 75.0}
+    assert control.uso("2025-05")[1] == 0.75
+
+    # Pagarla la saca del budget
+    a = index.get("a")
+    a["status"] = "PAID"
+    index.update(a)
+    assert control.gastado("2025-05", "FOOD") == 0.0
+
+
+def test_repo_sqlite_y_ledger_index_dan_los_mismos_totales(tmp_path):
+    registros = [("pago" if i % 2 else "compra",
+                  {"uid": f"r{i}", "nombre": f"R{i}", "monto": i + 0.5, "fecha": f"2025-0{i % 3 + 1}-{i % 28 + 1:02d}",
+                   "categoria": ("FOOD", "RENT", None)[i % 3], "status": ("PENDING", "PAID", "OVERDUE", None)[i % 4]})
+                 for i in range(40)]
+    for _, x in registros:
+        for campo in ("categoria", "status"):
+            if x[campo] is None:
+                del x[campo]
+    index = cf.LedgerIndex()
+    index.rebuild([cf.Transaction(x) for t, x in registros if t == "pago"],
+                  [cf.Transaction(x) for t, x in registros if t == "compra"])
+    sqlite = cf.SqliteLedgerStore(str(tmp_path / "finanzas_v4.db"))
+    sqlite.save([x for t, x in registros if t == "pago"], [x for t, x in registros if t == "compra"], None)
+
+    for repo in (sqlite, cf.RecurringRepo(sqlite, cf.RecurringRules())):
+        for ym in ("2025-01", "2025-02", "2025-03", "2025-04"):
+            for status in (None, "PENDING", "PAID", "OVERDUE"):
+                assert repo.month_total(ym, status) == pytest.approx(index.month_total(ym, status))
+                assert repo.month_by_cat(ym, status) == pytest.approx(index.month_by_cat(ym, status))
+            assert repo.month_total(ym) == pytest.approx(index.month_total(ym))
@@ -0,0 +1,82 @@
+import pytest
+
+cf = pytest.importorskip("calendariofinanzas")
+
+
+def cambio(op, tipo, uid, **data):
+    rec = {"op": op, "tipo": tipo, "uid": uid}
+    if op != "del":
+        rec["data"] = dict(data, uid=uid)
+    return rec
+
+
+CAMBIOS = [
+    cambio("add", "pago", "a", nombre="LUZ", monto=10, fecha="2025-01-05"),
+    cambio("add", "compra", "b", item="PAN", monto=2, fecha="2025-01-06"),
+    cambio("add", "pago", "c", nombre="AGUA", monto=7, fecha="2025-01-07"),
+    cambio("upd", "pago", "a", nombre="LUZ", monto=12, fecha="2025-01-05", status="PAID"),
+    cambio("del", "pago", "c"),
+    cambio("reset", None, None),
+    cambio("add", "pago", "d", nombre="GAS", monto=3, fecha="2025-02-01"),
+    cambio("add", "compra", "e", item="LECHE", monto=1, fecha="2025-02-02"),
+    cambio("upd", "compra", "e", item="LECHE", monto=1.5, fecha="2025-02-02"),
+    cambio("add", "pago", "f", nombre="WIFI", monto=20, fecha="2025-02-03"),
+    cambio("del", "pago", "f"),
+]
+
+
+def journal(tmp_path):
+    return cf.JournalLedgerStore(str(tmp_path / "finanzas_v4.json"))
+
+
+def journal_completo(tmp_path):
+    store = cf.JournalLedgerStore(str(tmp_path / "completo" / "finanzas_v4.json"))
+    (tmp_path / "completo").mkdir(exist_ok=True)
+    store.save(None, None, CAMBIOS)
+    return store.load()
+
+
+def test_replay_del_diario(tmp_path):
+    store = journal(tmp_path)
+    store.save(None, None, CAMBIOS)
+    pagos, compras = store.load()
+    assert pagos == [{"uid": "d", "nombre": "GAS", "monto": 3, "fecha": "2025-02-01"}]
+    assert compras == [{"uid": "e", "item": "LECHE", "monto": 1.5, "fecha": "2025-02-02"}]
+
+
+@pytest.mark.parametrize("corte", range(len(CAMBIOS) + 1))
+def test_corte_entre_snapshot_y_vaciado_del_diario(tmp_path, corte):
+    store = journal(tmp_path)
+    store.save(None, None, CAMBIOS[:corte])
+    esperado = store.load()
+
+    # compact() escribe el snapshot y muere antes de vaciar el diario
+    pagos, compras = esperado
+    cf.escribir_json_atomico(store.ruta, {"pagos": pagos, "compras": compras})
+    assert journal(tmp_path).load() == esperado
+
+    # Y lo que llegue después se sigue aplicando encima
+    store.save(None, None, CAMBIOS[corte:])
+    assert journal(tmp_path).load() == journal_completo(tmp_path)
+
+
+def test_linea_a_medio_escribir(tmp_path):
+    store = journal(tmp_path)
+    store.save(None, None, CAMBIOS[:2])
+    with open(store.ruta_journal, "a", encoding="utf-8") as f:
+        f.write('{"op":"add","tipo":"pago","uid":"x","da')
+    assert len(journal(tmp_path).load()[0]) == 1
+
+    # El siguiente guardado aísla el resto roto y no pierde su línea
+    store.save(None, None, CAMBIOS[2:3])
+    assert [x["uid"] for x in journal(tmp_path).load()[0]] == ["a", "c"]
+
+
+def test_lineas_que_no_son_un_cambio(tmp_path):
+    store = journal(tmp_path)
+    store.save(None, None, CAMBIOS[:2])
+    with open(store.ruta_journal, "a", encoding="utf-8") as f:
+        f.write('[]\n"x"\n3\nnull\n{"op":"add","tipo":"pago","uid":"z","data":[1]}\n')
+    store.save(None, None, CAMBIOS[2:3])
+    pagos, compras = journal(tmp_path).load()
+    assert [x["uid"] for x in pagos] == ["a", "c"] and [x["uid"] for x in compras] == ["b"]
@@ -0,0 +1,86 @@
+import json
+import os
+
+import pytest
+
+cf = pytest.importorskip("calendariofinanzas")
+
+
+def ledger():
+    pagos = [{"uid": f"p{i}", "nombre": f"PAGO {i}", "monto": i, "fecha": f"2025-0{i % 4 + 1}-{i % 28 + 1:02d}"}
+             for i in range(20)]
+    pagos.append({"uid": "raro", "nombre": "SIN FECHA", "monto": 1, "fecha": ""})
+    compras = [{"uid": f"c{i}", "item": f"COMPRA {i}", "monto": i, "fecha": f"2025-0{i % 2 + 1}-15"} for i in range(6)]
+    return pagos, compras
+
+
+def por_uid(registros, lista=None):
+    # lista: normalizar como al cargar (campos por defecto)
+    if lista:
+        registros = [cf.normalizar_registro(lista, dict(x)) for x in registros]
+    return sorted(registros, key=lambda x: x["uid"])
+
+
+def test_ida_y_vuelta(tmp_path):
+    store = cf.PartitionedLedgerStore(str(tmp_path / "finanzas_v4"))
+    pagos, compras = ledger()
+    store.save(pagos, compras, None)
+    assert store.meses() == ["2025-01", "2025-02", "2025-03", "2025-04", "otros"]
+
+    releido = cf.PartitionedLedgerStore(store.ruta)
+    p, c = releido.load()
+    assert por_uid(p) == por_uid(pagos, "pagos") and por_uid(c) == por_uid(compras, "compras")
+    p, c = releido.load_months(["2025-02", "2025-09"])
+    assert {x["fecha"][:7] for x in p + c} == {"2025-02"}
+
+
+def test_guardado_solo_reescribe_los_meses_tocados(tmp_path):
+    store = cf.PartitionedLedgerStore(str(tmp_path / "finanzas_v4"))
+    pagos, compras = ledger()
+    store.save(pagos, compras, None)
+    for p in store.meses():
+        os.utime(store._archivo(p), (1_000_000, 1_000_000))
+
+    movido = dict(pagos[0], fecha="2025-03-02")  # de enero a marzo
+    store.save(None, None, [
+        {"op": "upd", "tipo": "pago", "uid": "p0", "data": movido},
+        {"op": "add", "tipo": "compra", "uid": "nueva", "data": {"uid": "nueva", "item": "PAN", "fecha": "2025-03-03"}},
+        {"op": "del", "tipo": "pago", "uid": "raro"},
+    ])
+
+    tocados = {p for p in store.meses() if os.path.getmtime(store._archivo(p)) != 1_000_000}
+    assert tocados == {"2025-01", "2025-03"}
+    # La partición que se queda vacía desaparece
+    assert "otros" not in store.meses()
+
+    p, c = cf.PartitionedLedgerStore(store.ruta).load()
+    assert next(x for x in p if x["uid"] == "p0")["fecha"] == "2025-03-02"
+    assert "nueva" in {x["uid"] for x in c} and "raro" not in {x["uid"] for x in p}
+
+
+def test_migrate_partitions(tmp_path, monkeypatch, capsys):
+    pagos, compras = ledger()
+    del pagos[1]["uid"]
+    (tmp_path / "finanzas_v4.json").write_text(json.dumps({"pagos": pagos, "compras": compras}), encoding="utf-8")
+    monkeypatch.setattr(cf, "app_base_path", lambda: str(tmp_path))
+
+    assert cf.main(["--migrate-partitions"]) == 0
+    assert "27 registros repartidos en 5 meses" in capsys.readouterr().out
+    assert json.loads((tmp_path / "config.json").read_text(encoding="utf-8"))["storage_mode"] == "particiones"
+
+    p, c = cf.PartitionedLedgerStore(str(tmp_path / "finanzas_v4")).load()
+    assert len(p) == len(pagos) and all(x.get("uid") for x in p)
+    assert por_uid(c) == por_uid(compras, "compras")
+
+
+@pytest.mark.parametrize("texto, esperado", [
+    ("luz", None),
+    ("fecha:2025-02", ["2025-02", "otros"]),
+    ("fecha:2025-02-10..2025-03-05", ["2025-02", "2025-03", "otros"]),
+    ("fecha:2025-03..", ["2025-03", "2025-04", "otros"]),
+    ("fecha:..2024", ["2024-12", "otros"]),
+    ("cat:FOOD fecha:2025", ["2025-01", "2025-02", "2025-03", "2025-04", "otros"]),
+])
+def test_busqueda_solo_abre_los_meses_del_rango(texto, esperado):
+    meses = ["2024-12", "2025-01", "2025-02", "2025-03", "2025-04", "otros"]
+    assert cf.parse_search_query(texto).particiones(meses) == esperado
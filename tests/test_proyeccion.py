@@ -0,0 +1,78 @@
+from datetime import date
+
+import pytest
+
+cf = pytest.importorskip("calendariofinanzas")
+
+
+@pytest.fixture(params=["numpy", "listas"])
+def proyeccion(request, monkeypatch):
+    if request.param == "numpy":
+        pytest.importorskip("numpy")
+        assert cf.numpy_disponible()
+    else:
+        # Sin numpy la proyección va con listas
+        monkeypatch.setattr(cf, "np", None)
+        monkeypatch.setattr(cf, "numpy_disponible", lambda: False)
+    index = cf.LedgerIndex()
+    series = cf.DailySeries(index)
+    return index, cf.CashFlowProjection(index, series)
+
+
+def test_cobros_en_el_dia_configurado():
+    assert [date.fromordinal(o).day for o in cf.cobros_mes(2025, 3)] == [7, 14, 21, 28]
+    assert [date.fromordinal(o).day for o in cf.cobros_mes(2025, 3, dia=0)] == [3, 10, 17, 24, 31]
+
+
+def test_saldo_inicial_se_lleva_al_primer_dia(proyeccion):
+    index, proy = proyeccion
+    index.rebuild([cf.Transaction({"uid": "a", "nombre": "LUZ", "monto": 30, "fecha": "2025-02-20", "status": "PAID"}),
+                   cf.Transaction({"uid": "b", "nombre": "AGUA", "monto": 10, "fecha": "2025-03-10"})], [])
+    tramos = cf.tramos_salario({"2020-01-01": 100.0})
+    hoy = date(2025, 3, 5).toordinal()
+
+    def proyectar(saldo_inicial, dia_cobro=cf.DIA_DE_COBRO):
+        return proy.proyectar(hoy, 1, tramos, lambda ym: {}, cf.RecurringRules(), 0,
+                              saldo_inicial=saldo_inicial, dia_cobro=dia_cobro)
+
+    # Sin saldo conocido se parte de 0: cuatro viernes cobrados menos el pendiente
+    base, saldo = proyectar(None)
+    assert base == date(2025, 3, 1).toordinal() and saldo[-1] == 400 - 10
+
+    # 1000 el 15 de febrero: + dos cobros (21 y 28) - lo pagado el 20 -> 1170 el día 1
+    base, saldo = proyectar((1000.0, date(2025, 2, 15).toordinal()))
+    assert saldo[0] == 1170 and saldo[-1] == 1170 + 400 - 10
+
+    # 500 al empezar el día 8 (el viernes 7 ya cobrado): el día 1 había 400
+    base, saldo = proyectar((500.0, date(2025, 3, 8).toordinal()))
+    assert saldo[6] == 500 and saldo[0] == 400
+
+    # Cobrando los lunes hay cinco cobros en marzo de 2025
+    base, saldo = proyectar(None, dia_cobro=0)
+    assert saldo[-1] == 500 - 10
+
+
+def test_ahorro_no_es_salida(proyeccion):
+    index, proy = proyeccion
+    index.rebuild([cf.Transaction({"uid": "a", "nombre": "AGUA", "monto": 10, "fecha": "2025-03-10"})], [
+        cf.Transaction({"uid": "s1", "item": "HUCHA", "monto": 50, "fecha": "2025-02-20", "categoria": "SAVINGS",
+                        "status": "PAID"}),
+        cf.Transaction({"uid": "s2", "item": "HUCHA", "monto": 70, "fecha": "2025-03-12", "categoria": "SAVINGS"}),
+        cf.Transaction({"uid": "s3", "item": "HUCHA", "monto": 5, "fecha": "2025-01-12", "categoria": "SAVINGS"}),
+    ])
+    reglas = cf.RecurringRules([{"id": "r", "nombre": "AHORRO", "monto": 20, "inicio": "2025-03-01",
+                                 "freq": "monthly", "dia": 15, "categoria": "SAVINGS"}])
+    hoy = date(2025, 3, 5).toordinal()
+    base, saldo = proy.proyectar(hoy, 1, cf.tramos_salario({"2020-01-01": 100.0}),
+                                 lambda ym: {"SAVINGS": 300.0, "FOOD": 31.0}, reglas, 0,
+                                 saldo_inicial=(1000.0, date(2025, 2, 15).toordinal()))
+    # Sin SAVINGS: 1000 + 200 de febrero, + 400 de marzo, - 10 de agua - el budget FOOD
+    assert saldo[0] == 1200 and saldo[-1] == pytest.approx(1200 + 400 - 10 - 31)
+
+    # Una edición recalcula solo el mes tocado y sigue sin contar el ahorro
+    x = index.get("s2")
+    x["monto"] = 700
+    index.update(x)
+    assert proy.proyectar(hoy, 1, cf.tramos_salario({"2020-01-01": 100.0}),
+                          lambda ym: {"SAVINGS": 300.0, "FOOD": 31.0}, reglas, 0,
+                          saldo_inicial=(1000.0, date(2025, 2, 15).toordinal()))[1][-1] == pytest.approx(1559)
@@ -0,0 +1,66 @@
+import pytest
+
+cf = pytest.importorskip("calendariofinanzas")
+
+
+def regla(**kw):
+    return dict({"id": "r", "nombre": "ALQUILER", "monto": 500, "inicio": "2024-01-31", "freq": "monthly"}, **kw)
+
+
+@pytest.mark.parametrize("ym, esperado", [
+    ("2024-01", ["2024-01-31"]),
+    ("2024-02", ["2024-02-29"]),  # bisiesto
+    ("2025-02", ["2025-02-28"]),
+    ("2024-04", ["2024-04-30"]),
+    ("2023-12", []),              # antes de inicio
+])
+def test_dia_31_se_recorta_al_ultimo_del_mes(ym, esperado):
+    assert cf.fechas_regla(regla(), ym) == esperado
+
+
+def test_intervalo_mensual():
+    r = regla(inicio="2024-01-10", intervalo=3)
+    meses = [f"2024-{m:02d}" for m in range(1, 13)]
+    assert [f for ym in meses for f in cf.fechas_regla(r, ym)] == ["2024-01-10", "2024-04-10", "2024-07-10", "2024-10-10"]
+    # `dia` manda sobre el día de inicio
+    assert cf.fechas_regla(regla(inicio="2024-01-10", dia=25), "2024-02") == ["2024-02-25"]
+
+
+def test_intervalo_semanal_cruza_meses():
+    r = regla(inicio="2024-01-29", freq="weekly", intervalo=2)  # lunes
+    assert cf.fechas_regla(r, "2024-01") == ["2024-01-29"]
+    assert cf.fechas_regla(r, "2024-02") == ["2024-02-12", "2024-02-26"]
+    assert cf.fechas_regla(r, "2024-03") == ["2024-03-11", "2024-03-25"]
+    assert cf.fechas_regla(regla(inicio="2024-01-29", freq="weekly"), "2024-02")[:2] == ["2024-02-05", "2024-02-12"]
+
+
+def test_fin_es_inclusive():
+    assert cf.fechas_regla(regla(fin="2024-03-31"), "2024-03") == ["2024-03-31"]
+    assert cf.fechas_regla(regla(fin="2024-03-30"), "2024-03") == []
+    semanal = regla(inicio="2024-03-04", freq="weekly", fin="2024-03-18")
+    assert cf.fechas_regla(semanal, "2024-03") == ["2024-03-04", "2024-03-11", "2024-03-18"]
+
+
+def test_excepciones_ocultan_y_modifican_ocurrencias():
+    reglas = cf.RecurringRules([regla(inicio="2024-01-15")])
+    marzo, = reglas.ocurrencias("2024-03")
+    assert marzo["uid"] == "r@2024-03-15" and marzo["status"] == "PENDING"
+
+    reglas.excepcion(marzo, {"monto": 650, "status": "PAID", "notas": "se ignora"})
+    marzo, = reglas.ocurrencias("2024-03")
+    assert (marzo["monto"], marzo["status"]) == (650, "PAID") and "notas" not in marzo.to_dict()
+
+    # Movida a otro mes: sale de marzo y aparece en abril junto a la de abril
+    reglas.excepcion(marzo, {"fecha": "2024-04-02"})
+    assert reglas.ocurrencias("2024-03") == []
+    assert [x["uid"] for x in reglas.ocurrencias("2024-04")] == ["r@2024-03-15", "r@2024-04-15"]
+
+    reglas.borrar(reglas.ocurrencias("2024-04")[1])
+    assert [x["uid"] for x in reglas.ocurrencias("2024-04")] == ["r@2024-03-15"]
+    assert [x["uid"] for x in reglas.rango(cf._ordinal_fecha("2024-04-01"), cf._ordinal_fecha("2024-05-31"))] == [
+        "r@2024-03-15", "r@2024-05-15"]
+
+    # El repo solo añade las pendientes
+    repo = cf.RecurringRepo(cf.LedgerIndex(), reglas)
+    assert repo.month_total("2024-04") == 0 and repo.month_total("2024-04", "PAID") == 650
+    assert repo.month_total("2024-05") == 500